@@ -3,6 +3,7 @@ from multiprocessing import Process
 import tensorflow as tf
 import logging
 from logger_utils import variable_summaries
+from checkpointing import AsyncCheckpointer
 import os
 
 CHECKPOINT_INTERVAL = 1000000
@@ -33,8 +34,8 @@ class ActorLearner(Process):
         self.optimizer = tf.train.RMSPropOptimizer(self.learning_rate, decay=args.alpha, epsilon=args.e,
                                                    name=optimizer_variable_names)
 
-        self.emulators = np.asarray([environment_creator.create_environment(i)
-                                     for i in range(self.emulator_counts)])
+        # The emulators are created by the emulator runners, in parallel
+        self.environment_creator = environment_creator
         self.max_global_steps = args.max_global_steps
         self.gamma = args.gamma
         self.game = args.game
@@ -44,32 +45,19 @@ class ActorLearner(Process):
         grads_and_vars = self.optimizer.compute_gradients(self.network.loss)
 
         self.flat_raw_gradients = tf.concat([tf.reshape(g, [-1]) for g, v in grads_and_vars], axis=0)
+        self.gradient_variables = [v for g, v in grads_and_vars]
 
         # This is not really an operation, but a list of gradient Tensors.
         # When calling run() on it, the value of those Tensors
         # (i.e., of the gradients) will be calculated
-        if args.clip_norm_type == 'ignore':
-            # Unclipped gradients
-            global_norm = tf.global_norm([g for g, v in grads_and_vars], name='global_norm')
-        elif args.clip_norm_type == 'global':
-            # Clip network grads by network norm
-            gradients_n_norm = tf.clip_by_global_norm(
-                    [g for g, v in grads_and_vars], args.clip_norm)
-            global_norm = tf.identity(gradients_n_norm[1], name='global_norm')
-            grads_and_vars = list(zip(gradients_n_norm[0], [v for g, v in grads_and_vars]))
-        elif args.clip_norm_type == 'local':
-            # Clip layer grads by layer norm
-            gradients = [tf.clip_by_norm(
-                    g, args.clip_norm) for g in grads_and_vars]
-            grads_and_vars = list(zip(gradients, [v for g, v in grads_and_vars]))
-            global_norm = tf.global_norm([g for g, v in grads_and_vars], name='global_norm')
-        else:
-            raise Exception('Norm type not recognized')
+        grads_and_vars, global_norm = self._clip_gradients(grads_and_vars, args.clip_norm_type, args.clip_norm)
         self.flat_clipped_gradients = tf.concat([tf.reshape(g, [-1]) for g, v in grads_and_vars], axis=0)
 
         self.train_step = self.optimizer.apply_gradients(grads_and_vars)
 
-        config = tf.ConfigProto()
+        # 0 leaves the thread pool sizes to TensorFlow
+        config = tf.ConfigProto(intra_op_parallelism_threads=args.intra_op_threads,
+                                inter_op_parallelism_threads=args.inter_op_threads)
         if 'gpu' in self.device:
             logging.debug('Dynamic gpu mem allocation')
             config.gpu_options.allow_growth = True
@@ -80,17 +68,50 @@ class ActorLearner(Process):
 
         self.optimizer_variables = [var for var in tf.global_variables() if optimizer_variable_names in var.name]
         self.optimizer_saver = tf.train.Saver(self.optimizer_variables, max_to_keep=1, name='OptimizerSaver')
+        # Created in init_network, once the variables are initialized
+        self.network_checkpointer = None
+        self.optimizer_checkpointer = None
 
         # Summaries
         variable_summaries(self.flat_raw_gradients, 'raw_gradients')
         variable_summaries(self.flat_clipped_gradients, 'clipped_gradients')
         tf.summary.scalar('global_norm', global_norm)
 
+    @staticmethod
+    def _clip_gradients(grads_and_vars, clip_norm_type, clip_norm):
+        """
+        Clips the gradients as selected with --clip_norm_type.
+        :return: (clipped grads_and_vars, global norm) tuple
+        """
+        if clip_norm_type == 'ignore':
+            # Unclipped gradients
+            global_norm = tf.global_norm([g for g, v in grads_and_vars], name='global_norm')
+        elif clip_norm_type == 'global':
+            # Clip network grads by network norm
+            gradients_n_norm = tf.clip_by_global_norm(
+                    [g for g, v in grads_and_vars], clip_norm)
+            global_norm = tf.identity(gradients_n_norm[1], name='global_norm')
+            grads_and_vars = list(zip(gradients_n_norm[0], [v for g, v in grads_and_vars]))
+        elif clip_norm_type == 'local':
+            # Clip layer grads by layer norm
+            gradients = [tf.clip_by_norm(
+                    g, clip_norm) for g, v in grads_and_vars]
+            grads_and_vars = list(zip(gradients, [v for g, v in grads_and_vars]))
+            global_norm = tf.global_norm([g for g, v in grads_and_vars], name='global_norm')
+        else:
+            raise Exception('Norm type not recognized')
+        return grads_and_vars, global_norm
+
     def save_vars(self, force=False):
+        """
+        Snapshots the network and optimizer variables; the checkpoints are written in the background.
+        """
+        if self.network_checkpointer is None:
+            return
         if force or self.global_step - self.last_saving_step >= CHECKPOINT_INTERVAL:
             self.last_saving_step = self.global_step
-            self.network_saver.save(self.session, self.network_checkpoint_folder, global_step=self.last_saving_step)
-            self.optimizer_saver.save(self.session, self.optimizer_checkpoint_folder, global_step=self.last_saving_step)
+            self.network_checkpointer.save(self.network_checkpoint_folder, self.last_saving_step)
+            self.optimizer_checkpointer.save(self.optimizer_checkpoint_folder, self.last_saving_step)
 
     def rescale_reward(self, reward):
         """ Clip immediate reward """
@@ -116,6 +137,9 @@ class ActorLearner(Process):
             logging.info('Restoring optimizer variables from previous run')
             self.optimizer_saver.restore(self.session, path)
 
+        self.network_checkpointer = AsyncCheckpointer(self.session, tf.global_variables())
+        self.optimizer_checkpointer = AsyncCheckpointer(self.session, self.optimizer_variables, max_to_keep=1)
+
         return last_saving_step
 
     def get_lr(self):
@@ -126,4 +150,8 @@ class ActorLearner(Process):
 
     def cleanup(self):
         self.save_vars(True)
+        if self.network_checkpointer is not None:
+            self.network_checkpointer.close()
+            self.optimizer_checkpointer.close()
+            self.network_checkpointer = self.optimizer_checkpointer = None
         self.session.close()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    admission
+    Description  :    Learner-side flow control: staleness-based admission of rollouts and a rate
+                      limiter between the samples received from the actors and those trained on.
+"""
+
+import time
+from multiprocessing import Value
+
+
+class AdmissionController(object):
+    """
+    Decides what to do with a rollout given its policy lag, in learner updates, at the time the
+    learner picks it up: rollouts up to max_lag are admitted as they are; older ones are dropped,
+    or, with mode 'downweight', admitted with their samples weighted by max_lag / lag.
+    Rollouts without a parameter version (actors still on their initial parameters) are admitted.
+    """
+
+    def __init__(self, max_lag=0, mode='drop'):
+        if mode not in ('drop', 'downweight'):
+            raise Exception('Stale rollout mode not recognized')
+        self.max_lag = max_lag
+        self.mode = mode
+        self.admitted = 0
+        self.downweighted = 0
+        self.dropped = 0
+
+    def weight(self, lag):
+        """
+        :param lag: policy lag in learner updates, or None if unknown
+        :return: the sample weight of the rollout, 0 if it must be dropped
+        """
+        if self.max_lag <= 0 or lag is None or lag <= self.max_lag:
+            self.admitted += 1
+            return 1.0
+        if self.mode == 'drop':
+            self.dropped += 1
+            return 0.0
+        self.downweighted += 1
+        return self.max_lag / lag
+
+
+class RateLimiter(object):
+    """
+    Bounds how far the samples inserted (received from the actors) can run ahead of the samples
+    consumed (trained on or dropped) by the learner: an insert waits while
+        inserted * samples_per_insert - consumed > max_lead.
+    The counters live in shared memory, so inserts can be limited in the receiver process while
+    the learner process reports consumption. As the receiver only replies to an actor after the
+    insert, a waiting insert stalls the actor's sender, then its bounded send queue, then the actor.
+
+    max_lead must be at least one batch plus one rollout, otherwise the learner can never fill a
+    batch; 0 disables the limiter.
+    """
+
+    def __init__(self, samples_per_insert=1.0, max_lead=0):
+        self.samples_per_insert = samples_per_insert
+        self.max_lead = max_lead
+        self.inserted = Value('d', 0.0, lock=False)
+        self.consumed = Value('d', 0.0, lock=False)
+
+    @property
+    def enabled(self):
+        return self.max_lead > 0
+
+    def lead(self, samples=0):
+        return (self.inserted.value + samples) * self.samples_per_insert - self.consumed.value
+
+    def insert(self, samples, poll_interval=0.001):
+        """
+        Waits until the samples can be inserted, then counts them.
+        :return: seconds waited
+        """
+        start_time = time.time()
+        if self.enabled:
+            # An insert larger than the lead on its own is let through once nothing is outstanding
+            while self.lead(samples) > self.max_lead and self.lead() > 0:
+                time.sleep(poll_interval)
+        self.inserted.value += samples
+        return time.time() - start_time
+
+    def consume(self, samples):
+        self.consumed.value += samples
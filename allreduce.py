@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    allreduce
+    Description  :    Shared-memory all-reduce of flat gradient vectors between the learner processes
+                      of one host, for data-parallel training.
+"""
+
+import numpy as np
+from ctypes import c_float, c_longlong
+from multiprocessing.sharedctypes import RawArray, RawValue
+from multiprocessing import Barrier
+
+
+class SharedMemoryAllReduce(object):
+    """
+    Averages float32 vectors across world_size processes. Created before the processes are started
+    and passed to them.
+
+    Vectors are reduced in chunks of chunk_size. Every rank writes its chunk to its row of a shared
+    (world_size, chunk_size) buffer. After a barrier, rank r sums column slice r over all rows into
+    the shared result (reduce-scatter), and after a second barrier every rank copies the whole
+    result (all-gather). Each rank thus reads about 2 * chunk_size elements per chunk, whatever
+    world_size, like a ring all-reduce but without sockets. A rank reaching the next chunk waits at
+    its first barrier until every rank has read the previous result, so two barriers per chunk are
+    enough.
+    """
+
+    def __init__(self, world_size, chunk_size=2 ** 20, timeout=None):
+        self.world_size = world_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.buffer = RawArray(c_float, world_size * chunk_size)
+        self.result = RawArray(c_float, chunk_size)
+        self.step = RawValue(c_longlong, 0)
+        self.barrier = Barrier(world_size)
+
+    def _views(self):
+        return (np.frombuffer(self.buffer, dtype=np.float32).reshape(self.world_size, self.chunk_size),
+                np.frombuffer(self.result, dtype=np.float32))
+
+    def wait(self):
+        self.barrier.wait(self.timeout)
+
+    def allreduce(self, rank, vector):
+        """
+        :param vector: float32 vector of this rank, of the same length on every rank
+        :return: the mean of the vectors of all ranks
+        """
+        buffer, result = self._views()
+        vector = np.array(vector, dtype=np.float32)
+        for start in range(0, len(vector), self.chunk_size):
+            chunk = vector[start:start + self.chunk_size]
+            buffer[rank, :len(chunk)] = chunk
+            self.wait()
+            bounds = np.linspace(0, len(chunk), self.world_size + 1).astype(np.int64)
+            begin, end = bounds[rank], bounds[rank + 1]
+            np.sum(buffer[:, begin:end], axis=0, out=result[begin:end])
+            result[begin:end] /= self.world_size
+            self.wait()
+            chunk[:] = result[:len(chunk)]
+        return vector
+
+    def broadcast(self, rank, vector, step=0):
+        """
+        Rank 0's vector and step, e.g. the initial variables and global step, to every rank.
+        :param vector: float32 vector of the same length on every rank, only rank 0's is sent
+        :return: (vector, step)
+        """
+        buffer, result = self._views()
+        vector = np.array(vector, dtype=np.float32)
+        for start in range(0, len(vector), self.chunk_size):
+            chunk = vector[start:start + self.chunk_size]
+            # Every rank must have read the previous result before it is overwritten
+            self.wait()
+            if rank == 0:
+                result[:len(chunk)] = chunk
+                self.step.value = step
+            self.wait()
+            chunk[:] = result[:len(chunk)]
+        self.wait()
+        return vector, self.step.value
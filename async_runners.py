@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    async_runners
+    Description  :    Barrier-free emulator runners: every emulator is stepped as soon as its action is
+                      written, and reports back through a ready ring in shared memory, so inference
+                      batches whichever emulators are ready instead of waiting for the slowest one.
+"""
+
+import time
+import numpy as np
+import multiprocessing
+from multiprocessing import Process
+from multiprocessing.sharedctypes import RawArray, RawValue
+from ctypes import c_int64, c_uint8
+from runners import Runners
+from episode_statistics import EpisodeRecorder
+from placement import pin
+
+
+class ReadyRing(object):
+    """
+    Multi-producer, single-consumer ring of emulator indices in shared memory. Every index is in
+    the ring at most once (an emulator waits for its next action after publishing), so a capacity
+    of the number of emulators is enough. The semaphore counts the published indices.
+    """
+
+    def __init__(self, capacity, context=multiprocessing):
+        self.capacity = capacity
+        self.ring = RawArray(c_int64, capacity)
+        self.head = RawValue(c_int64, 0)
+        self.tail = RawValue(c_int64, 0)
+        self.lock = context.Lock()
+        self.available = context.Semaphore(0)
+
+    def put(self, index):
+        with self.lock:
+            self.ring[self.tail.value % self.capacity] = index
+            self.tail.value += 1
+        self.available.release()
+
+    def get_batch(self, max_batch, timeout):
+        """
+        Waits for a first ready index, then for more until max_batch are ready or timeout seconds
+        have passed since the first one.
+        :return: array of ready indices, oldest first
+        """
+        self.available.acquire()
+        count = 1
+        deadline = time.time() + timeout
+        while count < max_batch:
+            # Take what is already there without waiting, then wait until the deadline
+            if not self.available.acquire(block=False):
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.available.acquire(timeout=remaining):
+                    break
+            count += 1
+        with self.lock:
+            head = self.head.value
+            indices = np.array([self.ring[(head + i) % self.capacity] for i in range(count)], dtype=np.int64)
+            self.head.value = head + count
+        return indices
+
+
+class AsyncEmulatorRunner(Process):
+    """
+    Steps each of its emulators whenever the actor has written a new action for it (its pending
+    flag is set and the runner's semaphore released), then publishes the emulator in the ready ring.
+    """
+
+    def __init__(self, id, environment_creator, emulator_ids, variables, pending, semaphore, ready, stop,
+                 step_times, episode_buffers, cpus=None):
+        super(AsyncEmulatorRunner, self).__init__()
+        self.id = id
+        self.environment_creator = environment_creator
+        self.emulator_ids = emulator_ids
+        self.variables = variables
+        self.pending = pending
+        self.semaphore = semaphore
+        self.ready = ready
+        self.stop = stop
+        self.step_times = step_times
+        self.episode_buffers = episode_buffers
+        self.cpus = cpus
+
+    def run(self):
+        super(AsyncEmulatorRunner, self).run()
+        pin(self.cpus)
+        variables = [var.numpy() for var in self.variables]
+        pending = self.pending.numpy()
+        step_times = self.step_times.numpy()
+        episode_recorder = EpisodeRecorder(self.id, *[buffer.numpy() for buffer in self.episode_buffers])
+
+        emulators = [self.environment_creator.create_environment(i) for i in self.emulator_ids]
+        episode_rewards = np.zeros(len(emulators))
+        episode_steps = np.zeros(len(emulators), dtype=np.int64)
+        for i, emulator in enumerate(emulators):
+            variables[0][i] = emulator.get_initial_state()
+            self.ready.put(self.emulator_ids[i])
+
+        while True:
+            self.semaphore.acquire()
+            if self.stop.value:
+                break
+            start_time = time.perf_counter()
+            # A release may cover emulators already stepped after an earlier one: nothing is pending then
+            stepped = np.flatnonzero(pending)
+            for i in stepped:
+                pending[i] = 0
+                new_s, reward, episode_over = emulators[i].next(variables[-1][i])
+                episode_rewards[i] += reward
+                episode_steps[i] += 1
+                if episode_over:
+                    episode_recorder.record(episode_rewards[i], episode_steps[i])
+                    episode_rewards[i] = 0
+                    episode_steps[i] = 0
+                    variables[0][i] = emulators[i].get_initial_state()
+                else:
+                    variables[0][i] = new_s
+                variables[1][i] = reward
+                variables[2][i] = episode_over
+                self.ready.put(self.emulator_ids[i])
+            if len(stepped) > 0:
+                step_times[self.id] = time.perf_counter() - start_time
+
+
+class AsyncRunners(Runners):
+    """
+    Runners without a step barrier. The actor waits for a batch of ready emulators with
+    wait_ready(), computes their actions and hands them back with dispatch(); each emulator is
+    then stepped independently of the others. The shared state, reward, episode_over and action
+    arrays have the same layout as with Runners. The runners are processes.
+    """
+
+    def __init__(self, environment_creator, workers, variables, episode_capacity=100, worker_cpus=None,
+                 start_method=None):
+        emulator_counts = variables[0].shape[0]
+        per_worker = emulator_counts // workers
+        if per_worker * workers != emulator_counts:
+            raise Exception('The emulator workers must divide the amount of emulators')
+        self.pending_template = np.zeros(emulator_counts, dtype=np.uint8)
+        self.raw_pending = RawArray(c_uint8, emulator_counts)
+        self.pending = self._as_numpy(self.raw_pending, self.pending_template)
+        context = multiprocessing.get_context(start_method)
+        self.semaphores = [context.Semaphore(0) for _ in range(workers)]
+        self.ready = ReadyRing(emulator_counts, context)
+        self.stop_flag = RawValue(c_uint8, 0)
+        self.per_worker = per_worker
+        super(AsyncRunners, self).__init__(AsyncEmulatorRunner, environment_creator, workers, variables,
+                                           episode_capacity, worker_cpus, start_method)
+
+    def _create_runner(self, i, environment_creator, start, stop, vars, step_times, episode_vars, cpus):
+        pending = self._share(self.raw_pending, self.pending_template, start, stop)
+        return AsyncEmulatorRunner(i, environment_creator, range(start, stop), vars, pending, self.semaphores[i],
+                                   self.ready, self.stop_flag, step_times, episode_vars, cpus)
+
+    def start(self):
+        """ Starts the runners; their emulators become ready once created. """
+        self._start_runners()
+
+    def stop(self):
+        self.stop_flag.value = 1
+        for semaphore in self.semaphores:
+            semaphore.release()
+
+    def wait_ready(self, max_batch, timeout):
+        """
+        :return: indices of emulators whose new state, reward and episode_over are in the shared arrays
+        """
+        return self.ready.get_batch(max_batch, timeout)
+
+    def dispatch(self, indices):
+        """ Hands the emulators back to their runners once their actions are in the shared action array. """
+        self.pending[indices] = 1
+        for i in indices:
+            self.semaphores[i // self.per_worker].release()
+
+
+class SegmentBuffer(object):
+    """
+    Per-emulator trajectories of an asynchronous actor, cut into segments of `steps` transitions
+    that are batched into rollouts with the layout of the synchronous actor: states (steps + 1, N, ...),
+    rewards, masks, actions and values (steps, N) and behaviour policies (steps, N, num_actions).
+    """
+
+    def __init__(self, emulator_counts, steps, state_shape, num_actions):
+        self.steps = steps
+        self.states = np.zeros((emulator_counts, steps + 1) + tuple(state_shape), dtype=np.uint8)
+        self.rewards = np.zeros((emulator_counts, steps), dtype=np.float32)
+        self.masks = np.zeros((emulator_counts, steps), dtype=np.float32)
+        self.actions = np.zeros((emulator_counts, steps), dtype=np.uint8)
+        self.values = np.zeros((emulator_counts, steps), dtype=np.float32)
+        self.policies = np.zeros((emulator_counts, steps, num_actions), dtype=np.float32)
+        self.positions = np.zeros(emulator_counts, dtype=np.int64)
+        self.in_flight = np.zeros(emulator_counts, dtype=bool)
+        self.started = np.zeros(emulator_counts, dtype=np.float64)
+        self.completed = []
+
+    def finish_steps(self, indices, rewards, episode_over, next_states):
+        """
+        Records the outcome of the actions in flight for the emulators `indices`, completing their
+        segment when it has `steps` transitions.
+        """
+        in_flight = self.in_flight[indices]
+        indices, rewards, episode_over, next_states = (indices[in_flight], rewards[in_flight],
+                                                       episode_over[in_flight], next_states[in_flight])
+        positions = self.positions[indices] - 1
+        self.rewards[indices, positions] = rewards
+        self.masks[indices, positions] = 1.0 - episode_over
+        self.in_flight[indices] = False
+
+        full = positions + 1 == self.steps
+        done = indices[full]
+        if len(done) > 0:
+            self.states[done, self.steps] = next_states[full]
+            for e in done:
+                self.completed.append((self.states[e].copy(), self.rewards[e].copy(), self.masks[e].copy(),
+                                       self.actions[e].copy(), self.values[e].copy(), self.policies[e].copy(),
+                                       self.started[e]))
+            self.positions[done] = 0
+
+    def start_steps(self, indices, states, actions, values, policies):
+        """ Records the states the emulators `indices` act from, and their actions, values and policies. """
+        positions = self.positions[indices]
+        self.started[indices[positions == 0]] = time.time()
+        self.states[indices, positions] = states
+        self.actions[indices, positions] = actions
+        self.values[indices, positions] = values
+        self.policies[indices, positions] = policies
+        self.positions[indices] = positions + 1
+        self.in_flight[indices] = True
+
+    def pop_rollout(self, segments):
+        """
+        :return: (arrays, created) of a rollout made of the `segments` oldest completed segments,
+                 created being when its oldest segment started, or None if there are not enough
+        """
+        if len(self.completed) < segments:
+            return None
+        batch, self.completed = self.completed[:segments], self.completed[segments:]
+        arrays = [np.stack(parts, axis=1) for parts in list(zip(*batch))[:6]]
+        return arrays, min(segment[6] for segment in batch)
@@ -12,6 +12,15 @@ MAX_START_WAIT = 30
 FRAMES_IN_POOL = 2
 
 
+def process_frame_pool(frame_pool):
+    """ Preprocess frame pool """
+
+    img = np.amax(frame_pool, axis=0)
+    img = imresize(img, (84, 84), interp='nearest')
+    img = img.astype(np.uint8)
+    return img
+
+
 class AtariEmulator(BaseEnvironment):
     def __init__(self, actor_id, args):
         self.ale = ALEInterface()
@@ -29,6 +38,7 @@ class AtariEmulator(BaseEnvironment):
         self.lives = self.ale.lives()
 
         self.random_start = args.random_start
+        self.max_start_wait = args.max_start_wait
         self.single_life_episodes = args.single_life_episodes
         self.call_on_new_frame = args.visualize
 
@@ -38,7 +48,7 @@ class AtariEmulator(BaseEnvironment):
         self.rgb_screen = np.zeros((self.screen_height, self.screen_width, 3), dtype=np.uint8)
         self.gray_screen = np.zeros((self.screen_height, self.screen_width,1), dtype=np.uint8)
         self.frame_pool = FramePool(np.empty((2, self.screen_height,self.screen_width), dtype=np.uint8),
-                                    self.__process_frame_pool)
+                                    process_frame_pool)
 
     def get_legal_actions(self):
         return self.legal_actions
@@ -62,19 +72,11 @@ class AtariEmulator(BaseEnvironment):
         self.ale.reset_game()
         self.lives = self.ale.lives()
         if self.random_start:
-            wait = random.randint(0, MAX_START_WAIT)
+            wait = random.randint(0, self.max_start_wait)
             for _ in range(wait):
                 self.ale.act(self.legal_actions[0])
 
-    def __process_frame_pool(self, frame_pool):
-        """ Preprocess frame pool """
-        
-        img = np.amax(frame_pool, axis=0)
-        img = imresize(img, (84, 84), interp='nearest')
-        img = img.astype(np.uint8)
-        return img
-
-    def __action_repeat(self, a, times=ACTION_REPEAT):
+    def _action_repeat(self, a, times=ACTION_REPEAT):
         """ Repeat action and grab screen into frame pool """
         reward = 0
         for i in range(times - FRAMES_IN_POOL):
@@ -89,7 +91,7 @@ class AtariEmulator(BaseEnvironment):
         """ Get the initial state """
         self.__new_game()
         for step in range(NR_IMAGES):
-            _ = self.__action_repeat(0)
+            _ = self._action_repeat(0)
             self.observation_pool.new_observation(self.frame_pool.get_processed_frame())
         if self.__is_terminal():
             raise Exception('This should never happen.')
@@ -98,7 +100,7 @@ class AtariEmulator(BaseEnvironment):
     def next(self, action):
         """ Get the next state, reward, and game over signal """
 
-        reward = self.__action_repeat(np.argmax(action))
+        reward = self._action_repeat(np.argmax(action))
         self.observation_pool.new_observation(self.frame_pool.get_processed_frame())
         terminal = self.__is_terminal()
         self.lives = self.ale.lives()
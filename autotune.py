@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    autotune
+    Description  :    Searches emulator_counts, emulator_workers and max_local_steps for the highest
+                      actor steps/s on this host, and writes the best configuration to args.json.
+
+    Every trial runs the actor loop (inference, action copy, emulator steps, rollout buffers) in a
+    fresh process for a fixed time, with the network initialized at random. Options after -- are
+    passed to train.py's parser, e.g.
+        python3 autotune.py -df logs/pong/ --emulator_counts 16 32 64 --emulator_workers 4 8 16 -- -g pong
+        python3 train.py --config logs/pong/args.json
+"""
+
+import argparse, itertools, json, logging, os, queue, sys, time
+from multiprocessing import get_context
+import numpy as np
+
+
+def run_trial(args, seconds, warmup_rollouts=2):
+    """
+    Runs the actor loop of PAACLearner.train, without sending the rollouts, for about `seconds`.
+    :return: dict with the steps/s and the split of the time between inference (including action
+             sampling), emulation (the slowest worker of every step), synchronization (the rest of
+             the barrier wait) and the rest of the loop, as fractions of the elapsed time
+    """
+    import tensorflow as tf
+    from train import get_network_and_environment_creator
+    from inference import create_policy
+    from profiler import StageProfiler
+    from runners import get_runners_backend
+
+    network_creator, env_creator = get_network_and_environment_creator(args)
+    network = network_creator()
+    config = tf.ConfigProto(intra_op_parallelism_threads=args.intra_op_threads,
+                            inter_op_parallelism_threads=args.inter_op_threads)
+    session = tf.Session(config=config)
+    session.run(tf.global_variables_initializer())
+    policy = create_policy(args, network, session, tf.train.Saver())
+
+    variables = [(np.zeros((args.emulator_counts, 84, 84, 4), dtype=np.uint8)),
+                 (np.zeros(args.emulator_counts, dtype=np.float32)),
+                 (np.asarray([False] * args.emulator_counts, dtype=np.float32)),
+                 (np.zeros((args.emulator_counts, args.num_actions), dtype=np.float32))]
+    runners_class, emulator_runner_class = get_runners_backend(args.runner_backend)
+    runners = runners_class(emulator_runner_class, env_creator, args.emulator_workers, variables,
+                            start_method=args.worker_start_method)
+    runners.start()
+    try:
+        shared_states, _, _, shared_actions = runners.get_shared_variables()
+        step_times = runners.get_step_times()
+        eye = np.eye(args.num_actions, dtype=np.float32)
+
+        profiler = StageProfiler()
+        rollouts, start_time = 0, None
+        while start_time is None or time.time() - start_time < seconds:
+            if rollouts == warmup_rollouts:
+                profiler = StageProfiler()
+                start_time = time.time()
+            states = np.empty([args.max_local_steps + 1] + list(shared_states.shape), dtype=np.uint8)
+            for t in range(args.max_local_steps):
+                action_indices, _, _ = policy.choose_actions(shared_states, profiler)
+                with profiler.stage('action_copy'):
+                    shared_actions[:] = eye[action_indices]
+                    states[t] = shared_states
+                with profiler.stage('barrier_wait'):
+                    runners.update_environments()
+                    runners.wait_updated()
+                profiler.record('emulation', float(step_times.max()))
+            states[-1] = shared_states
+            rollouts += 1
+        elapsed = time.time() - start_time
+    finally:
+        runners.stop()
+        policy.close()
+        session.close()
+
+    totals = {name: stats['total'] / 1000.0 for name, stats in profiler.summary().items()}
+    inference = totals.get('inference', 0.0) + totals.get('action_sampling', 0.0)
+    emulation = totals['emulation']
+    sync = max(0.0, totals['barrier_wait'] - emulation)
+    steps = (rollouts - warmup_rollouts) * args.max_local_steps * args.emulator_counts
+    return {'steps_per_second': steps / elapsed,
+            'inference': inference / elapsed,
+            'emulation': emulation / elapsed,
+            'sync': sync / elapsed,
+            'other': max(0.0, 1.0 - (inference + emulation + sync) / elapsed)}
+
+
+def _trial_process(args, seconds, results):
+    try:
+        results.put(run_trial(args, seconds))
+    except Exception as e:
+        logging.exception('Trial failed')
+        results.put({'error': str(e)})
+
+
+class Autotuner(object):
+    """
+    Evaluates configurations (dicts of train.py arguments) with trials in fresh spawned processes,
+    so that every trial starts with its own TensorFlow runtime and emulator workers.
+    """
+
+    def __init__(self, args, results_file=None, startup_timeout=300):
+        self.args = args
+        self.results_file = results_file
+        # Seconds a trial may take beyond its duration (TF and emulator startup, warmup) before it is killed
+        self.startup_timeout = startup_timeout
+        self.context = get_context('spawn')
+
+    def evaluate(self, config, seconds):
+        trial_args = argparse.Namespace(**dict(vars(self.args), **config))
+        results = self.context.Queue()
+        process = self.context.Process(target=_trial_process, args=(trial_args, seconds, results))
+        process.start()
+        deadline = time.time() + seconds + self.startup_timeout
+        result = None
+        while result is None:
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                # A trial that died without a result, or wedged, fails instead of hanging the search
+                if not process.is_alive():
+                    try:
+                        result = results.get(timeout=1)
+                    except queue.Empty:
+                        result = {'error': 'trial exited with code {}'.format(process.exitcode)}
+                elif time.time() > deadline:
+                    result = {'error': 'no result within {:.0f}s'.format(seconds + self.startup_timeout)}
+        process.join(timeout=0 if 'error' in result else 30)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        result = dict(config, seconds=seconds, **result)
+        logging.info('Trial {}'.format(json.dumps(result)))
+        if self.results_file:
+            with open(self.results_file, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+        return result
+
+    def grid(self, configs, seconds):
+        """ :return: the results of every configuration, each run for `seconds` """
+        return [self.evaluate(config, seconds) for config in configs]
+
+    def successive_halving(self, configs, seconds, eta=3):
+        """
+        Runs every configuration for `seconds`, keeps the best 1/eta, and runs those eta times
+        longer, until one is left.
+        :return: the results of the last round, best first
+        """
+        while True:
+            results = sorted(self.grid(configs, seconds), key=lambda r: -r.get('steps_per_second', 0.0))
+            if len(configs) == 1:
+                return results
+            configs = [{key: r[key] for key in configs[0]} for r in results[:max(1, len(results) // eta)]]
+            seconds *= eta
+
+
+def candidate_configs(emulator_counts, emulator_workers, max_local_steps):
+    """ :return: every combination in which the workers divide the emulators """
+    return [{'emulator_counts': counts, 'emulator_workers': workers, 'max_local_steps': steps}
+            for counts, workers, steps in itertools.product(emulator_counts, emulator_workers, max_local_steps)
+            if workers <= counts and counts % workers == 0]
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-df', '--debugging_folder', default='logs/', type=str, help="Folder args.json (the best configuration) and autotune.jsonl (every trial) are written to", dest="debugging_folder")
+    parser.add_argument('--emulator_counts', default=[16, 32, 64], type=int, nargs='+', help="Candidate numbers of emulators", dest="emulator_counts")
+    parser.add_argument('--emulator_workers', default=[4, 8, 16], type=int, nargs='+', help="Candidate numbers of emulator workers; combinations where they do not divide the emulators are skipped", dest="emulator_workers")
+    parser.add_argument('--max_local_steps', default=[5], type=int, nargs='+', help="Candidate rollout lengths. Default is 5 only, as it also changes the learning algorithm.", dest="max_local_steps")
+    parser.add_argument('--search', default='halving', choices=['grid', 'halving'], type=str, help="Run every configuration for --trial_seconds, or use successive halving starting from --trial_seconds. Default is halving.", dest="search")
+    parser.add_argument('--trial_seconds', default=10, type=float, help="Duration of a trial (of the first round with halving). Default is 10.", dest="trial_seconds")
+    parser.add_argument('--startup_timeout', default=300, type=float, help="Seconds a trial may run beyond its duration before it is killed and recorded as failed. Default is 300.", dest="startup_timeout")
+    parser.add_argument('--eta', default=3, type=int, help="Successive halving keeps 1/eta of the configurations per round. Default is 3.", dest="eta")
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    options, train_argv = get_arg_parser().parse_known_args()
+    from train import get_arg_parser as get_train_arg_parser
+    import logger_utils
+    args = get_train_arg_parser().parse_args([a for a in train_argv if a != '--'] + ['-df', options.debugging_folder])
+    if not os.path.exists(args.debugging_folder):
+        os.makedirs(args.debugging_folder)
+
+    configs = candidate_configs(options.emulator_counts, options.emulator_workers, options.max_local_steps)
+    if not configs:
+        raise Exception('No configuration where the emulator workers divide the emulators')
+    tuner = Autotuner(args, os.path.join(args.debugging_folder, 'autotune.jsonl'), options.startup_timeout)
+    if options.search == 'grid':
+        results = sorted(tuner.grid(configs, options.trial_seconds), key=lambda r: -r.get('steps_per_second', 0.0))
+    else:
+        results = tuner.successive_halving(configs, options.trial_seconds, options.eta)
+
+    best = results[0]
+    if 'error' in best:
+        raise Exception('Every trial failed: {}'.format(best['error']))
+    for key in configs[0]:
+        setattr(args, key, best[key])
+    logger_utils.save_args(args, args.debugging_folder)
+    logging.info('Best configuration: {} at {:.0f} steps/s (inference {:.0%}, emulation {:.0%}, sync {:.0%}), '
+                 'written to {}'.format({key: best[key] for key in configs[0]}, best['steps_per_second'],
+                                        best['inference'], best['emulation'], best['sync'],
+                                        os.path.join(args.debugging_folder, 'args.json')))
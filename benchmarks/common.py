@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    common
+    Description  :    Shared helpers of the benchmark entry points.
+"""
+
+import json, os, platform, subprocess, sys, time
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info():
+    return {'commit': git_commit(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+            'time': time.time()}
+
+
+def report(benchmark, results, output=None):
+    """
+    Prints the results and, if output is given, appends them as one JSON line to it, so that
+    runs on different commits can be compared.
+    :param benchmark: name of the benchmark
+    :param results: list of dicts, one per measured case
+    """
+    record = {'benchmark': benchmark, 'environment': environment_info(), 'results': results}
+    for result in results:
+        print(json.dumps(result))
+    if output:
+        with open(output, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    return record
+
+
+def emulator_args(argv=()):
+    """ train.py's default arguments, as used to create emulators. """
+    from train import get_arg_parser
+    args = get_arg_parser().parse_args(list(argv))
+    args.random_seed = 3
+    return args
+
+
+def step_runners(runners, num_actions, emulator_counts, steps):
+    """
+    Steps the runners synchronously with random actions.
+    :return: elapsed seconds
+    """
+    shared_actions = runners.get_shared_variables()[-1]
+    eye = np.eye(num_actions, dtype=np.float32)
+    start_time = time.time()
+    for _ in range(steps):
+        shared_actions[:] = eye[np.random.randint(num_actions, size=emulator_counts)]
+        runners.update_environments()
+        runners.wait_updated()
+    return time.time() - start_time
+
+
+def create_runners(backend, environment_creator, emulator_counts, workers):
+    from runners import get_runners_backend
+    num_actions = environment_creator.num_actions
+    variables = [(np.zeros((emulator_counts, 84, 84, 4), dtype=np.uint8)),
+                 (np.zeros(emulator_counts, dtype=np.float32)),
+                 (np.asarray([False] * emulator_counts, dtype=np.float32)),
+                 (np.zeros((emulator_counts, num_actions), dtype=np.float32))]
+    runners_class, emulator_runner_class = get_runners_backend(backend)
+    return runners_class(emulator_runner_class, environment_creator, workers, variables)
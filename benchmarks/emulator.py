@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    emulator
+    Description  :    Emulator-only steps/s per ROM and per number of emulator workers.
+
+        python3 benchmarks/emulator.py --games pong breakout --workers 1 2 4 8 -o bench.jsonl
+        python3 benchmarks/emulator.py --fast_ale False True --workers 1
+
+    Every case also reports the mean time of one emulator step (action repeat, screen grabs and
+    preprocessing) measured in-process on a single emulator, i.e. without the runners. With both
+    classes, the FastAtariEmulator cases report their single emulator speedup; they are only run
+    once fast_atari_emulator.check_equivalence has found the same observations, rewards and
+    terminals as AtariEmulator.
+"""
+
+import argparse, os, time
+import numpy as np
+
+from common import REPO_ROOT, report, emulator_args, step_runners, create_runners
+from train import bool_arg
+
+
+def single_emulator_step_us(env_creator, steps):
+    """ Mean microseconds per next() of one emulator stepped in this process with random actions. """
+    emulator = env_creator.create_environment(0)
+    emulator.get_initial_state()
+    eye = np.eye(env_creator.num_actions, dtype=np.float32)
+    actions = eye[np.random.randint(env_creator.num_actions, size=steps)]
+    start_time = time.perf_counter()
+    for action in actions:
+        _, _, episode_over = emulator.next(action)
+        if episode_over:
+            emulator.get_initial_state()
+    return (time.perf_counter() - start_time) / steps * 1e6
+
+
+def benchmark_game(game, emulator_counts, workers, steps, backend, extra_args=(), fast_ale=False):
+    from environment_creator import EnvironmentCreator
+    args = emulator_args(['-g', game, '-ec', str(emulator_counts), '-ew', str(workers),
+                          '--fast_ale', str(fast_ale)] + list(extra_args))
+    env_creator = EnvironmentCreator(args)
+    step_us = single_emulator_step_us(env_creator, steps * 4)
+    runners = create_runners(backend, env_creator, emulator_counts, workers)
+    runners.start()
+    elapsed = step_runners(runners, env_creator.num_actions, emulator_counts, steps)
+    runners.stop()
+    return {'game': game, 'backend': backend, 'fast_ale': fast_ale, 'emulator_counts': emulator_counts,
+            'emulator_workers': workers, 'steps': steps * emulator_counts,
+            'steps_per_second': steps * emulator_counts / elapsed, 'single_emulator_step_us': step_us}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', default=['pong'], nargs='+', help="ROM names, or 'all' for every ROM in atari_roms", dest="games")
+    parser.add_argument('--workers', default=[1, 2, 4, 8], type=int, nargs='+', help="Emulator worker counts to measure", dest="workers")
+    parser.add_argument('--emulators_per_worker', default=4, type=int, help="Emulators stepped by each worker", dest="emulators_per_worker")
+    parser.add_argument('--steps', default=200, type=int, help="Synchronous steps to time per case", dest="steps")
+    parser.add_argument('--backend', default='process', choices=['process', 'thread'], type=str, dest="backend")
+    parser.add_argument('--fast_ale', default=[False], type=bool_arg, nargs='+', help="Emulator classes to measure: False for AtariEmulator, True for FastAtariEmulator, or both", dest="fast_ale")
+    parser.add_argument('-o', '--output', default=None, type=str, help="JSON lines file the results are appended to", dest="output")
+    args = parser.parse_args()
+
+    games = args.games
+    if games == ['all']:
+        games = sorted(f[:-len('.bin')] for f in os.listdir(os.path.join(REPO_ROOT, 'atari_roms')) if f.endswith('.bin'))
+    results = []
+    for game in games:
+        for workers in args.workers:
+            cases = {}
+            for fast_ale in args.fast_ale:
+                cases[fast_ale] = benchmark_game(game, workers * args.emulators_per_worker, workers, args.steps,
+                                                 args.backend, ['--rom_path', os.path.join(REPO_ROOT, 'atari_roms')],
+                                                 fast_ale)
+                if fast_ale and False in cases:
+                    cases[True]['speedup'] = cases[False]['single_emulator_step_us'] / cases[True]['single_emulator_step_us']
+                results.append(cases[fast_ale])
+    report('emulator', results, args.output)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    inference
+    Description  :    Cost of the numpy actor forward pass (numpy_network.py) per batch size, with the
+                      share of the conv1 unfold, and the cost of unfolding only the newest frame.
+"""
+
+import argparse, time
+import numpy as np
+
+from common import report
+
+
+def random_weights(arch, num_actions):
+    from numpy_network import ARCHITECTURES, conv_output_size
+    conv_layers, (fc_name, fc_size) = ARCHITECTURES[arch]
+    weights, size, channels = {}, 84, 4
+    for name, filters, kernel, stride in conv_layers:
+        weights[name + '_weights'] = np.random.uniform(-0.1, 0.1, (kernel, kernel, channels, filters))
+        weights[name + '_biases'] = np.random.uniform(-0.1, 0.1, filters)
+        size, channels = conv_output_size(size, kernel, stride), filters
+    weights[fc_name + '_weights'] = np.random.uniform(-0.01, 0.01, (size * size * channels, fc_size))
+    weights[fc_name + '_biases'] = np.random.uniform(-0.1, 0.1, fc_size)
+    for name, outputs in [('actor_output', num_actions), ('critic_output', 1)]:
+        weights[name + '_weights'] = np.random.uniform(-0.1, 0.1, (fc_size, outputs))
+        weights[name + '_biases'] = np.random.uniform(-0.1, 0.1, outputs)
+    return weights
+
+
+def timed(function, repeats):
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start_time) / repeats
+
+
+def benchmark_inference(arch, batch_sizes, repeats, num_actions=6):
+    from numpy_network import NumpyNetwork, im2col_view
+    network = NumpyNetwork(arch, num_actions)
+    network.set_weights(random_weights(arch, num_actions))
+    _, _, kernel, stride = network.conv_layers[0]
+
+    results = []
+    for batch_size in batch_sizes:
+        states = np.random.randint(0, 256, size=(batch_size, 84, 84, 4), dtype=np.uint8)
+        layer_buffers = network._get_buffers(batch_size)[0]
+        newest_frame_patches = np.empty(layer_buffers[0][0].shape[:-1], dtype=np.float32)
+
+        def unfold_newest_frame():
+            np.copyto(newest_frame_patches, im2col_view(states[..., -1:], kernel, stride)[..., 0], casting='unsafe')
+
+        network.predict(states)
+        results.append({'arch': arch, 'batch_size': batch_size,
+                        'forward_ms': timed(lambda: network.predict(states), repeats) * 1e3,
+                        'conv1_unfold_ms': timed(lambda: network.conv_patches(states, layer_buffers), repeats) * 1e3,
+                        'newest_frame_unfold_ms': timed(unfold_newest_frame, repeats) * 1e3})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--arch', default=['NIPS', 'NATURE'], nargs='+', help="Network architectures", dest="arch")
+    parser.add_argument('--batch_sizes', default=[1, 8, 32, 128], type=int, nargs='+', help="Batch sizes (emulators per actor)", dest="batch_sizes")
+    parser.add_argument('--repeats', default=50, type=int, help="Forward passes per measurement", dest="repeats")
+    parser.add_argument('-o', '--output', default=None, type=str, help="JSON lines file the results are appended to", dest="output")
+    args = parser.parse_args()
+    results = []
+    for arch in args.arch:
+        results += benchmark_inference(arch, args.batch_sizes, args.repeats)
+    report('inference', results, args.output)
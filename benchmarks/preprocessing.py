@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    preprocessing
+    Description  :    Cost per frame of the AtariEmulator preprocessing (max-pool of the last two
+                      frames, resize to 84x84, observation stacking), without the emulator.
+"""
+
+import argparse, time
+import numpy as np
+
+from common import report
+
+
+def benchmark_preprocessing(frames, screen_height=210, screen_width=160):
+    from environment import FramePool, ObservationPool
+    from atari_emulator import process_frame_pool, IMG_SIZE_X, IMG_SIZE_Y, NR_IMAGES
+
+    screens = np.random.randint(0, 256, size=(64, screen_height, screen_width), dtype=np.uint8)
+    frame_pool = FramePool(np.empty((2, screen_height, screen_width), dtype=np.uint8), process_frame_pool)
+    observation_pool = ObservationPool(np.zeros((IMG_SIZE_X, IMG_SIZE_Y, NR_IMAGES), dtype=np.uint8))
+
+    timings = {'max_and_resize': 0.0, 'observation_stacking': 0.0}
+    for i in range(frames):
+        frame_pool.new_frame(screens[i % len(screens)])
+        frame_pool.new_frame(screens[(i + 1) % len(screens)])
+        start_time = time.perf_counter()
+        frame = frame_pool.get_processed_frame()
+        timings['max_and_resize'] += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        observation_pool.new_observation(frame)
+        observation_pool.get_pooled_observations()
+        timings['observation_stacking'] += time.perf_counter() - start_time
+
+    return [{'stage': stage, 'frames': frames, 'us_per_frame': total / frames * 1e6}
+            for stage, total in timings.items()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', default=20000, type=int, help="Frames to process", dest="frames")
+    parser.add_argument('-o', '--output', default=None, type=str, help="JSON lines file the results are appended to", dest="output")
+    args = parser.parse_args()
+    report('preprocessing', benchmark_preprocessing(args.frames), args.output)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    runner_backends
+    Description  :    Compare the steps/s of the process and thread emulator runner backends.
+"""
+
+import argparse
+
+from common import report, emulator_args, step_runners, create_runners
+
+
+def run_backend(backend, args, steps):
+    """
+    Steps all emulators with random actions and returns the measured steps/s.
+    :param backend: 'process' or 'thread'
+    :param args: emulator arguments, as parsed by train.py
+    :param steps: number of synchronous steps to time
+    """
+    from environment_creator import EnvironmentCreator
+    env_creator = EnvironmentCreator(args)
+    runners = create_runners(backend, env_creator, args.emulator_counts, args.emulator_workers)
+    runners.start()
+    elapsed = step_runners(runners, env_creator.num_actions, args.emulator_counts, steps)
+    runners.stop()
+    return steps * args.emulator_counts / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', default='pong', help='Name of game', dest='game')
+    parser.add_argument('-ec', '--emulator_counts', default=32, type=int, dest="emulator_counts")
+    parser.add_argument('-ew', '--emulator_workers', default=8, type=int, dest="emulator_workers")
+    parser.add_argument('--steps', default=500, type=int, help="Synchronous steps to time per backend", dest="steps")
+    parser.add_argument('--backends', default=['process', 'thread'], nargs='+', help="Backends to compare", dest="backends")
+    parser.add_argument('-o', '--output', default=None, type=str, help="JSON lines file the results are appended to", dest="output")
+    options = parser.parse_args()
+
+    args = emulator_args(['-g', options.game, '-ec', str(options.emulator_counts), '-ew', str(options.emulator_workers)])
+    results = [{'game': args.game, 'backend': backend, 'emulator_counts': args.emulator_counts,
+                'emulator_workers': args.emulator_workers,
+                'steps_per_second': run_backend(backend, args, options.steps)}
+               for backend in options.backends]
+    report('runner_backends', results, options.output)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    runners_sync
+    Description  :    Synchronization overhead of Runners: steps/s with emulators that do no work.
+"""
+
+import argparse
+import numpy as np
+
+from common import report, step_runners, create_runners
+from environment import BaseEnvironment
+
+
+class NoopEnvironment(BaseEnvironment):
+    """ Returns the same state instantly, so only the runner plumbing is measured. """
+
+    def __init__(self, num_actions):
+        self.state = np.zeros((84, 84, 4), dtype=np.uint8)
+        self.num_actions = num_actions
+
+    def get_initial_state(self):
+        return self.state
+
+    def next(self, action):
+        return self.state, 0.0, False
+
+    def get_legal_actions(self):
+        return np.arange(self.num_actions)
+
+    def get_noop(self):
+        return np.eye(self.num_actions)[0]
+
+
+class NoopEnvironmentCreator(object):
+    def __init__(self, num_actions):
+        self.num_actions = num_actions
+
+    def create_environment(self, i):
+        return NoopEnvironment(self.num_actions)
+
+
+def benchmark_sync(backend, emulator_counts, workers, steps, num_actions=6):
+    runners = create_runners(backend, NoopEnvironmentCreator(num_actions), emulator_counts, workers)
+    runners.start()
+    elapsed = step_runners(runners, num_actions, emulator_counts, steps)
+    runners.stop()
+    return {'backend': backend, 'emulator_counts': emulator_counts, 'emulator_workers': workers,
+            'us_per_sync_step': elapsed / steps * 1e6, 'steps_per_second': steps * emulator_counts / elapsed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', default=['process', 'thread'], nargs='+', dest="backends")
+    parser.add_argument('--workers', default=[1, 2, 4, 8, 16], type=int, nargs='+', dest="workers")
+    parser.add_argument('--emulators_per_worker', default=4, type=int, dest="emulators_per_worker")
+    parser.add_argument('--steps', default=2000, type=int, help="Synchronous steps to time per case", dest="steps")
+    parser.add_argument('-o', '--output', default=None, type=str, help="JSON lines file the results are appended to", dest="output")
+    args = parser.parse_args()
+
+    results = [benchmark_sync(backend, workers * args.emulators_per_worker, workers, args.steps)
+               for backend in args.backends for workers in args.workers]
+    report('runners_sync', results, args.output)
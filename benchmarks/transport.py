@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    transport
+    Description  :    End-to-end throughput of the actor -> learner transports, against a local
+                      stand-in learner that decodes every batch.
+
+        python3 benchmarks/transport.py --transports zmq_pickle zmq_schema --batches 200 -o bench.jsonl
+        python3 benchmarks/transport.py --recorded logs/recording
+"""
+
+import argparse, time
+from multiprocessing import Process, Event
+import numpy as np
+
+from common import report
+
+
+def make_batch(max_local_steps, emulator_counts, num_actions):
+    """ A batch shaped like the ones PAACLearner.train sends, with realistic frame stacking. """
+    frames = np.random.randint(0, 256, size=(max_local_steps + 4, emulator_counts, 84, 84), dtype=np.uint8)
+    states = np.stack([frames[t:t + max_local_steps + 1] for t in range(4)], axis=-1)
+    rewards = np.random.choice([0.0, 1.0], size=(max_local_steps, emulator_counts)).astype(np.float32)
+    masks = np.ones((max_local_steps, emulator_counts), dtype=np.float32)
+    actions = np.random.randint(num_actions, size=(max_local_steps, emulator_counts)).astype(np.uint8)
+    values = np.random.randn(max_local_steps, emulator_counts).astype(np.float32)
+    return [states, rewards, masks, actions, values]
+
+
+class ZMQPickleTransport(object):
+    name = 'zmq_pickle'
+
+    def __init__(self, address='tcp://127.0.0.1:6690'):
+        self.address = address
+
+    def serve(self, ready):
+        import zmq
+        from zmq_serialize import SerializingContext
+        rep = SerializingContext().socket(zmq.REP)
+        rep.bind(self.address)
+        ready.set()
+        while True:
+            rep.recv_zipped_pickle()
+            rep.send_string("received data.")
+
+    def connect(self):
+        import zmq
+        from zmq_serialize import SerializingContext, dumps_zipped_pickle
+        req = SerializingContext().socket(zmq.REQ)
+        req.connect(self.address)
+
+        def send(batch):
+            payload = dumps_zipped_pickle(batch)
+            req.send(payload)
+            req.recv_string()
+            return len(payload)
+
+        return send
+
+
+class ZMQSchemaTransport(object):
+    """ rollout_schema frames over ZMQ multipart messages, as used by the actors and learner.py. """
+    name = 'zmq_schema'
+
+    def __init__(self, address='tcp://127.0.0.1:6691'):
+        self.address = address
+
+    def serve(self, ready):
+        import zmq
+        from rollout_schema import decode_rollout
+        rep = zmq.Context().socket(zmq.REP)
+        rep.bind(self.address)
+        ready.set()
+        while True:
+            decode_rollout(rep.recv_multipart(copy=False))
+            rep.send_string("received data.")
+
+    def connect(self):
+        import zmq
+        from rollout_schema import encode_rollout
+        req = zmq.Context().socket(zmq.REQ)
+        req.connect(self.address)
+
+        def send(batch):
+            frames = encode_rollout(*batch)
+            req.send_multipart(frames, copy=False)
+            req.recv_string()
+            return sum(len(frame) for frame in frames)
+
+        return send
+
+
+class GRPCTransport(object):
+    name = 'grpc'
+
+    def __init__(self, address='127.0.0.1:50061'):
+        self.address = address
+
+    def serve(self, ready):
+        import grpc
+        from concurrent import futures
+        from grpc_utils_flatten import batch_data_pb2, batch_data_pb2_grpc
+
+        class Servicer(batch_data_pb2_grpc.TransferBatchDataServicer):
+            def Send(self, request, context):
+                np.array(request.states, dtype=np.uint8)
+                np.array(request.actions, dtype=np.float32)
+                np.array(request.rewards, dtype=np.float32)
+                return batch_data_pb2.ReceiveReply(boolean=True)
+
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4), options=[
+            ('grpc.max_send_message_length', 256 * 1024 * 1024),
+            ('grpc.max_receive_message_length', 256 * 1024 * 1024)])
+        batch_data_pb2_grpc.add_TransferBatchDataServicer_to_server(Servicer(), server)
+        server.add_insecure_port(self.address)
+        server.start()
+        ready.set()
+        while True:
+            time.sleep(3600)
+
+    def connect(self):
+        import grpc
+        from grpc_utils_flatten import batch_data_pb2, batch_data_pb2_grpc
+        channel = grpc.insecure_channel(self.address, options=[
+            ('grpc.max_send_message_length', 256 * 1024 * 1024),
+            ('grpc.max_receive_message_length', 256 * 1024 * 1024)])
+        stub = batch_data_pb2_grpc.TransferBatchDataStub(channel)
+
+        def send(batch):
+            states, rewards, masks, actions, values = batch
+            request = batch_data_pb2.BatchData(states=states.flatten(), actions=actions.flatten(),
+                                               rewards=rewards.flatten())
+            stub.Send(request)
+            return request.ByteSize()
+
+        return send
+
+
+class GRPCSchemaTransport(object):
+    """ rollout_schema frames packed into one gRPC message, through a generic method (no .proto). """
+    name = 'grpc_schema'
+
+    def __init__(self, address='127.0.0.1:50062'):
+        self.address = address
+
+    def serve(self, ready):
+        from grpc_transport import serve_rollouts
+        serve_rollouts(self.address, lambda rollout: None)
+        ready.set()
+        while True:
+            time.sleep(3600)
+
+    def connect(self):
+        from grpc_transport import rollout_sender
+        from rollout_schema import encode_rollout
+        send_frames = rollout_sender(self.address)
+
+        def send(batch):
+            return send_frames(encode_rollout(*batch))
+
+        return send
+
+
+TRANSPORTS = {t.name: t for t in [ZMQPickleTransport, ZMQSchemaTransport, GRPCTransport, GRPCSchemaTransport]}
+
+
+def benchmark_transport(transport, batch, batches):
+    ready = Event()
+    server = Process(target=transport.serve, args=(ready,), daemon=True)
+    server.start()
+    ready.wait()
+    send = transport.connect()
+    send(batch)
+
+    wire_bytes = 0
+    start_time = time.time()
+    for _ in range(batches):
+        wire_bytes += send(batch)
+    elapsed = time.time() - start_time
+    server.terminate()
+
+    raw_bytes = sum(a.nbytes for a in batch)
+    return {'transport': transport.name, 'batches': batches, 'batch_shape': list(batch[0].shape[:2]),
+            'batches_per_second': batches / elapsed,
+            'raw_mb_per_second': raw_bytes * batches / elapsed / 2 ** 20,
+            'wire_mb_per_second': wire_bytes / elapsed / 2 ** 20,
+            'wire_bytes_per_batch': wire_bytes / batches}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transports', default=sorted(TRANSPORTS), nargs='+', choices=sorted(TRANSPORTS), dest="transports")
+    parser.add_argument('--batches', default=200, type=int, help="Batches to send per transport", dest="batches")
+    parser.add_argument('--max_local_steps', default=5, type=int, dest="max_local_steps")
+    parser.add_argument('-ec', '--emulator_counts', default=32, type=int, dest="emulator_counts")
+    parser.add_argument('--num_actions', default=6, type=int, dest="num_actions")
+    parser.add_argument('--recorded', default=None, type=str, help="Send the first rollout of a rollout_recorder.py recording instead of a synthetic batch", dest="recorded")
+    parser.add_argument('-o', '--output', default=None, type=str, help="JSON lines file the results are appended to", dest="output")
+    args = parser.parse_args()
+
+    if args.recorded:
+        from rollout_recorder import RolloutReader
+        batch = [np.array(a) for a in next(iter(RolloutReader(args.recorded)))[0][:5]]
+    else:
+        batch = make_batch(args.max_local_steps, args.emulator_counts, args.num_actions)
+    results = [benchmark_transport(TRANSPORTS[name](), batch, args.batches) for name in args.transports]
+    report('transport', results, args.output)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    broker
+    Description  :    Rollout broker between an actor fleet and the learner(s).
+"""
+
+import argparse, logging, sys, time, zmq
+
+
+class ActorStats(object):
+    def __init__(self):
+        self.batches = 0
+        self.bytes = 0
+        self.interval_batches = 0
+        self.interval_bytes = 0
+        self.last_seen = time.time()
+
+    def add(self, size):
+        self.batches += 1
+        self.bytes += size
+        self.interval_batches += 1
+        self.interval_bytes += size
+        self.last_seen = time.time()
+
+    def reset_interval(self):
+        self.interval_batches = 0
+        self.interval_bytes = 0
+
+
+class RolloutBroker(object):
+    """
+    Receives rollout batches from many actors on a ROUTER socket and forwards them, unchanged,
+    to the learner. The learner's reply is routed back to the actor that sent the batch, so the
+    actors keep the request/reply semantics (and backpressure) they have with a direct connection.
+    When several learner addresses are given, batches are distributed round-robin across them.
+
+    Every learner has its own DEALER socket and any number of batches can be in flight, so a slow
+    learner only holds back the actors whose batches it has. A learner that has not replied to a
+    batch for learner_timeout seconds gets no new batches until it replies again, and its pending
+    batches are resent to the other learners (a late reply to a resent batch is dropped).
+    """
+
+    def __init__(self, frontend_address, learner_addresses, report_interval=30, learner_timeout=120):
+        self.frontend_address = frontend_address
+        self.learner_addresses = learner_addresses
+        self.report_interval = report_interval
+        self.learner_timeout = learner_timeout
+        self.stats = {}
+        # request id -> [actor identity, learner index, send time, frames]
+        self.pending = {}
+        self.next_request = 0
+        self.next_learner = 0
+        self.unresponsive = set()
+
+    def _choose_learner(self, exclude=None):
+        candidates = [i for i in range(len(self.learner_addresses)) if i not in self.unresponsive and i != exclude]
+        if not candidates:
+            if exclude is not None:
+                return None
+            # Every learner is unresponsive: keep sending round-robin rather than dropping batches
+            candidates = list(range(len(self.learner_addresses)))
+        self.next_learner += 1
+        return candidates[self.next_learner % len(candidates)]
+
+    def _forward(self, backends, request, learner):
+        self.pending[request][1:3] = [learner, time.time()]
+        backends[learner].send_multipart([str(request).encode(), b''] + self.pending[request][3], copy=False)
+
+    def _check_learners(self, backends):
+        now = time.time()
+        for request, (identity, learner, sent, frames) in list(self.pending.items()):
+            if now - sent < self.learner_timeout:
+                continue
+            if learner not in self.unresponsive:
+                logging.warning("Learner {} has not replied for {:.0f}s, no new batches are sent to it"
+                                .format(self.learner_addresses[learner], now - sent))
+                self.unresponsive.add(learner)
+            other = self._choose_learner(exclude=learner)
+            if other is not None:
+                self._forward(backends, request, other)
+
+    def run(self):
+        ctx = zmq.Context()
+        frontend = ctx.socket(zmq.ROUTER)
+        frontend.bind(self.frontend_address)
+        backends = []
+        poller = zmq.Poller()
+        poller.register(frontend, zmq.POLLIN)
+        for address in self.learner_addresses:
+            backend = ctx.socket(zmq.DEALER)
+            backend.connect(address)
+            poller.register(backend, zmq.POLLIN)
+            backends.append(backend)
+
+        logging.info("Broker forwarding {} to {}".format(self.frontend_address, self.learner_addresses))
+        last_report = time.time()
+        while True:
+            events = dict(poller.poll(1000))
+            for learner, backend in enumerate(backends):
+                if backend in events:
+                    request, empty, reply = backend.recv_multipart()
+                    if learner in self.unresponsive:
+                        logging.info("Learner {} replies again".format(self.learner_addresses[learner]))
+                        self.unresponsive.discard(learner)
+                    entry = self.pending.get(int(request))
+                    # A batch resent after a timeout is answered by whichever learner replies first
+                    if entry is not None:
+                        del self.pending[int(request)]
+                        frontend.send_multipart([entry[0], b'', reply])
+            if frontend in events:
+                identity, empty, *frames = frontend.recv_multipart(copy=False)
+                actor = identity.bytes.decode(errors='replace')
+                self.stats.setdefault(actor, ActorStats()).add(sum(len(frame) for frame in frames))
+                request, self.next_request = self.next_request, self.next_request + 1
+                self.pending[request] = [identity.bytes, None, None, frames]
+                self._forward(backends, request, self._choose_learner())
+
+            if self.learner_timeout:
+                self._check_learners(backends)
+            if time.time() - last_report >= self.report_interval:
+                self.report(time.time() - last_report)
+                last_report = time.time()
+
+    def report(self, elapsed):
+        total_batches, total_bytes = 0, 0
+        for actor, stats in sorted(self.stats.items()):
+            logging.info("{}: {:.2f} batches/s, {:.2f} MB/s, {} batches total, last seen {:.1f}s ago"
+                         .format(actor, stats.interval_batches / elapsed, stats.interval_bytes / elapsed / 2 ** 20,
+                                 stats.batches, time.time() - stats.last_seen))
+            total_batches += stats.interval_batches
+            total_bytes += stats.interval_bytes
+            stats.reset_interval()
+        logging.info("Broker total: {} actors, {:.2f} batches/s, {:.2f} MB/s"
+                     .format(len(self.stats), total_batches / elapsed, total_bytes / elapsed / 2 ** 20))
+
+
+def run_broker(frontend_address, learner_addresses, report_interval=30, learner_timeout=120):
+    RolloutBroker(frontend_address, learner_addresses, report_interval, learner_timeout).run()
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frontend', default='tcp://*:5555', type=str, help="Address the actors connect to", dest="frontend")
+    parser.add_argument('--learners', default=['tcp://127.0.0.1:6666'], nargs='+', type=str, help="Addresses of the learner(s)", dest="learners")
+    parser.add_argument('--report_interval', default=30, type=int, help="Seconds between throughput reports", dest="report_interval")
+    parser.add_argument('--learner_timeout', default=120, type=float, help="Seconds without a reply to a batch after which a learner gets no new batches and its pending ones are resent to the other learners; 0 to disable. It must exceed the longest backpressure wait of a learner.", dest="learner_timeout")
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    args = get_arg_parser().parse_args()
+    run_broker(args.frontend, args.learners, args.report_interval, args.learner_timeout)
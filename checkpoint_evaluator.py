@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    checkpoint_evaluator
+    Description  :    Background service that evaluates every new network version.
+
+    Started by the actor when --eval_episodes > 0, or on its own with
+        python3 checkpoint_evaluator.py -df logs/ --eval_episodes 30
+"""
+
+import copy, json, logging, os, sys, time
+import numpy as np
+
+EVAL_NICENESS = 19
+
+
+def checkpoint_step(path):
+    return int(path[path.rindex('-') + 1:])
+
+
+class CheckpointEvaluator(object):
+    def __init__(self, args):
+        """
+        Watches the upload and checkpoints folders of args.debugging_folder and evaluates each new
+        checkpoint on args.eval_episodes episodes, with its own pool of emulators.
+        :param args: the training arguments
+        """
+        self.args = copy.copy(args)
+        # Evaluation uses full episodes, whatever the training setting
+        self.args.single_life_episodes = False
+        self.args.visualize = False
+        self.args.device = args.eval_device
+        self.args.actor_id = args.actor_id + 1000
+        self.watched_folders = [os.path.join(args.debugging_folder, 'upload/'),
+                                os.path.join(args.debugging_folder, 'checkpoints/')]
+        self.results_file = os.path.join(args.debugging_folder, 'eval.jsonl')
+
+    def _lower_priority(self):
+        os.nice(EVAL_NICENESS)
+        if self.args.eval_cpus:
+            os.sched_setaffinity(0, self.args.eval_cpus)
+
+    def latest_unseen_checkpoint(self, tf, seen):
+        latest = None
+        for folder in self.watched_folders:
+            try:
+                path = tf.train.latest_checkpoint(folder)
+            except ValueError:  # if the checkpoint is written: state error
+                continue
+            if path and path not in seen and (latest is None or checkpoint_step(path) > checkpoint_step(latest)):
+                latest = path
+        return latest
+
+    def run(self):
+        self._lower_priority()
+
+        import tensorflow as tf
+        from train import get_network_and_environment_creator
+        from inference import SessionPolicy
+        from evaluator import Evaluator, summarize
+
+        network_creator, env_creator = get_network_and_environment_creator(self.args)
+        network = network_creator()
+        saver = tf.train.Saver()
+        config = tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+        session = tf.Session(config=config)
+        summary_writer = tf.summary.FileWriter(os.path.join(self.args.debugging_folder, 'tf'))
+        evaluator = Evaluator(env_creator, SessionPolicy(network, session, saver), self.args.eval_environments,
+                              self.args.eval_workers, self.args.runner_backend, self.args.eval_max_episode_steps)
+
+        seen = set()
+        while True:
+            path = self.latest_unseen_checkpoint(tf, seen)
+            if path is None:
+                time.sleep(self.args.eval_poll_interval)
+                continue
+            try:
+                saver.restore(session, path)
+            except (tf.errors.NotFoundError, tf.errors.DataLossError):
+                # Files of the checkpoint are still being written or were already removed
+                time.sleep(self.args.eval_poll_interval)
+                continue
+            seen.add(path)
+
+            start_time = time.time()
+            results = evaluator.evaluate(self.args.eval_episodes)
+            summary = summarize(results)
+            step = checkpoint_step(path)
+            summary.update({'checkpoint': path, 'step': step, 'time': time.time()})
+            with open(self.results_file, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
+            if summary['episodes'] == 0:
+                logging.warning('Evaluated {}: no episode finished'.format(path))
+                continue
+            logging.info('Evaluated {} on {} episodes in {:.0f}s: mean {:.2f}, 95% CI [{:.2f}, {:.2f}]'
+                         .format(path, summary['episodes'], time.time() - start_time, summary['mean'], *summary['ci95']))
+
+            eval_summary = tf.Summary(value=[
+                tf.Summary.Value(tag='eval/reward_mean', simple_value=summary['mean']),
+                tf.Summary.Value(tag='eval/reward_ci95_low', simple_value=summary['ci95'][0]),
+                tf.Summary.Value(tag='eval/reward_ci95_high', simple_value=summary['ci95'][1]),
+                tf.Summary.Value(tag='eval/episode_length', simple_value=summary['mean_length']),
+            ])
+            summary_writer.add_summary(eval_summary, step)
+            summary_writer.flush()
+
+
+def run_checkpoint_evaluator(args):
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    CheckpointEvaluator(args).run()
+
+
+if __name__ == '__main__':
+    from train import get_arg_parser
+    import logger_utils
+
+    args = get_arg_parser().parse_args()
+    arg_file = os.path.join(args.debugging_folder, 'args.json')
+    cli_args = vars(copy.copy(args))
+    if os.path.exists(arg_file):
+        for k, v in logger_utils.load_args(arg_file).items():
+            setattr(args, k, v)
+        # Evaluation options given on the command line take precedence over the training ones
+        for k, v in cli_args.items():
+            if k.startswith('eval_') or k == 'debugging_folder':
+                setattr(args, k, v)
+    args.random_seed = 3
+    if args.eval_episodes <= 0:
+        args.eval_episodes = 30
+    run_checkpoint_evaluator(args)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    checkpointing
+    Description  :    Checkpoint writes off the training thread: variables are snapshotted into host
+                      memory and written, fsynced and atomically published by a background thread.
+"""
+
+import logging, os, queue, threading
+import tensorflow as tf
+
+
+def fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def checkpoint_files(folder, name):
+    """
+    :return: paths of the files of the checkpoint name (e.g. '-1000') in folder
+    """
+    return [os.path.join(folder, f) for f in os.listdir(folder) if f.startswith(name + '.')]
+
+
+def publish_files(files, folder, temp_prefix, name):
+    """
+    Renames the files written under temp_prefix to the checkpoint name, data shards first and the
+    index last, so that a reader never finds an index without its data.
+    """
+    temp_name = os.path.basename(temp_prefix)
+    files = sorted(files, key=lambda f: f.endswith('.index'))
+    for path in files:
+        fsync_file(path)
+        os.rename(path, os.path.join(folder, name + os.path.basename(path)[len(temp_name):]))
+
+
+def existing_checkpoints(folder, prefix):
+    """
+    :return: (name, step) of the complete checkpoints <prefix>-<step> in folder, by step
+    """
+    checkpoints = []
+    for f in os.listdir(folder):
+        name, extension = os.path.splitext(f)
+        step = name[len(prefix) + 1:]
+        if extension == '.index' and name.startswith(prefix + '-') and step.isdigit():
+            checkpoints.append((name, int(step)))
+    return sorted(checkpoints, key=lambda checkpoint: checkpoint[1])
+
+
+class AsyncCheckpointer(object):
+    """
+    Saves a list of variables like tf.train.Saver, without blocking the training thread on disk I/O.
+
+    save() only copies the variable values into host memory; a background thread loads them into a
+    shadow graph on the CPU, writes the checkpoint under a temporary name, fsyncs it, renames it into
+    place and then updates the folder's checkpoint state file, which is replaced atomically. Readers
+    polling with tf.train.latest_checkpoint therefore only ever see complete checkpoints. At most one
+    snapshot waits behind the one being written.
+
+    Retention: the last max_to_keep checkpoints are kept, plus one every keep_every_steps steps if
+    it is > 0. Both are listed in the checkpoint state file. On the first write into a folder, the
+    checkpoints already in it (from a previous run) are taken over, so they are pruned as well.
+    """
+
+    def __init__(self, session, variables, max_to_keep=5, keep_every_steps=0):
+        self.session = session
+        self.variables = variables
+        self.max_to_keep = max_to_keep
+        self.keep_every_steps = keep_every_steps
+        self.kept = {}
+        self.permanent = {}
+        self.last_permanent_step = None
+        self.scanned_folders = set()
+
+        self.graph = tf.Graph()
+        with self.graph.as_default(), tf.device('/cpu:0'):
+            self.placeholders = [tf.placeholder(v.dtype.base_dtype, v.shape) for v in variables]
+            shadows = [tf.Variable(p, name=v.op.name, trainable=False, validate_shape=True, collections=[])
+                       for p, v in zip(self.placeholders, variables)]
+            self.assign_ops = [s.initializer for s in shadows]
+            self.saver = tf.train.Saver({v.op.name: s for v, s in zip(variables, shadows)},
+                                        max_to_keep=None, sharded=False)
+        self.shadow_session = tf.Session(graph=self.graph, config=tf.ConfigProto(device_count={'GPU': 0}))
+
+        self.snapshots = queue.Queue(maxsize=1)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def save(self, save_path, global_step, on_written=None):
+        """
+        Snapshots the variables and queues the write of checkpoint <save_path>-<global_step>. Blocks
+        only if the previous snapshot has not been picked up by the writer yet.
+        :param on_written: called on the writer thread with the checkpoint path once it is published
+        """
+        values = self.session.run(self.variables)
+        self.snapshots.put((values, save_path, global_step, on_written))
+
+    def wait(self):
+        """ Blocks until every queued checkpoint is written. """
+        self.snapshots.join()
+
+    def close(self):
+        self.wait()
+        self.snapshots.put(None)
+        self.writer.join()
+        self.shadow_session.close()
+
+    def _write_loop(self):
+        while True:
+            snapshot = self.snapshots.get()
+            try:
+                if snapshot is None:
+                    return
+                self._write(*snapshot)
+            except Exception:
+                logging.exception('Writing checkpoint failed')
+            finally:
+                self.snapshots.task_done()
+
+    def _write(self, values, save_path, global_step, on_written):
+        folder = os.path.dirname(save_path) or '.'
+        name = '{}-{}'.format(os.path.basename(save_path), global_step)
+        temp_prefix = os.path.join(folder, '.tmp' + name)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.shadow_session.run(self.assign_ops, feed_dict=dict(zip(self.placeholders, values)))
+        self.saver.save(self.shadow_session, temp_prefix, write_meta_graph=False, write_state=False)
+        publish_files(checkpoint_files(folder, os.path.basename(temp_prefix)), folder, temp_prefix, name)
+        fsync_file(folder)
+
+        if folder not in self.scanned_folders:
+            self.scanned_folders.add(folder)
+            for previous_name, previous_step in existing_checkpoints(folder, os.path.basename(save_path)):
+                if previous_step < global_step:
+                    self._retain(folder, previous_name, previous_step)
+        self._retain(folder, name, global_step)
+        retained = dict(self.permanent, **self.kept)
+        tf.train.update_checkpoint_state(folder, name, all_model_checkpoint_paths=sorted(
+                retained, key=lambda n: retained[n]))
+        checkpoint = os.path.join(folder, name)
+        if on_written is not None:
+            on_written(checkpoint)
+
+    def _retain(self, folder, name, global_step):
+        if self.keep_every_steps > 0 and (self.last_permanent_step is None or
+                                          global_step - self.last_permanent_step >= self.keep_every_steps):
+            self.last_permanent_step = global_step
+            self.permanent[name] = global_step
+            return
+        self.kept[name] = global_step
+        while len(self.kept) > self.max_to_keep:
+            oldest = min(self.kept, key=lambda n: self.kept[n])
+            del self.kept[oldest]
+            for path in checkpoint_files(folder, oldest):
+                os.remove(path)
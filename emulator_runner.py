@@ -1,36 +1,97 @@
+import time
+import numpy as np
+from placement import pin
 from multiprocessing import Process
+from threading import Thread
+from episode_statistics import EpisodeRecorder
 
 
-class EmulatorRunner(Process):
+class EmulatorLoop(object):
+    """
+    Stepping loop shared by the process and thread emulator runners.
+    Subclasses provide the execution context (a Process or a Thread).
+    """
 
-    def __init__(self, id, emulators, variables, queue, barrier):
-        super(EmulatorRunner, self).__init__()
-        self.id = id
-        self.emulators = emulators
-        self.variables = variables
-        self.queue = queue
-        self.barrier = barrier
-
-    def run(self):
-        super(EmulatorRunner, self).run()
-        self._run()
+    def _create_emulators(self):
+        """ Builds this runner's emulators and writes their initial states. """
+        self.emulators = [self.environment_creator.create_environment(i) for i in self.emulator_ids]
+        for i, emulator in enumerate(self.emulators):
+            self.variables[0][i] = emulator.get_initial_state()
+        self.episode_rewards = np.zeros(len(self.emulators))
+        self.episode_steps = np.zeros(len(self.emulators), dtype=np.int64)
+        self.episode_recorder = EpisodeRecorder(self.id, *self.episode_buffers)
+        self.barrier.put(True)
 
     def _run(self):
+        # Before the emulators are created, so that their memory is allocated on the pinned node
+        pin(self.cpus)
+        self._create_emulators()
         count = 0
         while True:
             instruction = self.queue.get()
             if instruction is None:
                 break
+            start_time = time.perf_counter()
             for i, (emulator, action) in enumerate(zip(self.emulators, self.variables[-1])):
                 new_s, reward, episode_over = emulator.next(action)
+                self.episode_rewards[i] += reward
+                self.episode_steps[i] += 1
                 if episode_over:
+                    self.episode_recorder.record(self.episode_rewards[i], self.episode_steps[i])
+                    self.episode_rewards[i] = 0
+                    self.episode_steps[i] = 0
                     self.variables[0][i] = emulator.get_initial_state()
                 else:
                     self.variables[0][i] = new_s
                 self.variables[1][i] = reward
                 self.variables[2][i] = episode_over
+            self.step_times[self.id] = time.perf_counter() - start_time
             count += 1
             self.barrier.put(True)
 
 
+class EmulatorRunner(EmulatorLoop, Process):
+
+    def __init__(self, id, environment_creator, emulator_ids, variables, queue, barrier, step_times, episode_buffers,
+                 cpus=None):
+        super(EmulatorRunner, self).__init__()
+        self.id = id
+        self.environment_creator = environment_creator
+        self.emulator_ids = emulator_ids
+        self.variables = variables
+        self.queue = queue
+        self.barrier = barrier
+        self.step_times = step_times
+        self.episode_buffers = episode_buffers
+        self.cpus = cpus
+
+    def run(self):
+        super(EmulatorRunner, self).run()
+        self.variables = [var.numpy() for var in self.variables]
+        self.step_times = self.step_times.numpy()
+        self.episode_buffers = [buffer.numpy() for buffer in self.episode_buffers]
+        self._run()
+
+
+class EmulatorThreadRunner(EmulatorLoop, Thread):
+    """
+    Thread based emulator runner. The ALE wrapper calls into the C++ library through ctypes,
+    which releases the GIL for the duration of act() and getScreenGrayscale(), so several
+    of these threads step their emulators concurrently while sharing the actor's numpy buffers.
+    """
 
+    def __init__(self, id, environment_creator, emulator_ids, variables, queue, barrier, step_times, episode_buffers,
+                 cpus=None):
+        super(EmulatorThreadRunner, self).__init__(daemon=True)
+        self.id = id
+        self.environment_creator = environment_creator
+        self.emulator_ids = emulator_ids
+        self.variables = variables
+        self.queue = queue
+        self.barrier = barrier
+        self.step_times = step_times
+        self.episode_buffers = episode_buffers
+        self.cpus = cpus
+
+    def run(self):
+        self._run()
@@ -1,18 +1,74 @@
+import json
+import os
+
+ROM_METADATA_FILE = 'rom_metadata.json'
+
+
+def get_rom_metadata(rom_path, game):
+    """
+    Returns the minimal action set and screen dimensions of a ROM. They are read from a table
+    cached next to the ROMs, and the ROM is only loaded into ALE when it is not in the table yet.
+    :param rom_path: folder of the ROMs
+    :param game: name of the game
+    :return: dict with 'minimal_action_set' and 'screen_dims'
+    """
+    filename = os.path.join(rom_path, game + ".bin")
+    table_file = os.path.join(rom_path, ROM_METADATA_FILE)
+    rom_size = os.path.getsize(filename)
+
+    table = {}
+    if os.path.exists(table_file):
+        with open(table_file, 'r') as f:
+            table = json.load(f)
+    if game in table and table[game]['rom_size'] == rom_size:
+        return table[game]
+
+    from ale_python_interface import ALEInterface
+    ale_int = ALEInterface()
+    ale_int.loadROM(str.encode(filename))
+    table[game] = {'rom_size': rom_size,
+                   'minimal_action_set': [int(a) for a in ale_int.getMinimalActionSet()],
+                   'screen_dims': list(ale_int.getScreenDims())}
+    try:
+        tmp_file = table_file + '.{}.tmp'.format(os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(table, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, table_file)
+    except OSError:  # read-only ROM folder: probe again next time
+        pass
+    return table[game]
+
+
 class EnvironmentCreator(object):
 
     def __init__(self, args):
         """
-        Creates an object from which new environments can be created
+        Creates an object from which new environments can be created. It is picklable, so
+        the emulators can be created inside the emulator runners.
         :param args:
         """
 
-        from atari_emulator import AtariEmulator
-        from ale_python_interface import ALEInterface
-        filename = args.rom_path + "/" + args.game + ".bin"
-        ale_int = ALEInterface()
-        ale_int.loadROM(str.encode(filename))
-        self.num_actions = len(ale_int.getMinimalActionSet())
-        self.create_environment = lambda i: AtariEmulator(i, args)
-
-
+        self.args = args
+        self.synthetic_config = None
+        if args.game.startswith('synthetic'):
+            from synthetic_emulator import parse_synthetic_spec
+            self.synthetic_config = parse_synthetic_spec(args.game)
+            self.num_actions = self.synthetic_config['actions']
+        else:
+            self.rom_metadata = get_rom_metadata(args.rom_path, args.game)
+            self.num_actions = len(self.rom_metadata['minimal_action_set'])
+            if args.fast_ale:
+                # The fast path is only used once it reproduces the wrapper on this host and ROM
+                from fast_atari_emulator import check_equivalence
+                check_equivalence(args)
 
+    def create_environment(self, i):
+        actor_id = self.args.actor_id * self.args.emulator_counts + i
+        if self.synthetic_config is not None:
+            from synthetic_emulator import SyntheticEmulator
+            return SyntheticEmulator(actor_id, self.args, self.synthetic_config)
+        if self.args.fast_ale:
+            from fast_atari_emulator import FastAtariEmulator
+            return FastAtariEmulator(actor_id, self.args)
+        from atari_emulator import AtariEmulator
+        return AtariEmulator(actor_id, self.args)
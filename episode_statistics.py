@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    episode_statistics
+    Description  :    Episode returns and lengths recorded by the emulator workers into fixed-size
+                      ring buffers in shared memory.
+
+    Every worker owns one ring (a row of the buffers) and is its only writer, so no locks are
+    needed: a worker writes the entry, then publishes it by incrementing its counter. The actor
+    reads the rings without blocking the workers.
+"""
+
+import numpy as np
+
+
+def create_episode_buffers(workers, capacity):
+    """
+    :return: the zero-initialised (returns, lengths, counters, sums) arrays, with one row per worker.
+             counters holds the number of episodes written by each worker and sums the sum of the
+             returns currently in each ring.
+    """
+    return [np.zeros((workers, capacity), dtype=np.float64),
+            np.zeros((workers, capacity), dtype=np.float64),
+            np.zeros(workers, dtype=np.int64),
+            np.zeros(workers, dtype=np.float64)]
+
+
+class EpisodeRecorder(object):
+    """ Writer side, used by one emulator worker. """
+
+    def __init__(self, worker_id, returns, lengths, counters, sums):
+        self.returns = returns[worker_id]
+        self.lengths = lengths[worker_id]
+        self.counters = counters
+        self.sums = sums
+        self.worker_id = worker_id
+        self.capacity = self.returns.shape[0]
+
+    def record(self, episode_return, episode_length):
+        written = self.counters[self.worker_id]
+        i = written % self.capacity
+        self.sums[self.worker_id] += episode_return - (self.returns[i] if written >= self.capacity else 0.0)
+        self.returns[i] = episode_return
+        self.lengths[i] = episode_length
+        self.counters[self.worker_id] = written + 1
+
+
+class EpisodeStatistics(object):
+    """ Reader side, used by the actor. """
+
+    def __init__(self, returns, lengths, counters, sums):
+        self.returns = returns
+        self.lengths = lengths
+        self.counters = counters
+        self.sums = sums
+        self.capacity = returns.shape[1]
+        self.read_counters = np.zeros_like(counters)
+
+    def episodes(self):
+        """ Total number of episodes recorded. """
+        return int(self.counters.sum())
+
+    def mean(self):
+        """ Mean return over the episodes currently in the rings, in O(workers). """
+        filled = np.minimum(self.counters, self.capacity).sum()
+        return float(self.sums.sum() / filled) if filled > 0 else 0.0
+
+    def window(self):
+        """ Returns and lengths of the episodes currently in the rings. """
+        filled = np.minimum(self.counters, self.capacity)
+        mask = np.arange(self.capacity)[np.newaxis, :] < filled[:, np.newaxis]
+        return self.returns[mask], self.lengths[mask]
+
+    def percentiles(self, qs):
+        returns, _ = self.window()
+        if len(returns) == 0:
+            return [0.0] * len(qs)
+        return np.percentile(returns, qs).tolist()
+
+    def new_episodes(self):
+        """
+        Returns and lengths of the episodes recorded since the previous call. Episodes that were
+        overwritten in the meantime are skipped.
+        :return: (returns, lengths) arrays
+        """
+        counters = self.counters.copy()
+        returns, lengths = [], []
+        for w, (read, written) in enumerate(zip(self.read_counters, counters)):
+            read = max(read, written - self.capacity)
+            indices = np.arange(read, written) % self.capacity
+            returns.append(self.returns[w, indices])
+            lengths.append(self.lengths[w, indices])
+        self.read_counters = counters
+        return np.concatenate(returns), np.concatenate(lengths)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    evaluator
+    Description  :    Parallel evaluation of a policy with the emulator runners.
+"""
+
+import logging, time
+import numpy as np
+from runners import get_runners_backend
+
+
+class Evaluator(object):
+    def __init__(self, env_creator, policy, environments, workers, runner_backend='process', max_episode_steps=0):
+        """
+        Evaluates a policy on many emulators stepped in parallel by the runners.
+        :param env_creator: the EnvironmentCreator used to build the emulators
+        :param policy: an inference.Policy
+        :param environments: number of emulators run in parallel
+        :param workers: number of emulator runners (must divide environments)
+        :param runner_backend: 'process' or 'thread'
+        :param max_episode_steps: episodes still running after this many steps are cut off (0: no limit)
+        """
+        self.env_creator = env_creator
+        self.policy = policy
+        self.environments = environments
+        self.workers = workers
+        self.runner_backend = runner_backend
+        self.max_episode_steps = max_episode_steps
+
+    def evaluate(self, episodes):
+        """
+        Runs the given number of episodes. Emulators keep starting new episodes until enough
+        have been started; emulators that are done are removed from the inference batch
+        (their runners keep stepping them with no-ops until the last episode finishes).
+        :return: dict with the per-episode 'rewards', 'lengths' and 'truncated' flags
+        """
+        num_actions = self.env_creator.num_actions
+        variables = [(np.zeros((self.environments, 84, 84, 4), dtype=np.uint8)),
+                     (np.zeros(self.environments, dtype=np.float32)),
+                     (np.asarray([False] * self.environments, dtype=np.float32)),
+                     (np.zeros((self.environments, num_actions), dtype=np.float32))]
+        runners_class, emulator_runner_class = get_runners_backend(self.runner_backend)
+        runners = runners_class(emulator_runner_class, self.env_creator, self.workers, variables)
+        runners.start()
+        shared_states, shared_rewards, shared_episode_over, shared_actions = runners.get_shared_variables()
+
+        active = np.arange(self.environments) < episodes
+        started = int(active.sum())
+        episode_rewards = np.zeros(self.environments)
+        episode_lengths = np.zeros(self.environments, dtype=np.int64)
+        rewards, lengths, truncated = [], [], []
+
+        start_time = time.time()
+        while active.any():
+            indices = np.flatnonzero(active)
+            action_indices, _, _ = self.policy.choose_actions(shared_states[indices])
+            shared_actions[:] = 0.0
+            shared_actions[:, 0] = 1.0
+            shared_actions[indices, 0] = 0.0
+            shared_actions[indices, action_indices] = 1.0
+
+            runners.update_environments()
+            runners.wait_updated()
+
+            episode_rewards[indices] += shared_rewards[indices]
+            episode_lengths[indices] += 1
+            over = shared_episode_over[indices] > 0
+            cut = (self.max_episode_steps > 0) & (episode_lengths[indices] >= self.max_episode_steps)
+            for e in indices[np.logical_or(over, cut)]:
+                rewards.append(float(episode_rewards[e]))
+                lengths.append(int(episode_lengths[e]))
+                truncated.append(not shared_episode_over[e])
+                episode_rewards[e] = 0
+                episode_lengths[e] = 0
+                # A cut-off emulator is still in the middle of its game, so it does not start a new episode
+                if started < episodes and shared_episode_over[e]:
+                    started += 1
+                else:
+                    active[e] = False
+
+        runners.stop()
+        if len(rewards) < episodes:
+            logging.warning('Only {} of {} episodes finished: every emulator was cut off'.format(len(rewards), episodes))
+        logging.debug('Evaluated {} episodes in {:.1f}s'.format(len(rewards), time.time() - start_time))
+        return {'rewards': rewards, 'lengths': lengths, 'truncated': truncated}
+
+
+def summarize(results):
+    """
+    Mean, std, 95% confidence interval of the mean, min and max of the episode rewards. They are
+    None if no episode finished.
+    """
+    rewards = np.asarray(results['rewards'], dtype=np.float64)
+    if len(rewards) == 0:
+        return {'episodes': 0, 'mean': None, 'std': None, 'ci95': None, 'min': None, 'max': None,
+                'mean_length': None, 'truncated': int(np.sum(results['truncated']))}
+    half_width = 1.96 * rewards.std(ddof=1) / np.sqrt(len(rewards)) if len(rewards) > 1 else 0.0
+    return {'episodes': len(rewards),
+            'mean': float(rewards.mean()),
+            'std': float(rewards.std()),
+            'ci95': [float(rewards.mean() - half_width), float(rewards.mean() + half_width)],
+            'min': float(rewards.min()),
+            'max': float(rewards.max()),
+            'mean_length': float(np.mean(results['lengths'])),
+            'truncated': int(np.sum(results['truncated']))}
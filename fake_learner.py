@@ -8,7 +8,7 @@
 """
 
 import multiprocessing as mp, numpy as np, time
-from zmq_server import zmq_server_run
+from rollout_schema import decode_rollout, encode_rollout
 
 
 class FakeLearner:
@@ -19,13 +19,10 @@ class FakeLearner:
         """ train"""
         # time.sleep(5)
         for i in range(6):
-            dt = get_batch()
-            print(dt.__sizeof__())
+            rollout = get_batch()
+            print(rollout.states.shape, rollout.rewards.shape, rollout.actions.shape)
             print("get batch", i, "ok")
 
-            # print(len(data), data[0][1].shape, data[0][2].shape, data[0][3].shape)
-            # print("ok" if data[0][3] == np.ones(shape=(32,), dtype=np.float32) else "data wrong")
-
 
 def put_batch(data):
     queue.put(data)
@@ -38,13 +35,12 @@ def get_batch():
 
 
 def fake_server():
-    shared_states = np.zeros(shape=(5, 32, 84, 84, 4), dtype=np.uint8)
-    shared_actions = np.zeros(shape=(5, 32, 6), dtype=np.float32)
-    shared_rewards = np.zeros(shape=(5, 32,), dtype=np.float32)
-    data = list(enumerate(zip(shared_states, shared_actions, shared_rewards)))
-    print(data[0].__sizeof__(), data[1].__sizeof__())
-    put_batch(data[0])
-    put_batch(data[1])
+    states = np.zeros(shape=(6, 32, 84, 84, 4), dtype=np.uint8)
+    actions = np.zeros(shape=(5, 32), dtype=np.uint8)
+    rewards = np.zeros(shape=(5, 32,), dtype=np.float32)
+    rollout = decode_rollout(encode_rollout(states, rewards, rewards + 1, actions, rewards))
+    put_batch(rollout)
+    put_batch(rollout)
 
 
 if __name__ == '__main__':
@@ -52,5 +48,6 @@ if __name__ == '__main__':
     queue = mp.Queue(maxsize=10240)
     learner = FakeLearner()
     # mp.Process(target=fake_server).run()
+    from zmq_server import zmq_server_run
     mp.Process(target=zmq_server_run).run()
     learner.train()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    fast_atari_emulator
+    Description  :    AtariEmulator with its per-step ALE calls made directly through the C API.
+"""
+
+import ctypes, random
+from ctypes import c_int, c_void_p
+import numpy as np
+from atari_emulator import AtariEmulator, ACTION_REPEAT, FRAMES_IN_POOL
+
+
+def load_ale_c_api():
+    """
+    Opens the ALE C library used by ale_python_interface and binds the functions of the step,
+    with their argument and return types set once. The library is opened through a new handle so
+    that the bindings do not change those of ALEInterface.
+    """
+    from ale_python_interface import ale_python_interface
+    lib = ctypes.CDLL(ale_python_interface.ale_lib._name)
+    lib.act.argtypes = [c_void_p, c_int]
+    lib.act.restype = c_int
+    lib.getScreenGrayscale.argtypes = [c_void_p, c_void_p]
+    lib.getScreenGrayscale.restype = None
+    return lib
+
+
+class FastAtariEmulator(AtariEmulator):
+    """
+    Same emulator as AtariEmulator, but the action repeat and screen grabs of a step are one
+    step_repeat() call. It calls the bound C functions with the ALE pointer and the legal
+    actions converted once, and grabs the screens straight into the frame pool's preallocated
+    buffers. This skips the Python wrapper's argument conversion, legal action lookup and
+    screen copies.
+
+    The visualization (--visualize) needs the RGB screens, so it falls back to the wrapper.
+    """
+
+    def __init__(self, actor_id, args):
+        super(FastAtariEmulator, self).__init__(actor_id, args)
+        lib = load_ale_c_api()
+        self._act = lib.act
+        self._grab = lib.getScreenGrayscale
+        self._ale = c_void_p(self.ale.obj)
+        self._actions = [int(a) for a in self.legal_actions]
+        # The pool is max-pooled, so the order of its frames does not matter
+        self._screens = [frame.ctypes.data for frame in self.frame_pool.frame_pool]
+
+    def step_repeat(self, action, n=ACTION_REPEAT, grab_last_k=FRAMES_IN_POOL):
+        """
+        Repeats an action n times and grabs the grayscale screens of the last grab_last_k frames
+        into the frame pool.
+        :param action: index into the legal actions
+        :return: the sum of the rewards
+        """
+        if grab_last_k > len(self._screens):
+            raise Exception('Cannot grab more frames than the frame pool holds')
+        act, ale, legal_action = self._act, self._ale, self._actions[action]
+        reward = 0
+        for _ in range(n - grab_last_k):
+            reward += act(ale, legal_action)
+        for screen in self._screens[len(self._screens) - grab_last_k:]:
+            reward += act(ale, legal_action)
+            self._grab(ale, screen)
+        return reward
+
+    def _action_repeat(self, a, times=ACTION_REPEAT):
+        if self.call_on_new_frame:
+            return super(FastAtariEmulator, self)._action_repeat(a, times)
+        return self.step_repeat(a, times, FRAMES_IN_POOL)
+
+
+def check_equivalence(args, steps=500, seed=0):
+    """
+    Steps an AtariEmulator and a FastAtariEmulator of the same ROM and ALE seed with the same
+    random starts and actions, and compares their observations, rewards and terminals.
+    :param steps: number of next() calls compared, episodes are restarted when they end
+    :raise Exception: at the first step where the two emulators differ
+    """
+    emulators = [AtariEmulator(0, args), FastAtariEmulator(0, args)]
+    actions = np.eye(len(emulators[0].legal_actions), dtype=np.float32)[
+            np.random.RandomState(seed).randint(len(emulators[0].legal_actions), size=steps)]
+
+    def initial_states(episode):
+        states = []
+        for emulator in emulators:
+            # The random start waits use the random module
+            random.seed(seed + episode)
+            states.append(emulator.get_initial_state())
+        return states
+
+    episode = 0
+    states = initial_states(episode)
+    for t, action in enumerate(actions):
+        if not np.array_equal(states[0], states[1]):
+            raise Exception('FastAtariEmulator observation differs from AtariEmulator at step {}'.format(t))
+        (state, reward, terminal), (fast_state, fast_reward, fast_terminal) = [e.next(action) for e in emulators]
+        if reward != fast_reward or terminal != fast_terminal:
+            raise Exception('FastAtariEmulator reward or terminal differs from AtariEmulator at step {}'.format(t))
+        states = [state, fast_state]
+        if terminal:
+            episode += 1
+            states = initial_states(episode)
+    if not np.array_equal(states[0], states[1]):
+        raise Exception('FastAtariEmulator observation differs from AtariEmulator at step {}'.format(steps))
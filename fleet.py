@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    fleet
+    Description  :    Launch a fleet of actors (train.py processes) and, optionally, the rollout broker.
+
+    Every option not listed below is passed through to each train.py, e.g.
+        python3 fleet.py --actors 4 -df logs/fleet/ -- -g pong -ec 32 -ew 8
+"""
+
+import argparse, logging, os, signal, subprocess, sys, time
+from multiprocessing import Process
+from broker import run_broker
+from train import bool_arg
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--actors', default=2, type=int, help="Number of actor processes to launch on this host", dest="actors")
+    parser.add_argument('--actor_id_offset', default=0, type=int, help="Id of the first actor on this host, so seeds stay distinct across hosts", dest="actor_id_offset")
+    parser.add_argument('--broker', default=True, type=bool_arg, help="Whether to run the rollout broker on this host", dest="broker")
+    parser.add_argument('--broker_frontend', default='tcp://*:5555', type=str, help="Address the broker binds for the actors", dest="broker_frontend")
+    parser.add_argument('--broker_address', default='tcp://127.0.0.1:5555', type=str, help="Address the actors use to reach the broker", dest="broker_address")
+    parser.add_argument('--learners', default=['tcp://127.0.0.1:6666'], nargs='+', type=str, help="Addresses of the learner(s) the broker forwards to", dest="learners")
+    parser.add_argument('--learner_timeout', default=120, type=float, help="Seconds without a reply after which the broker stops sending batches to a learner and resends them to the others; 0 to disable", dest="learner_timeout")
+    parser.add_argument('--file_server_port', default=6668, type=int, help="Checkpoint upload port of the first actor; actor i uses port + i", dest="file_server_port")
+    parser.add_argument('-df', '--debugging_folder', default='logs/', type=str, help="Each actor logs to <folder>/actor_<id>/", dest="debugging_folder")
+    return parser
+
+
+def actor_command(args, actor_id, port, train_args):
+    return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train.py')] + train_args + \
+           ['--actor_id', str(actor_id),
+            '--learner_address', args.broker_address,
+            '--file_server_port', str(port),
+            '-df', os.path.join(args.debugging_folder, 'actor_{}'.format(actor_id))]
+
+
+def main(args, train_args):
+    broker_proc = None
+    if args.broker:
+        broker_proc = Process(target=run_broker, args=(args.broker_frontend, args.learners, 30, args.learner_timeout))
+        broker_proc.start()
+
+    actors = []
+    for i in range(args.actors):
+        actor_id = args.actor_id_offset + i
+        command = actor_command(args, actor_id, args.file_server_port + i, train_args)
+        logging.info('Starting actor {}: {}'.format(actor_id, ' '.join(command)))
+        actors.append(subprocess.Popen(command))
+
+    def shutdown(signal_number, frame):
+        logging.info('Signal {} detected, stopping the fleet.'.format(signal_number))
+        for actor in actors:
+            actor.send_signal(signal.SIGTERM)
+        for actor in actors:
+            actor.wait()
+        if broker_proc is not None:
+            broker_proc.terminate()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while any(actor.poll() is None for actor in actors):
+        time.sleep(1)
+    if broker_proc is not None:
+        broker_proc.terminate()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    args, train_args = get_arg_parser().parse_known_args()
+    train_args = [a for a in train_args if a != '--']
+    main(args, train_args)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    grpc_transport
+    Description  :    Rollouts over gRPC: the rollout_schema frames are packed into one message and sent
+                      through a generic unary method, so no .proto is needed and both sides use the same
+                      encode/decode logic as the ZMQ transport.
+"""
+
+import time
+from rollout_schema import decode_rollout, pack_frames, unpack_frames
+
+SERVICE = 'TransferBatchData'
+METHOD = 'SendRollout'
+OPTIONS = [('grpc.max_send_message_length', 256 * 1024 * 1024),
+           ('grpc.max_receive_message_length', 256 * 1024 * 1024)]
+
+
+def rollout_sender(address):
+    """
+    :param address: host:port of a rollout server
+    :return: send(frames) sending encode_rollout frames, returning the size of the message
+    """
+    import grpc
+    channel = grpc.insecure_channel(address, options=OPTIONS)
+    send_rollout = channel.unary_unary('/{}/{}'.format(SERVICE, METHOD))
+
+    def send(frames):
+        payload = pack_frames(frames)
+        send_rollout(payload)
+        return len(payload)
+
+    return send
+
+
+def serve_rollouts(address, on_rollout, max_workers=4):
+    """
+    Starts a gRPC server calling on_rollout(rollout_schema.Rollout) for every rollout received.
+    :return: the started grpc.Server
+    """
+    import grpc
+    from concurrent import futures
+
+    def send_rollout(request, context):
+        rollout = decode_rollout(unpack_frames(request))
+        rollout.header['received'] = time.time()
+        on_rollout(rollout)
+        return b''
+
+    handler = grpc.method_handlers_generic_handler(SERVICE, {
+        METHOD: grpc.unary_unary_rpc_method_handler(send_rollout)})
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers), handlers=[handler], options=OPTIONS)
+    server.add_insecure_port(address)
+    server.start()
+    return server
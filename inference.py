@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    inference
+    Description  :    Actor-side policies: compute (values, action probabilities) for a batch of states
+                      and sample the next actions.
+"""
+
+import numpy as np
+from profiler import NULL_PROFILER
+
+
+def sample_policy_action(probs):
+    """
+    Sample one action per row from the action probability distributions output by
+    the policy network, by inverting the cumulative distribution.
+    :param probs: (batch, num_actions) action probabilities
+    :return: (batch,) sampled action indices
+    """
+    cumulative = np.cumsum(probs, axis=1)
+    uniform = np.random.rand(probs.shape[0], 1) * cumulative[:, -1:]
+    action_indices = (cumulative <= uniform).sum(axis=1)
+    return np.minimum(action_indices, probs.shape[1] - 1)
+
+
+class Policy(object):
+    def predict(self, states):
+        """
+        Runs the policy and value heads on a batch of states.
+        :param states: (batch, 84, 84, 4) uint8 states
+        :return: (values, action probabilities) tuple
+        """
+        raise NotImplementedError()
+
+    def choose_actions(self, states, profiler=NULL_PROFILER):
+        """
+        Chooses the next action of every state in the batch.
+        :param states: (batch, 84, 84, 4) uint8 states
+        :param profiler: times the 'inference' and 'action_sampling' stages
+        :return: (action indices, values, action probabilities) tuple
+        """
+        with profiler.stage('inference'):
+            values, probs = self.predict(states)
+        with profiler.stage('action_sampling'):
+            action_indices = sample_policy_action(probs)
+        return action_indices, values, probs
+
+    def restore(self, checkpoint):
+        """
+        Loads new network parameters.
+        :param checkpoint: checkpoint path prefix, as returned by tf.train.latest_checkpoint
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class SessionPolicy(Policy):
+    """ Runs the actor's own network in its TensorFlow session. """
+
+    def __init__(self, network, session, saver):
+        self.network = network
+        self.session = session
+        self.saver = saver
+
+    def predict(self, states):
+        return self.session.run([self.network.output_layer_v, self.network.output_layer_pi],
+                                feed_dict={self.network.input_ph: states})
+
+    def restore(self, checkpoint):
+        self.saver.restore(self.session, checkpoint)
+
+
+class FrozenGraphPolicy(Policy):
+    """
+    Runs a frozen, constant-folded copy of the policy and value heads, with 8 bit weights if
+    quantize. It is exported on the first prediction (after the actor's session has been
+    initialized or restored) and again after every restore.
+    """
+
+    def __init__(self, network, session, saver, quantize=False, config=None):
+        self.network = network
+        self.session = session
+        self.saver = saver
+        self.quantize = quantize
+        self.config = config
+        self.frozen_session = None
+
+    def _export(self):
+        import tensorflow as tf
+        from tensorflow.tools.graph_transforms import TransformGraph
+
+        input_name = self.network.input_ph.op.name
+        output_names = [self.network.output_layer_v.op.name, self.network.output_layer_pi.op.name]
+        graph_def = tf.graph_util.convert_variables_to_constants(
+                self.session, self.session.graph.as_graph_def(), output_names)
+        transforms = ['strip_unused_nodes(type=uint8, shape="-1,84,84,4")',
+                      'remove_nodes(op=Identity)',
+                      'fold_constants(ignore_errors=true)',
+                      'merge_duplicate_nodes',
+                      'sort_by_execution_order']
+        if self.quantize:
+            transforms.insert(3, 'quantize_weights')
+        graph_def = TransformGraph(graph_def, [input_name], output_names, transforms)
+
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        if self.frozen_session is not None:
+            self.frozen_session.close()
+        config = self.config
+        if config is None:
+            config = tf.ConfigProto()
+            config.gpu_options.allow_growth = True
+        self.frozen_session = tf.Session(graph=graph, config=config)
+        self.input = graph.get_tensor_by_name(input_name + ':0')
+        self.outputs = [graph.get_tensor_by_name(name + ':0') for name in output_names]
+
+    def predict(self, states):
+        if self.frozen_session is None:
+            self._export()
+        return self.frozen_session.run(self.outputs, feed_dict={self.input: states})
+
+    def restore(self, checkpoint):
+        self.saver.restore(self.session, checkpoint)
+        self._export()
+
+    def close(self):
+        if self.frozen_session is not None:
+            self.frozen_session.close()
+
+
+class NumpyPolicy(Policy):
+    """
+    Runs the forward pass with numpy_network.NumpyNetwork instead of TensorFlow. The parameters
+    are copied out of the actor's session on the first prediction (after it has been initialized
+    or restored) and later read straight from the uploaded checkpoints.
+    """
+
+    def __init__(self, engine, session=None):
+        self.engine = engine
+        self.session = session
+
+    def _load_from_session(self):
+        import tensorflow as tf
+        variables = {v.op.name: v for v in tf.trainable_variables()}
+        names = self.engine.match_variables(list(variables))
+        self.engine.set_weights(self.session.run({name: variables[full] for name, full in names.items()}))
+
+    def predict(self, states):
+        if self.engine.weights is None:
+            self._load_from_session()
+        return self.engine.predict(states)
+
+    def restore(self, checkpoint):
+        self.engine.load_checkpoint(checkpoint)
+
+
+class RemotePolicy(Policy):
+    """
+    Sends the states to a batched inference server (inference_server.py) and receives the
+    sampled actions. The server owns the parameters, so restore() is a no-op.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.socket = None
+
+    def _connect(self):
+        # Connected on first use, so that processes forked by the actor do not inherit the socket
+        import zmq
+        from zmq_serialize import SerializingContext
+        self.socket = SerializingContext.instance().socket(zmq.REQ)
+        self.socket.connect(self.address)
+
+    def predict(self, states):
+        _, values, probs = self.choose_actions(states)
+        return values, probs
+
+    def choose_actions(self, states, profiler=NULL_PROFILER):
+        if self.socket is None:
+            self._connect()
+        # Sampling happens on the server, so the whole round trip is timed as inference
+        with profiler.stage('inference'):
+            self.socket.send_array(states, copy=False)
+            action_indices = self.socket.recv_array()
+            values = self.socket.recv_array()
+            probs = self.socket.recv_array()
+        return action_indices, values, probs
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+
+
+def create_policy(args, network, session, saver):
+    """
+    Creates the policy selected with --inference_mode.
+    """
+    if args.inference_mode == 'session':
+        return SessionPolicy(network, session, saver)
+    elif args.inference_mode in ('frozen', 'frozen_int8'):
+        import tensorflow as tf
+        config = tf.ConfigProto(intra_op_parallelism_threads=args.intra_op_threads,
+                                inter_op_parallelism_threads=args.inter_op_threads)
+        config.gpu_options.allow_growth = True
+        return FrozenGraphPolicy(network, session, saver, quantize=args.inference_mode == 'frozen_int8', config=config)
+    elif args.inference_mode == 'numpy':
+        from numpy_network import NumpyNetwork
+        return NumpyPolicy(NumpyNetwork(args.arch, args.num_actions, network.name), session)
+    elif args.inference_mode == 'remote':
+        return RemotePolicy(args.inference_address)
+    else:
+        raise Exception('Inference mode not recognized')
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    inference_server
+    Description  :    Batched inference server shared by many actors.
+
+    Actors started with --inference_mode remote send their states here. Requests are merged
+    until --max_batch states are pending or the oldest request has waited --max_latency_ms,
+    then one forward pass is run and every actor gets back its action indices, values and
+    action probabilities.
+"""
+
+import argparse, logging, os, sys, time, json
+import numpy as np
+import zmq
+
+
+class InferenceServer(object):
+    def __init__(self, policy, address, max_batch, max_latency, checkpoint_folder=None, checkpoint_poll_interval=5.0):
+        """
+        :param policy: the inference.Policy used for the forward pass
+        :param address: the address to bind
+        :param max_batch: number of states after which a batch is run without waiting further
+        :param max_latency: seconds the oldest pending request may wait for more requests
+        :param checkpoint_folder: folder polled for new parameters
+        """
+        self.policy = policy
+        self.address = address
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.checkpoint_folder = checkpoint_folder
+        self.checkpoint_poll_interval = checkpoint_poll_interval
+        self.latest_ckpt = None
+
+    @staticmethod
+    def _decode(frames):
+        identity, empty, md, data = frames
+        md = json.loads(md.bytes.decode())
+        states = np.frombuffer(data.buffer, dtype=md['dtype']).reshape(md['shape'])
+        return identity, states
+
+    @staticmethod
+    def _encode(array):
+        array = np.ascontiguousarray(array)
+        return [json.dumps(dict(dtype=str(array.dtype), shape=array.shape)).encode(), array]
+
+    def poll_checkpoint(self):
+        import tensorflow as tf
+        try:
+            cur_ckpt = tf.train.latest_checkpoint(self.checkpoint_folder)
+            if cur_ckpt and cur_ckpt != self.latest_ckpt:
+                self.policy.restore(cur_ckpt)
+                self.latest_ckpt = cur_ckpt
+                logging.info('Inference server restored {}'.format(cur_ckpt))
+        except ValueError:  # if the checkpoint is written: state error
+            pass
+
+    def run(self):
+        ctx = zmq.Context()
+        socket = ctx.socket(zmq.ROUTER)
+        socket.bind(self.address)
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+
+        batches, requests, states_served = 0, 0, 0
+        last_poll = last_report = time.time()
+        while True:
+            pending, pending_states = [], 0
+            deadline = None
+            while pending_states < self.max_batch:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                timeout = 1000 if deadline is None else max(0, (deadline - time.time()) * 1000)
+                if not poller.poll(timeout):
+                    if deadline is None:
+                        continue
+                    break
+                identity, states = self._decode(socket.recv_multipart(copy=False))
+                if deadline is None:
+                    deadline = time.time() + self.max_latency
+                pending.append((identity, states))
+                pending_states += states.shape[0]
+
+            action_indices, values, probs = self.policy.choose_actions(
+                    np.concatenate([states for _, states in pending]))
+            offset = 0
+            for identity, states in pending:
+                end = offset + states.shape[0]
+                socket.send_multipart([identity, b''] +
+                                      self._encode(action_indices[offset:end]) +
+                                      self._encode(values[offset:end]) +
+                                      self._encode(probs[offset:end]), copy=False)
+                offset = end
+
+            batches += 1
+            requests += len(pending)
+            states_served += pending_states
+            if self.checkpoint_folder and time.time() - last_poll >= self.checkpoint_poll_interval:
+                self.poll_checkpoint()
+                last_poll = time.time()
+            if time.time() - last_report >= 30:
+                logging.info('Inference server: {:.1f} batches/s, {:.1f} requests/batch, {:.1f} states/batch'
+                             .format(batches / (time.time() - last_report), requests / batches, states_served / batches))
+                batches, requests, states_served = 0, 0, 0
+                last_report = time.time()
+
+
+def get_arg_parser():
+    from train import bool_arg
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--folder', type=str, help="Training folder: args.json is read from it and parameters from its upload/ and checkpoints/ subfolders", dest="folder", required=True)
+    parser.add_argument('-d', '--device', default='/gpu:0', type=str, help="Device to be used ('/cpu:0', '/gpu:0', '/gpu:1',...)", dest="device")
+    parser.add_argument('--address', default='tcp://*:6670', type=str, help="Address to bind for the actors", dest="address")
+    parser.add_argument('--max_batch', default=256, type=int, help="Max. number of states in one forward pass", dest="max_batch")
+    parser.add_argument('--max_latency_ms', default=2.0, type=float, help="Max. time the oldest request waits for a batch to fill", dest="max_latency_ms")
+    parser.add_argument('--poll_checkpoints', default=True, type=bool_arg, help="Whether to poll the upload folder for new parameters", dest="poll_checkpoints")
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    args = get_arg_parser().parse_args()
+
+    import tensorflow as tf
+    import logger_utils
+    from train import get_network_and_environment_creator
+    from inference import SessionPolicy
+
+    folder = args.folder
+    for k, v in logger_utils.load_args(os.path.join(folder, 'args.json')).items():
+        if k not in vars(args):
+            setattr(args, k, v)
+    args.actor_id = 0
+
+    network_creator, _ = get_network_and_environment_creator(args)
+    network = network_creator()
+    saver = tf.train.Saver()
+    config = tf.ConfigProto()
+    if 'gpu' in args.device:
+        config.gpu_options.allow_growth = True
+    session = tf.Session(config=config)
+    network.init(os.path.join(folder, 'checkpoints'), saver, session)
+
+    checkpoint_folder = os.path.join(folder, 'upload') if args.poll_checkpoints else None
+    InferenceServer(SessionPolicy(network, session, saver), args.address, args.max_batch,
+                    args.max_latency_ms / 1000.0, checkpoint_folder).run()
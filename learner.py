@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    learner
+    Description  :    Learner for remote actors: trains on merged rollout batches received from the
+                      actors (directly or through broker.py) and uploads new parameters to them.
+"""
+
+import collections, copy, logging, os, signal, sys, time, zmq
+import numpy as np
+from multiprocessing import Process, Queue
+import tensorflow as tf
+from actor_learner import ActorLearner
+from checkpointing import AsyncCheckpointer
+from zmq_serialize import SerializingContext
+from rollout_schema import decode_rollout, one_hot, behaviour_action_probs
+from profiler import RollingHistogram, StageProfiler
+from admission import AdmissionController, RateLimiter
+from replay import ReplayBuffer
+from allreduce import SharedMemoryAllReduce
+
+
+def receive_zmq_batch_data(queue, address, rate_limiter):
+    """
+    Receives rollouts on a REP socket, decodes them and puts them on the queue. The reply is only
+    sent once the rate limiter admits the rollout and it is queued, so actors are slowed down when
+    the learner falls behind.
+    """
+    ctx = SerializingContext()
+    rep = ctx.socket(zmq.REP)
+    rep.bind(address)
+    while True:
+        rollout = decode_rollout(rep.recv_multipart(copy=False))
+        rollout.header['received'] = time.time()
+        rate_limiter.insert(rollout.rewards.size)
+        queue.put(rollout)
+        rep.send_string("received data.")
+
+
+def upload_checkpoint(checkpoint, file_servers):
+    """
+    Posts the files of a checkpoint to the actors' upload servers (paac.upload_network).
+    :param checkpoint: checkpoint path prefix
+    :param file_servers: http://host:port addresses of the actors' file servers
+    """
+    import requests
+    folder, prefix = os.path.split(checkpoint)
+    names = [name for name in os.listdir(folder) if name.startswith(prefix + '.')]
+    for file_server in file_servers:
+        files = [('files', (name, open(os.path.join(folder, name), 'rb'))) for name in names]
+        try:
+            requests.post(file_server + '/d3rl/network', files=files, timeout=30)
+        except requests.RequestException as e:
+            logging.warning("Upload to {} failed: {}".format(file_server, e))
+        finally:
+            for _, (_, f) in files:
+                f.close()
+
+
+class Learner(ActorLearner):
+    """
+    Trains on rollouts from any number of actors. Rollouts are flattened into samples, and every
+    gradient step uses exactly batch_size samples, independently of how many actors there are and
+    of their emulator counts. A step can be split into micro_batches forward/backward passes whose
+    gradients are accumulated before a single clipped update, to fit large batches in memory.
+
+    global_step counts the samples trained on, so get_lr anneals the learning rate over samples
+    consumed whatever the batch size.
+
+    The learner also traces the rollouts: the policy lag (learner updates between the parameters
+    a rollout was produced with and those it is trained on) and the time spent in each hop from
+    the actor to the gradient step. The hops are measured with the wall clocks of different hosts
+    when the actors are remote.
+
+    With a replay memory, admitted rollouts are also stored in a ReplayBuffer and a fraction of
+    every batch is made of replayed segments. Their values and bootstrap are recomputed with the
+    current parameters, and with prioritized replay their samples are weighted by the importance
+    weights and their priorities set to the mean absolute advantage. Replayed samples are
+    off-policy for the A2C loss: they are also weighted by the truncated importance ratios
+    min(replay_is_clip, pi(a|s) / mu(a|s)) of the current and behaviour policies, which bounds
+    their variance but leaves a bias. Only rollouts that carry the behaviour probabilities are
+    stored.
+
+    Data-parallel training: with an allreduce, this learner is one of its world_size ranks. Each
+    rank trains on its own shard of the rollouts, the gradients are averaged with the allreduce and
+    every rank applies the same clipped update, so the ranks start from rank 0's variables and stay
+    identical. A step then trains on batch_size * world_size samples. Only rank 0 saves and uploads
+    checkpoints.
+    """
+
+    def __init__(self, network_creator, environment_creator, args, rank=0, allreduce=None):
+        super(Learner, self).__init__(network_creator, environment_creator, args)
+        self.rank = rank
+        self.allreduce = allreduce
+        self.world_size = allreduce.world_size if allreduce is not None else 1
+        self.batch_size = args.learner_batch_size or self.max_local_steps * self.emulator_counts
+        self.samples_per_update = self.batch_size * self.world_size
+        self.micro_batches = args.learner_micro_batches
+        if self.micro_batches < 1 or self.micro_batches > self.batch_size:
+            raise Exception('Number of micro-batches must be between 1 and the batch size')
+        self.file_servers = args.actor_file_servers
+        self.upload_interval = args.upload_interval
+        self.pending = []
+        self.pending_samples = 0
+        # [header, samples not trained on yet] of the pending rollouts, and of those completed by the last batch
+        self.pending_rollouts = collections.deque()
+        self.batch_rollouts = []
+        self.policy_lag = RollingHistogram()
+        self.latency = StageProfiler()
+        self.latency_file = os.path.join(self.debugging_folder, 'rollout_latency.json')
+        self.upload_checkpointer = None
+
+        # Applies gradients accumulated outside of the graph, clipped like train_step
+        self.accumulated_gradients_ph = tf.placeholder(tf.float32, self.flat_raw_gradients.shape,
+                                                       name='accumulated_gradients')
+        sizes = [int(np.prod(v.shape.as_list())) for v in self.gradient_variables]
+        gradients = [tf.reshape(g, v.shape) for g, v in
+                     zip(tf.split(self.accumulated_gradients_ph, sizes), self.gradient_variables)]
+        grads_and_vars, _ = self._clip_gradients(list(zip(gradients, self.gradient_variables)),
+                                                 args.clip_norm_type, args.clip_norm)
+        self.apply_accumulated_gradients = self.optimizer.apply_gradients(grads_and_vars)
+
+        # Loads rank 0's variables, broadcast as one flat vector
+        self.synced_variables = [v for v in tf.global_variables() if v.dtype.base_dtype == tf.float32]
+        sizes = [int(np.prod(v.shape.as_list())) for v in self.synced_variables]
+        self.synced_values_ph = tf.placeholder(tf.float32, [sum(sizes)], name='synced_values')
+        self.assign_synced_values = tf.group(*[tf.assign(v, tf.reshape(value, v.shape)) for v, value in
+                                               zip(self.synced_variables, tf.split(self.synced_values_ph, sizes))])
+
+        self.admission = AdmissionController(args.max_policy_lag, args.stale_rollouts)
+        self.rate_limiter = RateLimiter(args.samples_per_insert, args.max_insert_lead)
+        self.rollout_queue = Queue(maxsize=args.learner_queue_size)
+        self.receiver_proc = Process(target=receive_zmq_batch_data,
+                                     kwargs={'queue': self.rollout_queue, 'address': args.learner_bind_address,
+                                             'rate_limiter': self.rate_limiter},
+                                     daemon=True)
+
+        self.replay = None
+        self.replay_segments = 0
+        self.replay_min_segments = args.replay_min_segments
+        if args.replay_memory_gb > 0:
+            self.replay = ReplayBuffer(int(args.replay_memory_gb * 2 ** 30), self.max_local_steps,
+                                       compression=args.replay_compression, workers=args.replay_workers,
+                                       prioritized=args.replay_prioritized, alpha=args.replay_alpha,
+                                       beta=args.replay_beta)
+            self.replay_segments = int(round(self.batch_size * args.replay_fraction / self.max_local_steps))
+            if self.replay_segments * self.max_local_steps >= self.batch_size:
+                raise Exception('Replay fraction must leave room for fresh samples in a batch')
+            self.replay_is_clip = args.replay_is_clip
+            if self.replay_segments > 0:
+                logging.warning('Replaying {:.0%} of every batch: replayed samples are off-policy and only corrected '
+                                'by importance ratios truncated at {}, so the policy gradient is biased'
+                                .format(self.replay_segments * self.max_local_steps / self.batch_size,
+                                        self.replay_is_clip))
+        self.replayed_numbers = None
+        self.replayed_advantages = None
+        self.missing_behaviour_probs = False
+
+    def add_rollout(self, rollout):
+        """
+        Computes the n-step returns and advantages of a rollout and appends its samples to the
+        pending ones, unless the admission controller drops it.
+        :param rollout: rollout_schema.Rollout
+        """
+        param_version = rollout.header.get('param_version')
+        lag = None if param_version is None else (self.global_step - param_version) / self.samples_per_update
+        weight = self.admission.weight(lag)
+        if weight == 0.0:
+            self.rate_limiter.consume(rollout.rewards.size)
+            return
+
+        if self.replay is not None and rollout.rewards.shape[0] == self.replay.steps:
+            if rollout.behaviour_probs is not None:
+                self.replay.insert(rollout, source=rollout.header.get('actor_id', 0))
+            elif not self.missing_behaviour_probs:
+                self.missing_behaviour_probs = True
+                logging.warning('Rollouts without behaviour probabilities are not replayed')
+
+        samples, _ = self.rollout_samples(*rollout[:5], weights=np.full(rollout.rewards.shape, weight, dtype=np.float32))
+        self.pending.append(samples)
+        self.pending_samples += len(samples[1])
+        self.pending_rollouts.append([rollout.header, len(samples[1])])
+
+    def rollout_samples(self, states, rewards, masks, actions, values, weights, bootstrap_values=None):
+        """
+        Computes the n-step returns and advantages of (T, N) rollout arrays.
+        :param weights: (T, N) sample weights
+        :param bootstrap_values: (N,) values of the last states, computed with the network if None
+        :return: samples (states, targets, advantages, one-hot actions, weights) flattened over T and N,
+                 and the (T, N) advantages
+        """
+        steps = rewards.shape[0]
+        if bootstrap_values is None:
+            bootstrap_values = self.session.run(self.network.output_layer_v,
+                                                feed_dict={self.network.input_ph: states[-1]})
+        estimated_return = bootstrap_values
+        y_batch = np.empty(rewards.shape, dtype=np.float32)
+        for t in reversed(range(steps)):
+            estimated_return = rewards[t] + self.gamma * estimated_return * masks[t]
+            y_batch[t] = estimated_return
+        adv_batch = y_batch - values
+
+        samples = (states[:-1].reshape((-1,) + states.shape[2:]),
+                   y_batch.reshape(-1),
+                   adv_batch.reshape(-1),
+                   one_hot(actions, self.num_actions).reshape(-1, self.num_actions),
+                   weights.reshape(-1))
+        return samples, adv_batch
+
+    def replayed_samples(self):
+        """
+        Samples replay_segments segments from the replay memory, with values recomputed by the
+        current network and sample weights multiplied by the truncated importance ratios.
+        :return: samples like rollout_samples
+        """
+        self.replayed_numbers, (states, rewards, masks, actions, _, behaviour_probs), weights = \
+            self.replay.sample(self.replay_segments)
+        values, probs = self.session.run([self.network.output_layer_v, self.network.output_layer_pi],
+                                         feed_dict={self.network.input_ph: states.reshape((-1,) + states.shape[2:])})
+        values = values.reshape(states.shape[:2])
+        probs = behaviour_action_probs(probs.reshape(states.shape[:2] + (-1,))[:-1], actions)
+        ratios = np.minimum(self.replay_is_clip, probs / np.maximum(behaviour_probs, 1e-8))
+        samples, adv_batch = self.rollout_samples(states, rewards, masks, actions, values[:-1],
+                                                  weights=(weights * ratios).astype(np.float32),
+                                                  bootstrap_values=values[-1])
+        self.replayed_advantages = np.abs(adv_batch).mean(axis=0)
+        return samples
+
+    def next_batch(self):
+        """
+        :return: batch_size samples (states, targets, advantages, actions, weights) from the pending
+                 rollouts, oldest first, followed by the replayed ones if any, or None if there are
+                 not enough yet
+        """
+        replaying = self.replay is not None and len(self.replay) >= self.replay_min_segments
+        fresh = self.batch_size - (self.replay_segments * self.max_local_steps if replaying else 0)
+        if self.pending_samples < fresh:
+            return None
+        merged = [np.concatenate(parts) for parts in zip(*self.pending)]
+        batch = [m[:fresh] for m in merged]
+        if self.pending_samples > fresh:
+            self.pending = [tuple(m[fresh:] for m in merged)]
+        else:
+            self.pending = []
+        self.pending_samples -= fresh
+
+        self.batch_rollouts = []
+        remaining = fresh
+        while remaining > 0:
+            taken = min(remaining, self.pending_rollouts[0][1])
+            self.pending_rollouts[0][1] -= taken
+            remaining -= taken
+            if self.pending_rollouts[0][1] == 0:
+                self.batch_rollouts.append(self.pending_rollouts.popleft()[0])
+
+        self.replayed_numbers = None
+        if replaying and self.replay_segments > 0:
+            batch = [np.concatenate(parts) for parts in zip(batch, self.replayed_samples())]
+        return batch
+
+    def trace_rollouts(self, headers, trained_step, trained_time):
+        """
+        Records the policy lag and latencies of the rollouts whose last samples were just trained on.
+        :param trained_step: global_step of the parameters the batch was trained on
+        """
+        for header in headers:
+            if header.get('param_version') is not None:
+                self.policy_lag.add((trained_step - header['param_version']) / self.samples_per_update)
+            if 'created' not in header:
+                continue
+            self.latency.record('collection', header['enqueued'] - header['created'])
+            self.latency.record('actor_queue', header['sent'] - header['enqueued'])
+            self.latency.record('transfer', header['received'] - header['sent'])
+            self.latency.record('learner_queue', trained_time - header['received'])
+            self.latency.record('end_to_end', trained_time - header['created'])
+
+    def write_traces(self):
+        lag = self.policy_lag.summary()
+        self.latency.write_summaries(self.summary_writer, self.global_step)
+        self.summary_writer.add_summary(tf.Summary(value=[
+            tf.Summary.Value(tag='rollouts/policy_lag_p50', simple_value=lag['p50']),
+            tf.Summary.Value(tag='rollouts/policy_lag_p99', simple_value=lag['p99'])]), self.global_step)
+        self.summary_writer.flush()
+        self.latency.write_json(self.latency_file, global_step=self.global_step, policy_lag_updates=lag)
+        end_to_end = self.latency.summary().get('end_to_end', {'p50': 0.0, 'p99': 0.0})
+        logging.info("Policy lag p50 {:.1f} p99 {:.1f} updates, end-to-end latency p50 {:.0f} p99 {:.0f} ms, "
+                     "rollouts admitted {} down-weighted {} dropped {}, insert lead {:.0f} samples"
+                     .format(lag['p50'], lag['p99'], end_to_end['p50'], end_to_end['p99'], self.admission.admitted,
+                             self.admission.downweighted, self.admission.dropped, self.rate_limiter.lead()))
+
+    def train_on_batch(self, batch, summaries_op=None):
+        """
+        Runs one gradient step on a batch from next_batch.
+        :param summaries_op: if given (and there is a single micro-batch), also evaluated and returned
+        """
+        lr = self.get_lr()
+        summaries = None
+        if self.micro_batches == 1 and self.allreduce is None:
+            states, y_batch, adv_batch, actions, weights = batch
+            feed_dict = {self.network.input_ph: states,
+                         self.network.critic_target_ph: y_batch,
+                         self.network.selected_action_ph: actions,
+                         self.network.adv_actor_ph: adv_batch,
+                         self.network.sample_weight_ph: weights,
+                         self.learning_rate: lr}
+            if summaries_op is None:
+                self.session.run(self.train_step, feed_dict=feed_dict)
+            else:
+                _, summaries = self.session.run([self.train_step, summaries_op], feed_dict=feed_dict)
+        else:
+            # The loss is a mean over the batch, so the micro-batch gradients are weighted by size
+            accumulated = None
+            for states, y_batch, adv_batch, actions, weights in zip(*[np.array_split(a, self.micro_batches)
+                                                                      for a in batch]):
+                feed_dict = {self.network.input_ph: states,
+                             self.network.critic_target_ph: y_batch,
+                             self.network.selected_action_ph: actions,
+                             self.network.adv_actor_ph: adv_batch,
+                             self.network.sample_weight_ph: weights}
+                gradients = self.session.run(self.flat_raw_gradients, feed_dict=feed_dict)
+                gradients *= len(y_batch) / self.batch_size
+                if accumulated is None:
+                    accumulated = gradients
+                else:
+                    accumulated += gradients
+            if self.allreduce is not None:
+                accumulated = self.allreduce.allreduce(self.rank, accumulated)
+            self.session.run(self.apply_accumulated_gradients,
+                             feed_dict={self.accumulated_gradients_ph: accumulated, self.learning_rate: lr})
+        self.global_step += self.samples_per_update
+        self.rate_limiter.consume(self.batch_size)
+        if self.replayed_numbers is not None:
+            self.replay.update_priorities(self.replayed_numbers, self.replayed_advantages)
+        return summaries
+
+    def train(self):
+        """
+        Main learner loop: merges the received rollouts into batches and trains on them.
+        """
+        self.global_step = self.init_network()
+        if self.allreduce is not None:
+            self.sync_variables()
+        if self.rank == 0:
+            self.upload_checkpointer = AsyncCheckpointer(self.session, tf.global_variables(), max_to_keep=1)
+        self.receiver_proc.start()
+        logging.info("Learner {} of {} listening for rollouts, {} samples per step in {} micro-batch(es)"
+                     .format(self.rank, self.world_size, self.batch_size, self.micro_batches))
+        if self.replay is not None:
+            logging.info("Replay memory of {} frames, {} replayed segments of {} steps per step"
+                         .format(self.replay.frames.max_frames, self.replay_segments, self.max_local_steps))
+
+        summaries_op = tf.summary.merge_all()
+        updates, rollouts = 0, 0
+        global_step_start = last_report_step = self.global_step
+        start_time = last_report = time.time()
+
+        while self.global_step < self.max_global_steps:
+            self.add_rollout(self.rollout_queue.get())
+            rollouts += 1
+            batch = self.next_batch()
+            while batch is not None:
+                summaries = self.train_on_batch(batch, summaries_op if updates % 100 == 0 else None)
+                self.trace_rollouts(self.batch_rollouts, self.global_step - self.samples_per_update, time.time())
+                updates += 1
+                if summaries is not None:
+                    self.summary_writer.add_summary(summaries, self.global_step)
+                    self.summary_writer.flush()
+                if self.rank == 0 and self.file_servers and updates % self.upload_interval == 0:
+                    self.upload()
+                self.save_vars()
+                batch = self.next_batch()
+
+            if time.time() - last_report >= 30:
+                curr_time = time.time()
+                logging.info("Trained on {} samples, at {:.0f} samples/s ({:.0f} samples/s avg), {} updates, "
+                             "{} rollouts, {} rollouts queued"
+                             .format(self.global_step,
+                                     (self.global_step - last_report_step) / (curr_time - last_report),
+                                     (self.global_step - global_step_start) / (curr_time - start_time),
+                                     updates, rollouts, self.rollout_queue.qsize()))
+                last_report, last_report_step = curr_time, self.global_step
+                self.write_traces()
+                if self.replay is not None:
+                    logging.info("Replay memory: {} segments, {} frames".format(len(self.replay),
+                                                                               len(self.replay.frames)))
+
+        self.cleanup()
+
+    def sync_variables(self):
+        """ Loads rank 0's variables and global step on every rank. """
+        values = np.concatenate([np.reshape(v, -1) for v in self.session.run(self.synced_variables)])
+        values, self.global_step = self.allreduce.broadcast(self.rank, values, self.global_step)
+        if self.rank != 0:
+            self.session.run(self.assign_synced_values, feed_dict={self.synced_values_ph: values})
+        self.last_saving_step = self.global_step
+
+    def upload(self):
+        self.upload_checkpointer.save(self.upload_checkpoint_folder, self.global_step,
+                                      on_written=lambda checkpoint: upload_checkpoint(checkpoint, self.file_servers))
+
+    def save_vars(self, force=False):
+        if self.rank == 0:
+            super(Learner, self).save_vars(force)
+
+    def cleanup(self):
+        if self.upload_checkpointer is not None:
+            self.upload_checkpointer.close()
+            self.upload_checkpointer = None
+        super(Learner, self).cleanup()
+        if self.replay is not None:
+            self.replay.close()
+        if self.receiver_proc.is_alive():
+            self.receiver_proc.terminate()
+
+
+def get_arg_parser():
+    from train import get_arg_parser as get_train_arg_parser, bool_arg
+    parser = get_train_arg_parser()
+    parser.add_argument('--learner_bind_address', default='tcp://*:6666', type=str, help="Address the learner receives rollouts on. Default is tcp://*:6666.", dest="learner_bind_address")
+    parser.add_argument('--learner_batch_size', default=0, type=int, help="Samples (emulator steps) per gradient step, merged from the rollouts of all actors. Default: max_local_steps * emulator_counts, as in a single actor.", dest="learner_batch_size")
+    parser.add_argument('--learner_micro_batches', default=1, type=int, help="Split every gradient step into this many forward/backward passes, accumulating the gradients. Default is 1.", dest="learner_micro_batches")
+    parser.add_argument('--learner_queue_size', default=64, type=int, help="Max. number of received rollouts waiting to be trained on. Default is 64.", dest="learner_queue_size")
+    parser.add_argument('--max_policy_lag', default=0, type=float, help="Rollouts produced more than this many learner updates ago are dropped or down-weighted (see --stale_rollouts). Default is 0 (admit all).", dest="max_policy_lag")
+    parser.add_argument('--stale_rollouts', default='drop', choices=['drop', 'downweight'], type=str, help="What to do with rollouts older than --max_policy_lag: drop them, or weight their samples by max_policy_lag / lag. Default is drop.", dest="stale_rollouts")
+    parser.add_argument('--samples_per_insert', default=1.0, type=float, help="Target ratio of samples trained on to samples received, for the rate limiter. Default is 1.", dest="samples_per_insert")
+    parser.add_argument('--max_insert_lead', default=0, type=int, help="Max. number of received samples (times --samples_per_insert) the learner may be behind on before actors are held back; at least one batch plus one rollout. Default is 0 (only the queue size limits them).", dest="max_insert_lead")
+    parser.add_argument('--replay_memory_gb', default=0, type=float, help="Size of the replay memory in GiB of (compressed) frames. Default is 0 (no replay).", dest="replay_memory_gb")
+    parser.add_argument('--replay_compression', default='none', choices=['none', 'lz4', 'zlib'], type=str, help="Compression of the frames in the replay memory; lz4 needs the lz4 package. Default is none.", dest="replay_compression")
+    parser.add_argument('--replay_fraction', default=0.5, type=float, help="Fraction of every batch made of replayed segments, rounded to whole segments of max_local_steps. Replayed samples are off-policy for the A2C loss and are only corrected by truncated importance ratios (--replay_is_clip), so a larger fraction adds more bias. With replay, set --samples_per_insert to 1 / (1 - replay_fraction) to rate-limit the fresh samples. Default is 0.5.", dest="replay_fraction")
+    parser.add_argument('--replay_min_segments', default=1000, type=int, help="Segments stored in the replay memory before batches start to include replayed ones. Default is 1000.", dest="replay_min_segments")
+    parser.add_argument('--replay_prioritized', default=False, type=bool_arg, help="If True, sample segments by priority (mean absolute advantage) instead of uniformly", dest="replay_prioritized")
+    parser.add_argument('--replay_alpha', default=0.6, type=float, help="Priority exponent of prioritized replay. Default is 0.6.", dest="replay_alpha")
+    parser.add_argument('--replay_beta', default=0.4, type=float, help="Importance weight exponent of prioritized replay. Default is 0.4.", dest="replay_beta")
+    parser.add_argument('--replay_is_clip', default=1.0, type=float, help="Replayed samples are off-policy: their loss is weighted by min(replay_is_clip, pi(a|s) / mu(a|s)), the importance ratio of the current and behaviour policies truncated to bound its variance. The truncation leaves a bias. Default is 1.0.", dest="replay_is_clip")
+    parser.add_argument('--replay_workers', default=4, type=int, help="Threads decompressing the frames of replayed segments. Default is 4.", dest="replay_workers")
+    parser.add_argument('--learners', default=1, type=int, help="Number of data-parallel learner processes on this host, averaging their gradients in shared memory. Learner i binds --learner_bind_address with the port + i and logs to <debugging_folder>/learner_<i>/ (i > 0). Default is 1.", dest="learners")
+    parser.add_argument('--allreduce_timeout', default=600, type=float, help="Seconds a learner waits for the others at a gradient all-reduce before failing, 0 to wait forever. Default is 600.", dest="allreduce_timeout")
+    parser.add_argument('--actor_file_servers', default=[], type=str, nargs='*', help="http://host:port addresses of the actors' checkpoint upload servers new parameters are sent to.", dest="actor_file_servers")
+    parser.add_argument('--upload_interval', default=10, type=int, help="Gradient steps between parameter uploads to the actors. Default is 10.", dest="upload_interval")
+    return parser
+
+
+def offset_port(address, offset):
+    """ tcp://*:6666, 1 -> tcp://*:6667 """
+    host, port = address.rsplit(':', 1)
+    return '{}:{}'.format(host, int(port) + offset)
+
+
+def run_learner(args, rank=0, allreduce=None):
+    import logger_utils
+    from train import get_network_and_environment_creator, setup_kill_signal_handler
+    if rank > 0:
+        args = copy.copy(args)
+        args.debugging_folder = os.path.join(args.debugging_folder, 'learner_{}'.format(rank))
+        args.learner_bind_address = offset_port(args.learner_bind_address, rank)
+    logger_utils.save_args(args, args.debugging_folder)
+
+    network_creator, env_creator = get_network_and_environment_creator(args)
+    learner = Learner(network_creator, env_creator, args, rank, allreduce)
+    setup_kill_signal_handler(learner)
+    learner.train()
+
+
+def main(args):
+    if args.learners <= 1:
+        run_learner(args)
+        return
+
+    # The learners are forked before any of them builds its graph and session
+    allreduce = SharedMemoryAllReduce(args.learners, timeout=args.allreduce_timeout or None)
+    learners = [Process(target=run_learner, args=(args, rank, allreduce)) for rank in range(args.learners)]
+    for learner in learners:
+        learner.start()
+
+    def shutdown(signal_number, frame):
+        logging.info('Signal {} detected, stopping the learners.'.format(signal_number))
+        # A SIGINT from the terminal already reached the learners, in the same process group
+        if signal_number == signal.SIGTERM:
+            for learner in learners:
+                if learner.is_alive():
+                    os.kill(learner.pid, signal.SIGTERM)
+        for learner in learners:
+            learner.join()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for learner in learners:
+        learner.join()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    main(get_arg_parser().parse_args())
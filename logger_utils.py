@@ -2,7 +2,6 @@ import os
 import numpy as np
 import time
 import json
-import tensorflow as tf
 
 
 def load_args(path):
@@ -22,6 +21,7 @@ def save_args(args, folder, file_name='args.json'):
 
 def variable_summaries(var, name):
     """Attach a lot of summaries to a Tensor (for TensorBoard visualization)."""
+    import tensorflow as tf
     with tf.name_scope('summaries'):
         with tf.name_scope(name):
             mean = tf.reduce_mean(var)
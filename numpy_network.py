@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    numpy_network
+    Description  :    TensorFlow-free forward pass of the NIPS and NATURE policy-value networks,
+                      for actors that only need action probabilities and values.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# (layer name, filters, kernel size, stride) of the conv layers, then the hidden fc layer
+ARCHITECTURES = {
+    'NIPS': ([('conv1', 16, 8, 4), ('conv2', 32, 4, 2)], ('fc3', 256)),
+    'NATURE': ([('conv1', 32, 8, 4), ('conv2', 64, 4, 2), ('conv3', 64, 3, 1)], ('fc4', 512)),
+}
+
+
+def conv_output_size(size, kernel, stride):
+    return (size - kernel) // stride + 1
+
+
+def im2col_view(x, kernel, stride):
+    """
+    Returns a (batch, out_h, out_w, kernel, kernel, channels) view of the VALID convolution patches
+    of x without copying it.
+    :param x: (batch, h, w, channels) C-contiguous array
+    """
+    n, h, w, c = x.shape
+    sn, sh, sw, sc = x.strides
+    out_h, out_w = conv_output_size(h, kernel, stride), conv_output_size(w, kernel, stride)
+    return as_strided(x, shape=(n, out_h, out_w, kernel, kernel, c),
+                      strides=(sn, sh * stride, sw * stride, sh, sw, sc), writeable=False)
+
+
+class NumpyNetwork(object):
+    """
+    Policy-value network forward pass with im2col and BLAS matmuls. The patch, activation and
+    output buffers are allocated once per batch size and reused; the 1/255 input scaling is folded
+    into the conv1 weights, so uint8 states are cast straight into the conv1 patch buffer.
+    """
+
+    def __init__(self, arch, num_actions, name='local_learning', input_shape=(84, 84, 4)):
+        if arch not in ARCHITECTURES:
+            raise Exception('Network architecture not recognized')
+        self.conv_layers, (self.fc_name, self.fc_size) = ARCHITECTURES[arch]
+        self.num_actions = num_actions
+        self.name = name
+        self.input_shape = input_shape
+        self.weights = None
+        self.buffers = {}
+
+    def variable_names(self):
+        """
+        :return: names of the TF variables the forward pass needs, without the network scope
+        """
+        names = []
+        for layer in [l[0] for l in self.conv_layers] + [self.fc_name, 'actor_output', 'critic_output']:
+            names += [layer + '_weights', layer + '_biases']
+        return names
+
+    def match_variables(self, available):
+        """
+        Finds the TF variables of the forward pass by their layer suffix: tf.name_scope makes the
+        network scope unique per call, so the layers end up under e.g. local_learning_1/ and
+        local_learning_2/ rather than under the network name.
+        :param available: full variable names, e.g. of a checkpoint or tf.trainable_variables()
+        :return: dict from variable name without the scope to full name
+        """
+        matches, missing, ambiguous = {}, [], []
+        for name in self.variable_names():
+            candidates = [full for full in available if full == name or full.endswith('/' + name)]
+            if not candidates:
+                missing.append(name)
+            elif len(candidates) > 1:
+                ambiguous.append('{} ({})'.format(name, ', '.join(sorted(candidates))))
+            else:
+                matches[name] = candidates[0]
+        if missing:
+            raise Exception('Missing network variables: {}'.format(', '.join(missing)))
+        if ambiguous:
+            raise Exception('Ambiguous network variables: {}'.format('; '.join(ambiguous)))
+        return matches
+
+    def set_weights(self, weights):
+        """
+        Loads new parameters.
+        :param weights: dict from variable name (with or without a scope) to array
+        """
+        weights = {name: weights[full] for name, full in self.match_variables(list(weights)).items()}
+
+        loaded = {}
+        for name, _, kernel, _ in self.conv_layers:
+            w = np.asarray(weights[name + '_weights'], dtype=np.float32)
+            loaded[name] = (w.reshape(-1, w.shape[-1]), np.asarray(weights[name + '_biases'], dtype=np.float32))
+        first = self.conv_layers[0][0]
+        loaded[first] = (loaded[first][0] * np.float32(1.0 / 255.0), loaded[first][1])
+        for name in [self.fc_name, 'actor_output', 'critic_output']:
+            loaded[name] = (np.ascontiguousarray(weights[name + '_weights'], dtype=np.float32),
+                            np.asarray(weights[name + '_biases'], dtype=np.float32))
+        self.weights = loaded
+
+    def load_checkpoint(self, checkpoint):
+        """
+        Loads the parameters from a TF checkpoint. TensorFlow is only needed for reading it.
+        :param checkpoint: checkpoint path prefix
+        """
+        import tensorflow as tf
+        reader = tf.train.NewCheckpointReader(checkpoint)
+        names = self.match_variables(list(reader.get_variable_to_shape_map()))
+        self.set_weights({name: reader.get_tensor(full) for name, full in names.items()})
+
+    def load_npz(self, path):
+        with np.load(path) as data:
+            self.set_weights(dict(data.items()))
+
+    def _get_buffers(self, batch_size):
+        if batch_size not in self.buffers:
+            buffers = []
+            h, w, c = self.input_shape
+            for _, filters, kernel, stride in self.conv_layers:
+                h, w = conv_output_size(h, kernel, stride), conv_output_size(w, kernel, stride)
+                patches = np.empty((batch_size, h, w, kernel, kernel, c), dtype=np.float32)
+                activations = np.empty((batch_size, h, w, filters), dtype=np.float32)
+                buffers.append((patches, activations))
+                c = filters
+            hidden = np.empty((batch_size, self.fc_size), dtype=np.float32)
+            logits = np.empty((batch_size, self.num_actions), dtype=np.float32)
+            values = np.empty((batch_size, 1), dtype=np.float32)
+            self.buffers[batch_size] = (buffers, hidden, logits, values)
+        return self.buffers[batch_size]
+
+    def conv_patches(self, states, layer_buffers):
+        """
+        Fills the conv1 patch buffer from a batch of states.
+
+        The patches are unfolded from all stacked frames on every call. Consecutive states share
+        three frames, but each frame meets a different channel slice of the conv1 weights at each
+        stack position, so no partial products carry over; only the unfold itself could, and at
+        these sizes a per-frame unfold costs about as much as the full one
+        (benchmarks/inference.py).
+        :return: the filled (rows, kernel * kernel * channels) patch matrix
+        """
+        _, _, kernel, stride = self.conv_layers[0]
+        patches = layer_buffers[0][0]
+        np.copyto(patches, im2col_view(states, kernel, stride), casting='unsafe')
+        return patches.reshape(-1, patches[0, 0, 0].size)
+
+    def predict(self, states):
+        """
+        :param states: (batch, 84, 84, 4) uint8 states
+        :return: (values, action probabilities) tuple, float32
+        """
+        states = np.ascontiguousarray(states)
+        layer_buffers, hidden, logits, values = self._get_buffers(states.shape[0])
+
+        x = None
+        for i, (name, _, kernel, stride) in enumerate(self.conv_layers):
+            patches, activations = layer_buffers[i]
+            if i == 0:
+                patch_matrix = self.conv_patches(states, layer_buffers)
+            else:
+                np.copyto(patches, im2col_view(x, kernel, stride))
+                patch_matrix = patches.reshape(-1, patches[0, 0, 0].size)
+            w, b = self.weights[name]
+            out = activations.reshape(-1, activations.shape[-1])
+            np.dot(patch_matrix, w, out=out)
+            out += b
+            np.maximum(out, 0, out=out)
+            x = activations
+
+        w, b = self.weights[self.fc_name]
+        np.dot(x.reshape(x.shape[0], -1), w, out=hidden)
+        hidden += b
+        np.maximum(hidden, 0, out=hidden)
+
+        w, b = self.weights['critic_output']
+        np.dot(hidden, w, out=values)
+        values += b
+
+        w, b = self.weights['actor_output']
+        np.dot(hidden, w, out=logits)
+        logits += b
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        return values.reshape(-1).copy(), probs
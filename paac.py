@@ -3,54 +3,140 @@ from flask import Flask, request
 from multiprocessing.sharedctypes import RawArray
 from ctypes import c_uint, c_float
 from actor_learner import *
-from emulator_runner import EmulatorRunner
-from runners import Runners
+from runners import get_runners_backend
 from zmq_serialize import SerializingContext
-from multiprocessing import Queue
+from rollout_schema import encode_rollout, behaviour_action_probs
+from profiler import create_profiler
+from inference import create_policy, sample_policy_action
+from multiprocessing import Queue, get_context
+from checkpoint_evaluator import run_checkpoint_evaluator
+from checkpointing import checkpoint_files
+from rollout_recorder import RolloutRecorder
+from placement import run_pinned
+from async_runners import AsyncRunners, SegmentBuffer
 
 flask_file_server = Flask(__name__)
 
 
 @flask_file_server.route('/d3rl/network', methods=['POST'])
 def upload_network():
+    """
+    Receives the files of a checkpoint. They are stored under temporary names and renamed into place,
+    the index last, before the checkpoint state file is replaced, so that the actor never restores a
+    partially received checkpoint.
+    """
+    upload_folder = flask_file_server.config['UPLOAD_FOLDER']
     network_ckpt = request.files.getlist('files')
     file_num, ckpt_num = 0, ""
-    for f in network_ckpt:
-        f.save("/root/D3RL_ZMQ_Vtrace/logs/upload/" + f.filename)
+    for f in sorted(network_ckpt, key=lambda f: f.filename.endswith('.index')):
+        filename = os.path.basename(f.filename)
+        temp_path = os.path.join(upload_folder, '.tmp' + filename)
+        f.save(temp_path)
+        os.rename(temp_path, os.path.join(upload_folder, filename))
         file_num += 1
         if ckpt_num == "":
-            ckpt_num = f.filename.split(".")[0]
+            ckpt_num = filename.split(".")[0]
 
-    with open("/root/D3RL_ZMQ_Vtrace/logs/upload/checkpoint", "w") as f:
+    temp_path = os.path.join(upload_folder, '.tmpcheckpoint')
+    with open(temp_path, "w") as f:
         f.writelines(["model_checkpoint_path: \"" + ckpt_num + "\"\n",
                       "all_model_checkpoint_paths: \"" + ckpt_num + "\""])
+    os.rename(temp_path, os.path.join(upload_folder, "checkpoint"))
 
     return '{"code":"ok","file_num":%d}' % file_num
 
 
-def send_zmq_batch_data(queue):
-    ctx = SerializingContext()
-    req = ctx.socket(zmq.REQ)
-    req.connect("tcp://127.0.0.1:6666")
-    while True:
-        data = queue.get()
-        req.send_zipped_pickle(data)
-        msg = req.recv_string()
-        if msg == "stop":
-            break
-    req.close()
+def run_file_server(upload_folder, host, port):
+    flask_file_server.config['UPLOAD_FOLDER'] = upload_folder
+    flask_file_server.run(host=host, port=port)
+
+
+def send_zmq_batch_data(queue, address, identity, float_dtype='float16', profile_file=None, record_folder=None,
+                        record_chunk_size=256):
+    """
+    Encodes the rollouts put on the queue with rollout_schema and sends them as multipart messages.
+    The queue items are (arrays, header fields) tuples; the send time is added to the header. If
+    the arrays include the behaviour policies, the probabilities of the taken actions are sent too.
+    With record_folder, the rollouts (and the behaviour policies, if the arrays include them) are
+    also recorded with rollout_recorder; with an empty address they are only recorded.
+    """
+    req = None
+    if address:
+        ctx = SerializingContext()
+        req = ctx.socket(zmq.REQ)
+        req.setsockopt(zmq.IDENTITY, identity)
+        req.connect(address)
+    recorder = RolloutRecorder(record_folder, record_chunk_size) if record_folder else None
+    profiler = create_profiler(profile_file is not None)
+    last_profile_time = time.time()
+    try:
+        while True:
+            data, header = queue.get()
+            if recorder is not None:
+                with profiler.stage('record'):
+                    recorder.record(data, header)
+            if req is None:
+                continue
+            with profiler.stage('serialization'):
+                behaviour_probs = behaviour_action_probs(data[5], data[3]) if len(data) > 5 else None
+                frames = encode_rollout(*data[:5], float_dtype=float_dtype, behaviour_probs=behaviour_probs,
+                                        sent=time.time(), **header)
+            with profiler.stage('send'):
+                req.send_multipart(frames, copy=False)
+                msg = req.recv_string()
+            if msg == "stop":
+                break
+            if profiler.enabled and time.time() - last_profile_time >= 60:
+                profiler.write_json(profile_file)
+                last_profile_time = time.time()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if req is not None:
+            req.close()
 
 
 class PAACLearner(ActorLearner):
-    def __init__(self, network_creator, environment_creator, args):
+    def __init__(self, network_creator, environment_creator, args, placement=None):
         super(PAACLearner, self).__init__(network_creator, environment_creator, args)
+        # placement.Placement of the actor's processes, or None to leave them to the OS scheduler
+        self.placement = placement
+        service_cpus = placement.service_cpus if placement is not None else []
         self.workers = args.emulator_workers
+        self.runner_backend = args.runner_backend
+        self.worker_start_method = args.worker_start_method
+        self.episode_statistics_window = args.episode_statistics_window
+        self.actor_id = args.actor_id
+        self.async_stepping = args.async_stepping
+        self.async_max_batch = args.async_max_batch or max(1, self.emulator_counts // 2)
+        self.async_timeout = args.async_timeout_ms / 1000.0
         self.latest_ckpt = "-0"
-        self.send_batch_queue = Queue()
-
-        self.flask_file_server_proc = Process(target=flask_file_server.run,
-                                              kwargs={'host': '127.0.0.1', 'port': 6668})
-        self.send_zmq_batch_data_proc = Process(target=send_zmq_batch_data, kwargs={'queue': self.send_batch_queue})
+        # Step of the learner checkpoint the actor runs, None until one is received
+        self.param_version = None
+        self.policy = create_policy(args, self.network, self.session, self.network_saver)
+        # Bounded, so that the actor waits instead of piling up rollouts when the learner falls behind
+        self.send_batch_queue = Queue(maxsize=args.send_queue_size)
+        self.profiler = create_profiler(args.profile)
+        self.profile_file = os.path.join(self.debugging_folder, 'profile.json')
+
+        self.flask_file_server_proc = Process(target=run_pinned, args=(service_cpus, run_file_server),
+                                              kwargs={'upload_folder': self.upload_checkpoint_folder,
+                                                      'host': args.file_server_host, 'port': args.file_server_port})
+        self.send_zmq_batch_data_proc = Process(target=run_pinned, args=(service_cpus, send_zmq_batch_data),
+                                                kwargs={'queue': self.send_batch_queue,
+                                                        'address': args.learner_address,
+                                                        'identity': 'actor-{}'.format(args.actor_id).encode(),
+                                                        'float_dtype': args.rollout_float_dtype,
+                                                        'profile_file': os.path.join(self.debugging_folder,
+                                                                                     'profile_sender.json')
+                                                        if args.profile else None,
+                                                        'record_folder': args.record_rollouts,
+                                                        'record_chunk_size': args.record_chunk_size})
+        self.checkpoint_evaluator_proc = None
+        if args.eval_episodes > 0:
+            # Spawned rather than forked: the evaluator builds its own TF graph and session
+            self.checkpoint_evaluator_proc = get_context('spawn').Process(target=run_checkpoint_evaluator,
+                                                                          args=(args,))
 
     @staticmethod
     def choose_next_actions(network, num_actions, states, session):
@@ -59,27 +145,18 @@ class PAACLearner(ActorLearner):
                  network.output_layer_pi],
                 feed_dict={network.input_ph: states})
 
-        action_indices = PAACLearner.__sample_policy_action(network_output_pi)
+        action_indices = sample_policy_action(network_output_pi)
 
         new_actions = np.eye(num_actions)[action_indices]
 
         return new_actions, network_output_v, network_output_pi
 
     def __choose_next_actions(self, states):
-        return PAACLearner.choose_next_actions(self.network, self.num_actions, states, self.session)
+        action_indices, network_output_v, network_output_pi = self.policy.choose_actions(states, self.profiler)
 
-    @staticmethod
-    def __sample_policy_action(probs):
-        """
-        Sample an action from an action probability distribution output by
-        the policy network.
-        """
-        # Subtract a tiny value from probabilities in order to avoid
-        # "ValueError: sum(pvals[:-1]) > 1.0" in numpy.multinomial
-        probs = probs - np.finfo(np.float32).epsneg
+        new_actions = np.eye(self.num_actions)[action_indices]
 
-        action_indexes = [int(np.nonzero(np.random.multinomial(1, p))[0]) for p in probs]
-        return action_indexes
+        return action_indices, new_actions, network_output_v, network_output_pi
 
     def _get_shared(self, array, dtype=c_float):
         """
@@ -96,6 +173,8 @@ class PAACLearner(ActorLearner):
     def train(self):
         self.flask_file_server_proc.start()
         self.send_zmq_batch_data_proc.start()
+        if self.checkpoint_evaluator_proc is not None:
+            self.checkpoint_evaluator_proc.start()
 
         """
         Main actor learner loop for parallel advantage actor critic learning.
@@ -107,31 +186,32 @@ class PAACLearner(ActorLearner):
 
         global_step_start = self.global_step
 
-        total_rewards = []
+        if self.async_stepping:
+            self.train_async()
+            return
 
         # state, reward, episode_over, action
-        variables = [(np.asarray([emulator.get_initial_state() for emulator in self.emulators], dtype=np.uint8)),
+        variables = [(np.zeros((self.emulator_counts, 84, 84, 4), dtype=np.uint8)),
                      (np.zeros(self.emulator_counts, dtype=np.float32)),
                      (np.asarray([False] * self.emulator_counts, dtype=np.float32)),
                      (np.zeros((self.emulator_counts, self.num_actions), dtype=np.float32))]
 
-        self.runners = Runners(EmulatorRunner, self.emulators, self.workers, variables)
+        runners_class, emulator_runner_class = get_runners_backend(self.runner_backend)
+        self.runners = runners_class(emulator_runner_class, self.environment_creator, self.workers, variables,
+                                     self.episode_statistics_window,
+                                     self.placement.worker_cpus if self.placement is not None else None,
+                                     self.worker_start_method)
         self.runners.start()
         shared_states, shared_rewards, shared_episode_over, shared_actions = self.runners.get_shared_variables()
+        step_times = self.runners.get_step_times()
+        episode_statistics = self.runners.get_episode_statistics()
+        profiler = self.profiler
 
         summaries_op = tf.summary.merge_all()
 
-        emulator_steps = [0] * self.emulator_counts
-        total_episode_rewards = self.emulator_counts * [0]
-
         actions_sum = np.zeros((self.emulator_counts, self.num_actions))
         y_batch = np.zeros((self.max_local_steps, self.emulator_counts))
         adv_batch = np.zeros((self.max_local_steps, self.emulator_counts))
-        rewards = np.zeros((self.max_local_steps, self.emulator_counts))
-        states = np.zeros([self.max_local_steps + 1] + list(shared_states.shape), dtype=np.uint8)
-        actions = np.zeros((self.max_local_steps, self.emulator_counts, self.num_actions))
-        values = np.zeros((self.max_local_steps, self.emulator_counts))
-        episodes_over_masks = np.zeros((self.max_local_steps, self.emulator_counts))
 
         start_time = time.time()
 
@@ -139,46 +219,53 @@ class PAACLearner(ActorLearner):
 
             loop_start_time = time.time()
 
+            # New buffers every rollout: the previous ones may still be waiting in the send queue
+            rewards = np.empty((self.max_local_steps, self.emulator_counts), dtype=np.float32)
+            states = np.empty([self.max_local_steps + 1] + list(shared_states.shape), dtype=np.uint8)
+            actions = np.empty((self.max_local_steps, self.emulator_counts), dtype=np.uint8)
+            values = np.empty((self.max_local_steps, self.emulator_counts), dtype=np.float32)
+            episodes_over_masks = np.empty((self.max_local_steps, self.emulator_counts), dtype=np.float32)
+            policies = np.empty((self.max_local_steps, self.emulator_counts, self.num_actions), dtype=np.float32)
+            rollout = [states, rewards, episodes_over_masks, actions, values, policies]
+
             max_local_steps = self.max_local_steps
             for t in range(max_local_steps):
-                next_actions, readouts_v_t, readouts_pi_t = self.__choose_next_actions(shared_states)
-                actions_sum += next_actions
-                for z in range(next_actions.shape[0]):
-                    shared_actions[z] = next_actions[z]
+                action_indices, next_actions, readouts_v_t, readouts_pi_t = self.__choose_next_actions(shared_states)
+                with profiler.stage('action_copy'):
+                    actions_sum += next_actions
+                    for z in range(next_actions.shape[0]):
+                        shared_actions[z] = next_actions[z]
 
-                actions[t] = next_actions
-                values[t] = readouts_v_t
-                states[t] = shared_states
+                    actions[t] = action_indices
+                    values[t] = readouts_v_t
+                    states[t] = shared_states
+                    policies[t] = readouts_pi_t
 
                 # Start updating all environments with next_actions
-                self.runners.update_environments()
-                self.runners.wait_updated()
+                with profiler.stage('barrier_wait'):
+                    self.runners.update_environments()
+                    self.runners.wait_updated()
                 # Done updating all environments, have new states, rewards and is_over
+                if profiler.enabled:
+                    for w, step_time in enumerate(step_times):
+                        profiler.record('emulator_step/worker_{}'.format(w), step_time)
 
-                episodes_over_masks[t] = 1.0 - shared_episode_over.astype(np.float32)
+                with profiler.stage('reward_bookkeeping'):
+                    episodes_over_masks[t] = 1.0 - shared_episode_over.astype(np.float32)
+                    # Clip immediate rewards
+                    rewards[t] = np.clip(shared_rewards, -1.0, 1.0)
+                    actions_sum[shared_episode_over > 0] = 0
+                    self.global_step += self.emulator_counts
 
-                for e, (actual_reward, episode_over) in enumerate(zip(shared_rewards, shared_episode_over)):
-                    total_episode_rewards[e] += actual_reward
-                    actual_reward = self.rescale_reward(actual_reward)
-                    rewards[t, e] = actual_reward
+            with profiler.stage('episode_summaries'):
+                self.__write_episode_summaries(episode_statistics)
 
-                    emulator_steps[e] += 1
-                    self.global_step += 1
-                    if episode_over:
-                        total_rewards.append(total_episode_rewards[e])
-                        episode_summary = tf.Summary(value=[
-                            tf.Summary.Value(tag='rl/reward', simple_value=total_episode_rewards[e]),
-                            tf.Summary.Value(tag='rl/episode_length', simple_value=emulator_steps[e]),
-                        ])
-                        self.summary_writer.add_summary(episode_summary, self.global_step)
-                        self.summary_writer.flush()
-                        total_episode_rewards[e] = 0
-                        emulator_steps[e] = 0
-                        actions_sum[e] = np.zeros(self.num_actions)
-
-            states[-1] = shared_states
-            self.send_batch_queue.put([states, rewards, episodes_over_masks, actions, values])
-            # states: (5,32,84,84,4), rewards: (5,32), over: (5,32), actions: (5,32,6)
+            with profiler.stage('enqueue'):
+                states[-1] = shared_states
+                self.send_batch_queue.put((rollout,
+                                           {'actor_id': self.actor_id, 'param_version': self.param_version,
+                                            'created': loop_start_time, 'enqueued': time.time()}))
+            # states: (6,32,84,84,4), rewards: (5,32), over: (5,32), action indices: (5,32)
 
 
             counter += 1
@@ -186,33 +273,118 @@ class PAACLearner(ActorLearner):
             if counter % (2048 / self.emulator_counts) == 0:
                 curr_time = time.time()
                 global_steps = self.global_step
-                last_ten = 0.0 if len(total_rewards) < 1 else np.mean(total_rewards[-10:])
-                logging.info("Ran {} steps, at {} steps/s ({} steps/s avg), last 10 rewards avg {}"
+                p10, p50, p90 = episode_statistics.percentiles([10, 50, 90])
+                logging.info("Ran {} steps, at {} steps/s ({} steps/s avg), last rewards avg {} (p10 {}, p50 {}, p90 {})"
                              .format(global_steps,
                                      self.max_local_steps * self.emulator_counts / (curr_time - loop_start_time),
                                      (global_steps - global_step_start) / (curr_time - start_time),
-                                     last_ten))
+                                     episode_statistics.mean(), p10, p50, p90))
+                if profiler.enabled:
+                    profiler.write_summaries(self.summary_writer, self.global_step)
+                    profiler.write_json(self.profile_file, global_step=self.global_step)
 
             """ restore network if there's new checkpoint from GPU-Learner
             """
-            try:
-                cur_ckpt = tf.train.latest_checkpoint(self.upload_checkpoint_folder)
-                if cur_ckpt and self.latest_ckpt != cur_ckpt:
-                    self.network_saver.restore(self.session, cur_ckpt)
-                    if os.path.exists("/root/D3RL_ZMQ_Vtrace/logs/upload/" + str(self.latest_ckpt) + ".meta"):
-                        os.system(
-                                "rm /root/D3RL_ZMQ_Vtrace/logs/upload/" + str(
-                                        self.latest_ckpt) + ".data-00000-of-00001")
-                        os.system("rm /root/D3RL_ZMQ_Vtrace/logs/upload/" + str(self.latest_ckpt) + ".index")
-                        os.system("rm /root/D3RL_ZMQ_Vtrace/logs/upload/" + str(self.latest_ckpt) + ".meta")
-                    self.latest_ckpt = cur_ckpt
-            except ValueError:  # if the checkpoint is written: state error
-                pass
+            with profiler.stage('checkpoint_poll'):
+                self.__poll_checkpoint()
+
+        self.cleanup()
+
+    def train_async(self):
+        """
+        Actor loop without a step barrier: every iteration runs inference on the emulators that are
+        ready (up to async_max_batch, waiting at most async_timeout after the first one) and hands
+        them their actions, while the other emulators keep stepping. Each emulator's trajectory is
+        cut into segments of max_local_steps transitions, and every emulator_counts completed
+        segments are sent as one rollout, in the same format as the synchronous loop.
+        """
+        global_step_start = self.global_step
+        variables = [(np.zeros((self.emulator_counts, 84, 84, 4), dtype=np.uint8)),
+                     (np.zeros(self.emulator_counts, dtype=np.float32)),
+                     (np.asarray([False] * self.emulator_counts, dtype=np.float32)),
+                     (np.zeros((self.emulator_counts, self.num_actions), dtype=np.float32))]
+        self.runners = AsyncRunners(self.environment_creator, self.workers, variables, self.episode_statistics_window,
+                                    self.placement.worker_cpus if self.placement is not None else None,
+                                    self.worker_start_method)
+        self.runners.start()
+        shared_states, shared_rewards, shared_episode_over, shared_actions = self.runners.get_shared_variables()
+        episode_statistics = self.runners.get_episode_statistics()
+        segments = SegmentBuffer(self.emulator_counts, self.max_local_steps, shared_states.shape[1:], self.num_actions)
+        profiler = self.profiler
+
+        start_time = last_report = time.time()
+        last_report_step = self.global_step
+        while self.global_step < self.max_global_steps:
+            with profiler.stage('ready_wait'):
+                ready = self.runners.wait_ready(self.async_max_batch, self.async_timeout)
+            profiler.observe('ready_batch_size', len(ready))
+            with profiler.stage('reward_bookkeeping'):
+                states = shared_states[ready]
+                segments.finish_steps(ready, np.clip(shared_rewards[ready], -1.0, 1.0),
+                                      shared_episode_over[ready], states)
+
+            action_indices, next_actions, readouts_v_t, readouts_pi_t = self.__choose_next_actions(states)
+            with profiler.stage('action_copy'):
+                segments.start_steps(ready, states, action_indices, readouts_v_t, readouts_pi_t)
+                shared_actions[ready] = next_actions
+                self.runners.dispatch(ready)
+            self.global_step += len(ready)
+
+            rollout = segments.pop_rollout(self.emulator_counts)
+            if rollout is not None:
+                with profiler.stage('episode_summaries'):
+                    self.__write_episode_summaries(episode_statistics)
+                with profiler.stage('enqueue'):
+                    arrays, created = rollout
+                    self.send_batch_queue.put((arrays, {'actor_id': self.actor_id, 'param_version': self.param_version,
+                                                        'created': created, 'enqueued': time.time()}))
+                with profiler.stage('checkpoint_poll'):
+                    self.__poll_checkpoint()
+
+            if time.time() - last_report >= 30:
+                curr_time = time.time()
+                p10, p50, p90 = episode_statistics.percentiles([10, 50, 90])
+                logging.info("Ran {} steps, at {} steps/s ({} steps/s avg), last rewards avg {} (p10 {}, p50 {}, p90 {})"
+                             .format(self.global_step, (self.global_step - last_report_step) / (curr_time - last_report),
+                                     (self.global_step - global_step_start) / (curr_time - start_time),
+                                     episode_statistics.mean(), p10, p50, p90))
+                last_report, last_report_step = curr_time, self.global_step
+                if profiler.enabled:
+                    profiler.write_summaries(self.summary_writer, self.global_step)
+                    profiler.write_json(self.profile_file, global_step=self.global_step)
 
         self.cleanup()
 
+    def __write_episode_summaries(self, episode_statistics):
+        episode_rewards, episode_lengths = episode_statistics.new_episodes()
+        for episode_reward, episode_length in zip(episode_rewards, episode_lengths):
+            episode_summary = tf.Summary(value=[
+                tf.Summary.Value(tag='rl/reward', simple_value=episode_reward),
+                tf.Summary.Value(tag='rl/episode_length', simple_value=episode_length),
+            ])
+            self.summary_writer.add_summary(episode_summary, self.global_step)
+        if len(episode_rewards) > 0:
+            self.summary_writer.flush()
+
+    def __poll_checkpoint(self):
+        try:
+            cur_ckpt = tf.train.latest_checkpoint(self.upload_checkpoint_folder)
+            if cur_ckpt and self.latest_ckpt != cur_ckpt:
+                self.policy.restore(cur_ckpt)
+                folder, name = os.path.split(self.latest_ckpt)
+                if os.path.isdir(folder):
+                    for path in checkpoint_files(folder, name):
+                        os.remove(path)
+                self.latest_ckpt = cur_ckpt
+                self.param_version = int(cur_ckpt[cur_ckpt.rindex('-') + 1:])
+        except ValueError:  # a checkpoint from an uploader that does not publish it atomically
+            pass
+
     def cleanup(self):
         super(PAACLearner, self).cleanup()
         self.runners.stop()
+        self.policy.close()
         self.flask_file_server_proc.terminate()
         self.send_zmq_batch_data_proc.terminate()
+        if self.checkpoint_evaluator_proc is not None:
+            self.checkpoint_evaluator_proc.terminate()
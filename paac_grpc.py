@@ -1,68 +1,38 @@
 import time
-from multiprocessing import Queue
-from multiprocessing.sharedctypes import RawArray
-from ctypes import c_uint, c_float
 from actor_learner import *
 import logging
 
 from emulator_runner import EmulatorRunner
 from runners import Runners
 import numpy as np
-import grpc
-from grpc_utils_flatten import batch_data_pb2, batch_data_pb2_grpc
+from inference import sample_policy_action
+from rollout_schema import encode_rollout
+from grpc_transport import rollout_sender
 
 
 class PAACLearner(ActorLearner):
-    def __init__(self, network_creator, environment_creator, args):
+    """
+    Actor sending its rollouts over gRPC (grpc_transport) instead of ZMQ, in the rollout_schema
+    format the ZMQ actor uses.
+    """
+
+    def __init__(self, network_creator, environment_creator, args, address='127.0.0.1:50051'):
         super(PAACLearner, self).__init__(network_creator, environment_creator, args)
         self.workers = args.emulator_workers
-        self.channel = grpc.insecure_channel('127.0.0.1:50051')
-        self.stub = batch_data_pb2_grpc.TransferBatchDataStub(self.channel)
-
-    @staticmethod
-    def choose_next_actions(network, num_actions, states, session):
-        network_output_v, network_output_pi = session.run(
-                [network.output_layer_v,
-                 network.output_layer_pi],
-                feed_dict={network.input_ph: states})
-
-        action_indices = PAACLearner.__sample_policy_action(network_output_pi)
-
-        new_actions = np.eye(num_actions)[action_indices]
-
-        return new_actions, network_output_v, network_output_pi
+        self.actor_id = args.actor_id
+        self.float_dtype = args.rollout_float_dtype
+        self.send_rollout = rollout_sender(address)
 
     def __choose_next_actions(self, states):
-        return PAACLearner.choose_next_actions(self.network, self.num_actions, states, self.session)
-
-    @staticmethod
-    def __sample_policy_action(probs):
-        """
-        Sample an action from an action probability distribution output by
-        the policy network.
-        """
-        # Subtract a tiny value from probabilities in order to avoid
-        # "ValueError: sum(pvals[:-1]) > 1.0" in numpy.multinomial
-        probs = probs - np.finfo(np.float32).epsneg
-
-        action_indexes = [int(np.nonzero(np.random.multinomial(1, p))[0]) for p in probs]
-        return action_indexes
-
-    def _get_shared(self, array, dtype=c_float):
-        """
-        Returns a RawArray backed numpy array that can be shared between processes.
-        :param array: the array to be shared
-        :param dtype: the RawArray dtype to use
-        :return: the RawArray backed numpy array
-        """
-
-        shape = array.shape
-        shared = RawArray(dtype, array.reshape(-1))
-        return np.frombuffer(shared, dtype).reshape(shape)
+        network_output_v, network_output_pi = self.session.run(
+                [self.network.output_layer_v,
+                 self.network.output_layer_pi],
+                feed_dict={self.network.input_ph: states})
+        return sample_policy_action(network_output_pi), network_output_v
 
     def train(self):
         """
-        Main actor learner loop for parallel advantage actor critic learning.
+        Main actor loop: collects rollouts of max_local_steps steps and sends them.
         """
 
         self.global_step = self.init_network()
@@ -72,31 +42,22 @@ class PAACLearner(ActorLearner):
 
         global_step_start = self.global_step
 
-        total_rewards = []
-
         # state, reward, episode_over, action
-        variables = [(np.asarray([emulator.get_initial_state() for emulator in self.emulators], dtype=np.uint8)),
+        variables = [(np.zeros((self.emulator_counts, 84, 84, 4), dtype=np.uint8)),
                      (np.zeros(self.emulator_counts, dtype=np.float32)),
                      (np.asarray([False] * self.emulator_counts, dtype=np.float32)),
                      (np.zeros((self.emulator_counts, self.num_actions), dtype=np.float32))]
 
-        self.runners = Runners(EmulatorRunner, self.emulators, self.workers, variables)
+        self.runners = Runners(EmulatorRunner, self.environment_creator, self.workers, variables)
         self.runners.start()
         shared_states, shared_rewards, shared_episode_over, shared_actions = self.runners.get_shared_variables()
 
-        summaries_op = tf.summary.merge_all()
-
-        emulator_steps = [0] * self.emulator_counts
-        total_episode_rewards = self.emulator_counts * [0]
-
-        actions_sum = np.zeros((self.emulator_counts, self.num_actions))
-        y_batch = np.zeros((self.max_local_steps, self.emulator_counts))
-        adv_batch = np.zeros((self.max_local_steps, self.emulator_counts))
-        rewards = np.zeros((self.max_local_steps, self.emulator_counts))
-        states = np.zeros([self.max_local_steps] + list(shared_states.shape), dtype=np.uint8)
-        actions = np.zeros((self.max_local_steps, self.emulator_counts, self.num_actions))
-        values = np.zeros((self.max_local_steps, self.emulator_counts))
-        episodes_over_masks = np.zeros((self.max_local_steps, self.emulator_counts))
+        eye = np.eye(self.num_actions, dtype=np.float32)
+        rewards = np.zeros((self.max_local_steps, self.emulator_counts), dtype=np.float32)
+        states = np.zeros([self.max_local_steps + 1] + list(shared_states.shape), dtype=np.uint8)
+        actions = np.zeros((self.max_local_steps, self.emulator_counts), dtype=np.uint8)
+        values = np.zeros((self.max_local_steps, self.emulator_counts), dtype=np.float32)
+        episodes_over_masks = np.zeros((self.max_local_steps, self.emulator_counts), dtype=np.float32)
 
         start_time = time.time()
 
@@ -104,14 +65,11 @@ class PAACLearner(ActorLearner):
 
             loop_start_time = time.time()
 
-            max_local_steps = self.max_local_steps
-            for t in range(max_local_steps):
-                next_actions, readouts_v_t, readouts_pi_t = self.__choose_next_actions(shared_states)
-                actions_sum += next_actions
-                for z in range(next_actions.shape[0]):
-                    shared_actions[z] = next_actions[z]
+            for t in range(self.max_local_steps):
+                action_indices, readouts_v_t = self.__choose_next_actions(shared_states)
+                shared_actions[:] = eye[action_indices]
 
-                actions[t] = next_actions
+                actions[t] = action_indices
                 values[t] = readouts_v_t
                 states[t] = shared_states
 
@@ -121,79 +79,23 @@ class PAACLearner(ActorLearner):
                 # Done updating all environments, have new states, rewards and is_over
 
                 episodes_over_masks[t] = 1.0 - shared_episode_over.astype(np.float32)
-            print("******")
-            # data = []
-            # for e, (s, a, r) in enumerate(zip(states, actions, rewards)):
-            #     data.append((e, s, a, r))
-            # print(data[0][1].shape, data[0][2].shape, data[0][3].shape)
-
-            response = self.stub.Send(batch_data_pb2.BatchData(states=states.flatten(),
-                                                               actions=actions.flatten(),
-                                                               rewards=rewards.flatten()))
-            print("Transfer client received: " + str(response.boolean))
-
-            print("******")
-
-            # for e, (actual_reward, episode_over) in enumerate(zip(shared_rewards, shared_episode_over)):
-            #         total_episode_rewards[e] += actual_reward
-            #         actual_reward = self.rescale_reward(actual_reward)
-            #         rewards[t, e] = actual_reward
-            #
-            #         emulator_steps[e] += 1
-            #         self.global_step += 1
-            #         if episode_over:
-            #             total_rewards.append(total_episode_rewards[e])
-            #             episode_summary = tf.Summary(value=[
-            #                 tf.Summary.Value(tag='rl/reward', simple_value=total_episode_rewards[e]),
-            #                 tf.Summary.Value(tag='rl/episode_length', simple_value=emulator_steps[e]),
-            #             ])
-            #             self.summary_writer.add_summary(episode_summary, self.global_step)
-            #             self.summary_writer.flush()
-            #             total_episode_rewards[e] = 0
-            #             emulator_steps[e] = 0
-            #             actions_sum[e] = np.zeros(self.num_actions)
-            #
-            # nest_state_value = self.session.run(
-            #     self.network.output_layer_v,
-            #     feed_dict={self.network.input_ph: shared_states})
-            #
-            # estimated_return = np.copy(nest_state_value)
-            #
-            # for t in reversed(range(max_local_steps)):
-            #     estimated_return = rewards[t] + self.gamma * estimated_return * episodes_over_masks[t]
-            #     y_batch[t] = np.copy(estimated_return)
-            #     adv_batch[t] = estimated_return - values[t]
-            #
-            # flat_states = states.reshape([self.max_local_steps * self.emulator_counts] + list(shared_states.shape)[1:])
-            # flat_y_batch = y_batch.reshape(-1)
-            # flat_adv_batch = adv_batch.reshape(-1)
-            # flat_actions = actions.reshape(max_local_steps * self.emulator_counts, self.num_actions)
-            #
-            # lr = self.get_lr()
-            # feed_dict = {self.network.input_ph: flat_states,
-            #              self.network.critic_target_ph: flat_y_batch,
-            #              self.network.selected_action_ph: flat_actions,
-            #              self.network.adv_actor_ph: flat_adv_batch,
-            #              self.learning_rate: lr}
-            #
-            # _, summaries = self.session.run(
-            #     [self.train_step, summaries_op],
-            #     feed_dict=feed_dict)
-            #
-            # self.summary_writer.add_summary(summaries, self.global_step)
-            # self.summary_writer.flush()
-            #
+                rewards[t] = np.clip(shared_rewards, -1.0, 1.0)
+                self.global_step += self.emulator_counts
+            states[-1] = shared_states
+
+            self.send_rollout(encode_rollout(states, rewards, episodes_over_masks, actions, values,
+                                             float_dtype=self.float_dtype, actor_id=self.actor_id,
+                                             param_version=None, created=loop_start_time,
+                                             enqueued=time.time(), sent=time.time()))
             counter += 1
 
             if counter % (2048 / self.emulator_counts) == 0:
                 curr_time = time.time()
                 global_steps = self.global_step
-                last_ten = 0.0 if len(total_rewards) < 1 else np.mean(total_rewards[-10:])
-                logging.info("Ran {} steps, at {} steps/s ({} steps/s avg), last 10 rewards avg {}"
+                logging.info("Ran {} steps, at {} steps/s ({} steps/s avg)"
                              .format(global_steps,
                                      self.max_local_steps * self.emulator_counts / (curr_time - loop_start_time),
-                                     (global_steps - global_step_start) / (curr_time - start_time),
-                                     last_ten))
+                                     (global_steps - global_step_start) / (curr_time - start_time)))
             self.save_vars()
 
         self.cleanup()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    placement
+    Description  :    CPU placement of an actor host: which cores the actor (TF inference), each
+                      emulator worker and the service processes (sender, file server, evaluator) run on.
+"""
+
+import logging, os
+
+NODE_FOLDER = '/sys/devices/system/node'
+CPU_FOLDER = '/sys/devices/system/cpu'
+
+
+def parse_cpu_list(text):
+    """ '0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11] """
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def read_cpu_list(path):
+    try:
+        with open(path) as f:
+            return parse_cpu_list(f.read())
+    except (IOError, ValueError):
+        return None
+
+
+def numa_nodes():
+    """
+    :return: {node: cpus} from sysfs, or None if the host does not expose its NUMA topology
+    """
+    try:
+        names = [name for name in os.listdir(NODE_FOLDER) if name.startswith('node') and name[4:].isdigit()]
+    except OSError:
+        return None
+    nodes = {int(name[4:]): read_cpu_list(os.path.join(NODE_FOLDER, name, 'cpulist')) for name in names}
+    return {node: cpus for node, cpus in nodes.items() if cpus} or None
+
+
+def sibling_rank(cpu):
+    """ 0 for the first hardware thread of a physical core, 1 for its hyper-thread sibling, ... """
+    siblings = read_cpu_list(os.path.join(CPU_FOLDER, 'cpu{}'.format(cpu), 'topology', 'thread_siblings_list'))
+    return siblings.index(cpu) if siblings and cpu in siblings else 0
+
+
+def ordered_cpus(cpus):
+    """
+    Orders cpus NUMA node by node, starting with the node of the first one, and within a node the
+    first hardware thread of every physical core before their hyper-thread siblings. Taking cores
+    from the front of the list therefore fills one node with distinct physical cores first.
+    """
+    nodes = numa_nodes() or {0: cpus}
+    node_of = {cpu: node for node, node_cpus in nodes.items() for cpu in node_cpus}
+    first_node = node_of.get(cpus[0], 0)
+    return sorted(cpus, key=lambda cpu: (node_of.get(cpu, 0) != first_node, node_of.get(cpu, 0),
+                                         sibling_rank(cpu), cpu))
+
+
+def pin(cpus):
+    """ Restricts the calling process (or, on Linux, thread) to cpus; does nothing if cpus is empty. """
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+
+def run_pinned(cpus, target, *args, **kwargs):
+    """ Process target running target(*args, **kwargs) on cpus. """
+    pin(cpus)
+    return target(*args, **kwargs)
+
+
+class Placement(object):
+    """
+    Splits the CPUs of an actor between
+        - service_count cores for the sender, the checkpoint file server and the evaluator, which
+          share them;
+        - one core per emulator worker, shared round-robin when there are more workers than cores;
+        - the actor process, whose TF session sizes its thread pools to the cores it gets: all
+          the cores left, and at least one.
+    Services only get their own cores if at least one core per worker and one for the actor are
+    left; otherwise they are pinned to all the cores of the placement, since processes started by
+    the pinned actor would otherwise inherit its cores.
+
+    The actor process should be pinned (pin_actor) before it allocates the runners' shared
+    arrays: Linux places a page on the NUMA node of the thread that first touches it, so the
+    arrays then live on the actor's node, which is also filled with workers first. Workers placed
+    on another node access them remotely.
+    """
+
+    def __init__(self, workers, cpus=None, service_count=1):
+        cpus = ordered_cpus(sorted(cpus or os.sched_getaffinity(0)))
+        self.cpus = cpus
+        self.service_cpus = list(cpus)
+        if service_count > 0 and len(cpus) >= service_count + workers + 1:
+            self.service_cpus = cpus[-service_count:]
+            cpus = cpus[:-service_count]
+
+        actor_count = max(1, len(cpus) - workers)
+        self.actor_cpus = cpus[:actor_count]
+        worker_cpus = cpus[actor_count:] or cpus
+        self.worker_cpus = [[worker_cpus[i % len(worker_cpus)]] for i in range(workers)]
+
+    @property
+    def intra_op_threads(self):
+        return len(self.actor_cpus)
+
+    @property
+    def inter_op_threads(self):
+        return min(2, len(self.actor_cpus))
+
+    def pin_actor(self):
+        pin(self.actor_cpus)
+
+    def describe(self):
+        """ :return: lines describing the layout """
+        nodes = numa_nodes() or {}
+        node_of = {cpu: node for node, node_cpus in nodes.items() for cpu in node_cpus}
+
+        def cpu_list(cpus):
+            return ','.join('{}(node {})'.format(cpu, node_of.get(cpu, 0)) for cpu in cpus) or 'all'
+
+        lines = ['{} cpus, {} NUMA node(s)'.format(len(self.cpus), max(1, len(nodes))),
+                 'actor (inference, {} intra-op / {} inter-op threads): {}'.format(
+                         self.intra_op_threads, self.inter_op_threads, cpu_list(self.actor_cpus)),
+                 'services (sender, file server, evaluator): {}'.format(cpu_list(self.service_cpus))]
+        lines += ['emulator worker {}: {}'.format(i, cpu_list(cpus)) for i, cpus in enumerate(self.worker_cpus)]
+        return lines
+
+    def log(self):
+        for line in self.describe():
+            logging.info('Placement: ' + line)
+
+
+def create_placement(args):
+    """
+    :return: the Placement selected by the training arguments, or None without --pin_cpus
+    """
+    if not args.pin_cpus:
+        return None
+    return Placement(args.emulator_workers, args.actor_cpus, args.service_cpus)
@@ -18,6 +18,9 @@ class PolicyVNetwork(Network):
                 self.critic_target_ph = tf.placeholder(
                     "float32", [None], name='target')
                 self.adv_actor_ph = tf.placeholder("float", [None], name='advantage')
+                # Per-sample loss weights, e.g. to down-weight stale samples. All ones unless fed
+                self.sample_weight_ph = tf.placeholder_with_default(tf.ones_like(self.critic_target_ph), [None],
+                                                                    name='sample_weight')
 
                 # Final actor layer
                 layer_name = 'actor_output'
@@ -47,10 +50,10 @@ class PolicyVNetwork(Network):
                 self.actor_objective_entropy_term = tf.multiply(self.entropy_regularisation_strength, self.output_layer_entropy)
 
                 self.actor_objective_mean = tf.reduce_mean(tf.multiply(tf.constant(-1.0),
-                                                                       tf.add(self.actor_objective_advantage_term, self.actor_objective_entropy_term)),
+                                                                       tf.add(self.actor_objective_advantage_term, self.actor_objective_entropy_term)) * self.sample_weight_ph,
                                                            name='mean_actor_objective')
 
-                self.critic_loss_mean = tf.reduce_mean(tf.scalar_mul(0.25, tf.pow(self.critic_loss, 2)), name='mean_critic_loss')
+                self.critic_loss_mean = tf.reduce_mean(tf.scalar_mul(0.25, tf.pow(self.critic_loss, 2)) * self.sample_weight_ph, name='mean_critic_loss')
 
                 # Loss scaling is used because the learning rate was initially runed tuned to be used with
                 # max_local_steps = 5 and summing over timesteps, which is now replaced with the mean.
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    profiler
+    Description  :    Low-overhead timing of the stages of the actor loop.
+"""
+
+import json, os, time
+import numpy as np
+
+
+class RollingHistogram(object):
+    """
+    Keeps the last `capacity` samples in a numpy ring buffer, plus running totals since creation.
+    """
+
+    def __init__(self, capacity=4096):
+        self.samples = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        self.count += 1
+        self.total += value
+
+    def window(self):
+        return self.samples[:min(self.count, self.capacity)]
+
+    def percentiles(self, qs):
+        window = self.window()
+        if len(window) == 0:
+            return [0.0] * len(qs)
+        return np.percentile(window, qs).tolist()
+
+    def summary(self, scale=1.0):
+        p50, p99 = self.percentiles([50, 99])
+        window = self.window()
+        return {'count': self.count,
+                'mean': float(window.mean()) * scale if len(window) else 0.0,
+                'p50': p50 * scale,
+                'p99': p99 * scale,
+                'total': self.total * scale}
+
+
+class _Stage(object):
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.start)
+        return False
+
+
+class StageProfiler(object):
+    """
+    Times named stages with `with profiler.stage('name'): ...`, or records externally measured
+    durations with record(). Durations are reported in milliseconds. Unitless values (e.g. batch
+    sizes) are recorded with observe() and reported unscaled, apart from the durations.
+    """
+
+    enabled = True
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.histograms = {}
+        self.metrics = {}
+        self.stages = {}
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = RollingHistogram(self.capacity)
+        return self.histograms[name]
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = _Stage(self.histogram(name))
+        return self.stages[name]
+
+    def record(self, name, seconds):
+        self.histogram(name).add(seconds)
+
+    def observe(self, name, value):
+        if name not in self.metrics:
+            self.metrics[name] = RollingHistogram(self.capacity)
+        self.metrics[name].add(value)
+
+    def summary(self):
+        return {name: histogram.summary(scale=1000.0) for name, histogram in sorted(self.histograms.items())}
+
+    def metrics_summary(self):
+        return {name: histogram.summary() for name, histogram in sorted(self.metrics.items())}
+
+    def write_summaries(self, summary_writer, step):
+        import tensorflow as tf
+        values = []
+        for name, stats in self.summary().items():
+            values.append(tf.Summary.Value(tag='profile/{}/p50_ms'.format(name), simple_value=stats['p50']))
+            values.append(tf.Summary.Value(tag='profile/{}/p99_ms'.format(name), simple_value=stats['p99']))
+        for name, stats in self.metrics_summary().items():
+            values.append(tf.Summary.Value(tag='profile/{}/p50'.format(name), simple_value=stats['p50']))
+            values.append(tf.Summary.Value(tag='profile/{}/p99'.format(name), simple_value=stats['p99']))
+        summary_writer.add_summary(tf.Summary(value=values), step)
+        summary_writer.flush()
+
+    def write_json(self, path, **extra):
+        data = dict(extra, time=time.time(), stages_ms=self.summary())
+        if self.metrics:
+            data['metrics'] = self.metrics_summary()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullProfiler(object):
+    """ Drop-in for StageProfiler when profiling is off. """
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def record(self, name, seconds):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def summary(self):
+        return {}
+
+    def write_summaries(self, summary_writer, step):
+        pass
+
+    def write_json(self, path, **extra):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def create_profiler(enabled):
+    return StageProfiler() if enabled else NULL_PROFILER
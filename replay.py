@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    replay
+    Description  :    Experience replay for the learner: frames are stored once (not once per 4-frame
+                      stack), optionally compressed, in a byte ring sized by a memory budget, and
+                      sampled as fixed-length segments, uniformly or by priority.
+"""
+
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+FRAME_SHAPE = (84, 84)
+FRAME_BYTES = FRAME_SHAPE[0] * FRAME_SHAPE[1]
+
+
+def get_codec(name):
+    """
+    :return: (compress, decompress) functions for single frames, or (None, None) for 'none'
+    """
+    if name == 'none':
+        return None, None
+    elif name == 'lz4':
+        import lz4.block
+        return (lambda frame: lz4.block.compress(frame, store_size=False),
+                lambda data: lz4.block.decompress(data, uncompressed_size=FRAME_BYTES))
+    elif name == 'zlib':
+        return lambda frame: zlib.compress(frame, 1), zlib.decompress
+    else:
+        raise Exception('Replay compression not recognized')
+
+
+class SumTree(object):
+    """ Binary sum tree over a fixed number of leaves, with vectorized updates and prefix-sum search. """
+
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.nodes = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self):
+        return self.nodes[1]
+
+    def update(self, indices, values):
+        indices = np.asarray(indices) + self.leaves
+        self.nodes[indices] = values
+        while indices[0] > 1:
+            indices = np.unique(indices // 2)
+            self.nodes[indices] = self.nodes[2 * indices] + self.nodes[2 * indices + 1]
+
+    def get(self, indices):
+        return self.nodes[np.asarray(indices) + self.leaves]
+
+    def find(self, values):
+        """
+        :param values: prefix sums in [0, total)
+        :return: the leaf index of each prefix sum
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.minimum(np.array(values, dtype=np.float64), np.nextafter(self.total(), 0))
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            go_right = values >= self.nodes[left]
+            values -= np.where(go_right, self.nodes[left], 0.0)
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class FrameStore(object):
+    """
+    Byte ring of frames. Frames get increasing ids and are evicted oldest first when the ring (or
+    its index of max_frames entries) is full, so a frame is stored iff its id >= first_id.
+    """
+
+    def __init__(self, memory_bytes, compression='none', max_frames=None):
+        self.compress, self.decompress = get_codec(compression)
+        self.memory = np.zeros(memory_bytes, dtype=np.uint8)
+        if max_frames is None:
+            # Compressed frames are several times smaller than raw ones
+            max_frames = memory_bytes // FRAME_BYTES * (1 if self.compress is None else 8)
+        self.max_frames = max_frames
+        self.offsets = np.zeros(max_frames, dtype=np.int64)
+        self.lengths = np.zeros(max_frames, dtype=np.int64)
+        self.first_id = 0
+        self.next_id = 0
+        self.write_offset = 0
+
+    def __len__(self):
+        return self.next_id - self.first_id
+
+    def add(self, frame):
+        """
+        :param frame: (84, 84) uint8 frame
+        :return: the frame id
+        """
+        data = np.ascontiguousarray(frame).reshape(-1)
+        if self.compress is not None:
+            data = np.frombuffer(self.compress(data), dtype=np.uint8)
+        length = len(data)
+        if length > len(self.memory):
+            raise Exception('Replay memory smaller than a frame')
+        if self.write_offset + length > len(self.memory):
+            self._evict_range(self.write_offset, len(self.memory))
+            self.write_offset = 0
+        self._evict_range(self.write_offset, self.write_offset + length)
+        if self.next_id - self.first_id >= self.max_frames:
+            self.first_id += 1
+
+        slot = self.next_id % self.max_frames
+        self.memory[self.write_offset:self.write_offset + length] = data
+        self.offsets[slot] = self.write_offset
+        self.lengths[slot] = length
+        self.write_offset += length
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _evict_range(self, start, stop):
+        """ Evicts, oldest first, the frames overlapping [start, stop) of the ring. """
+        while self.first_id < self.next_id:
+            slot = self.first_id % self.max_frames
+            offset = self.offsets[slot]
+            if offset + self.lengths[slot] <= start or offset >= stop:
+                break
+            self.first_id += 1
+
+    def get(self, frame_id, out):
+        slot = frame_id % self.max_frames
+        data = self.memory[self.offsets[slot]:self.offsets[slot] + self.lengths[slot]]
+        if self.decompress is None:
+            out[...] = data.reshape(FRAME_SHAPE)
+        else:
+            out[...] = np.frombuffer(self.decompress(data.tobytes()), dtype=np.uint8).reshape(FRAME_SHAPE)
+
+
+class ReplayBuffer(object):
+    """
+    Stores rollouts as per-emulator segments of `steps` transitions: the frame ids of the steps + 1
+    stacked states, and the rewards, episode masks, action indices, behaviour values and behaviour
+    probabilities of the actions (1 when the rollout does not carry them).
+
+    Frames are deduplicated along the stacks of a segment, and with the last stack of the previous
+    segment of the same stream (actor and emulator), so a 5-step segment adds about 5 frames
+    instead of 24. Segments are evicted with their oldest frame.
+
+    sample() rebuilds the stacked states with a pool of decompression threads. With prioritized,
+    segments are drawn with probability p^alpha from a sum tree and returned with normalized
+    importance weights (N * P)^-beta.
+    """
+
+    def __init__(self, memory_bytes, steps, stack=4, compression='none', workers=4, prioritized=False,
+                 alpha=0.6, beta=0.4, max_segments=None):
+        self.frames = FrameStore(memory_bytes, compression)
+        self.steps = steps
+        self.stack = stack
+        if max_segments is None:
+            max_segments = max(1, self.frames.max_frames // steps)
+        self.max_segments = max_segments
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+
+        self.frame_ids = np.zeros((max_segments, steps + 1, stack), dtype=np.int64)
+        self.rewards = np.zeros((max_segments, steps), dtype=np.float32)
+        self.masks = np.zeros((max_segments, steps), dtype=np.float32)
+        self.actions = np.zeros((max_segments, steps), dtype=np.uint8)
+        self.values = np.zeros((max_segments, steps), dtype=np.float32)
+        self.behaviour_probs = np.ones((max_segments, steps), dtype=np.float32)
+        self.first_segment = 0
+        self.next_segment = 0
+        self.priorities = SumTree(max_segments)
+        self.max_priority = 1.0
+        # stream -> (last stacked state, its frame ids)
+        self.streams = {}
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def __len__(self):
+        return self.next_segment - self.first_segment
+
+    def _add_stack(self, stream, state):
+        """
+        :return: the frame ids of the (84, 84, stack) state, adding only the frames not already stored
+        """
+        previous = self.streams.get(stream)
+        if previous is not None and previous[1][0] >= self.frames.first_id:
+            previous_state, previous_ids = previous
+            if np.array_equal(previous_state, state):
+                return previous_ids
+            if np.array_equal(previous_state[..., 1:], state[..., :-1]):
+                ids = np.append(previous_ids[1:], self.frames.add(state[..., -1]))
+                self.streams[stream] = (state, ids)
+                return ids
+        ids = np.array([self.frames.add(state[..., k]) for k in range(self.stack)], dtype=np.int64)
+        self.streams[stream] = (state, ids)
+        return ids
+
+    def insert(self, rollout, source=0):
+        """
+        :param rollout: rollout_schema.Rollout of `steps` steps
+        :param source: identifies the actor, so that consecutive rollouts of an emulator share frames
+        """
+        states, rewards, masks, actions, values = rollout[:5]
+        behaviour_probs = getattr(rollout, 'behaviour_probs', None)
+        if behaviour_probs is None:
+            behaviour_probs = np.ones(rewards.shape, dtype=np.float32)
+        if rewards.shape[0] != self.steps:
+            raise Exception('Replay segments have {} steps, got a rollout of {}'.format(self.steps, rewards.shape[0]))
+        for n in range(rewards.shape[1]):
+            ids = np.stack([self._add_stack((source, n), states[t, n]) for t in range(self.steps + 1)])
+            self._evict_segments()
+            if self.next_segment - self.first_segment >= self.max_segments:
+                self._drop_first_segment()
+            index = self.next_segment % self.max_segments
+            self.frame_ids[index] = ids
+            self.rewards[index] = rewards[:, n]
+            self.masks[index] = masks[:, n]
+            self.actions[index] = actions[:, n]
+            self.values[index] = values[:, n]
+            self.behaviour_probs[index] = behaviour_probs[:, n]
+            self.priorities.update([index], [self.max_priority ** self.alpha if self.prioritized else 1.0])
+            self.next_segment += 1
+        self._evict_segments()
+
+    def _drop_first_segment(self):
+        self.priorities.update([self.first_segment % self.max_segments], [0.0])
+        self.first_segment += 1
+
+    def _evict_segments(self):
+        while self.first_segment < self.next_segment and \
+                self.frame_ids[self.first_segment % self.max_segments].min() < self.frames.first_id:
+            self._drop_first_segment()
+
+    def sample(self, batch_segments):
+        """
+        :return: (segment numbers, (states, rewards, masks, actions, values, behaviour probabilities)
+                 with the segments along the emulator axis, importance weights (batch_segments,))
+        """
+        if len(self) == 0:
+            raise Exception('Sampling from an empty replay buffer')
+        total = self.priorities.total()
+        indices = self.priorities.find(np.random.uniform(0, total, size=batch_segments))
+        numbers = self.first_segment + (indices - self.first_segment) % self.max_segments
+        if self.prioritized:
+            probabilities = self.priorities.get(indices) / total
+            weights = (len(self) * probabilities) ** -self.beta
+            weights = (weights / weights.max()).astype(np.float32)
+        else:
+            weights = np.ones(batch_segments, dtype=np.float32)
+
+        frame_ids = self.frame_ids[indices]
+        unique_ids, inverse = np.unique(frame_ids, return_inverse=True)
+        frames = np.empty((len(unique_ids),) + FRAME_SHAPE, dtype=np.uint8)
+        chunks = np.array_split(np.arange(len(unique_ids)), min(len(unique_ids), self.workers))
+        list(self.pool.map(lambda chunk: [self.frames.get(unique_ids[i], frames[i]) for i in chunk], chunks))
+        # (segments, steps + 1, stack, 84, 84) -> (steps + 1, segments, 84, 84, stack)
+        states = frames[inverse.reshape(frame_ids.shape)].transpose(1, 0, 3, 4, 2)
+
+        return (numbers, (np.ascontiguousarray(states), self.rewards[indices].T, self.masks[indices].T,
+                          self.actions[indices].T, self.values[indices].T, self.behaviour_probs[indices].T),
+                weights)
+
+    def update_priorities(self, numbers, priorities):
+        """
+        :param numbers: segment numbers returned by sample(); those evicted since are skipped
+        """
+        if not self.prioritized:
+            return
+        priorities = np.maximum(priorities, 1e-6)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        live = numbers >= self.first_segment
+        if live.any():
+            self.priorities.update(numbers[live] % self.max_segments, priorities[live] ** self.alpha)
+
+    def close(self):
+        self.pool.shutdown()
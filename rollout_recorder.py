@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    rollout_recorder
+    Description  :    Records the rollouts of an actor to disk and replays them into a transport, to
+                      benchmark the learner and transports on a fixed workload with no emulators
+                      running, or to build offline datasets.
+
+    A recording folder holds chunks of rollouts_per_chunk rollouts. Every field of a chunk is one
+    .npy file (chunk_<n>.<field>.npy) written through a memory map, with the rollouts along the
+    first axis. index.json lists the fields with their shapes and dtypes and the rollouts in every
+    chunk; headers.jsonl holds the rollout headers, one per line.
+
+        python3 rollout_recorder.py logs/recording --learner_address tcp://127.0.0.1:6666 --rate 50
+"""
+
+import argparse, json, logging, os, sys, time
+import numpy as np
+
+FIELDS = ['states', 'rewards', 'masks', 'actions', 'values', 'policies']
+INDEX_VERSION = 1
+
+
+class RolloutRecorder(object):
+    """
+    Appends rollouts (states, rewards, masks, actions, values[, behaviour policies]) to memory-mapped
+    chunk files. All rollouts of a recording must have the same shapes. The index is rewritten
+    atomically whenever a chunk is started and on close, so a reader sees complete rollouts only.
+    Recording into a folder that holds a recording appends to it, in new chunks; rollouts that were
+    not in its index yet are dropped.
+    """
+
+    def __init__(self, folder, rollouts_per_chunk=256):
+        self.folder = folder
+        self.rollouts_per_chunk = rollouts_per_chunk
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.fields = None
+        self.chunks = []
+        self.chunk = None
+        headers = []
+        if os.path.exists(os.path.join(folder, 'index.json')):
+            reader = RolloutReader(folder)
+            self.fields = reader.index['fields']
+            self.chunks = reader.index['chunks']
+            headers = reader.headers[:len(reader)]
+            logging.info('Appending to the {} rollouts recorded in {}'.format(len(reader), folder))
+        # Rewritten, so that the headers stay paired with the rollouts of the index
+        self.headers_file = open(os.path.join(folder, 'headers.jsonl'), 'w')
+        for header in headers:
+            self.headers_file.write(json.dumps(header) + '\n')
+
+    def _open_chunk(self):
+        name = 'chunk_{:05d}'.format(len(self.chunks))
+        self.chunk = {field: np.lib.format.open_memmap(
+                          os.path.join(self.folder, '{}.{}.npy'.format(name, field)), mode='w+',
+                          dtype=spec['dtype'], shape=tuple([self.rollouts_per_chunk] + spec['shape']))
+                      for field, spec in self.fields.items()}
+        self.chunks.append({'name': name, 'rollouts': 0})
+
+    def record(self, arrays, header=None):
+        """
+        :param arrays: [states, rewards, masks, actions, values] and optionally the (T, N, num_actions)
+                       behaviour policies, as put on the actor's send queue
+        :param header: JSON-serializable rollout header
+        """
+        if self.fields is None:
+            self.fields = collect_fields(arrays)
+        elif self.chunk is None and collect_fields(arrays) != self.fields:
+            raise Exception('The rollouts do not have the fields, shapes and dtypes of the recording in {}'
+                            .format(self.folder))
+        if self.chunk is None or self.chunks[-1]['rollouts'] == self.rollouts_per_chunk:
+            self._flush_chunk()
+            self._open_chunk()
+            self._write_index()
+        index = self.chunks[-1]['rollouts']
+        for field, array in zip(FIELDS, arrays):
+            self.chunk[field][index] = array
+        self.chunks[-1]['rollouts'] += 1
+        self.headers_file.write(json.dumps(header or {}) + '\n')
+
+    def _flush_chunk(self):
+        if self.chunk is not None:
+            for array in self.chunk.values():
+                array.flush()
+            self.headers_file.flush()
+
+    def _write_index(self):
+        index = {'version': INDEX_VERSION, 'rollouts_per_chunk': self.rollouts_per_chunk,
+                 'fields': self.fields, 'chunks': self.chunks}
+        temp_path = os.path.join(self.folder, '.tmpindex.json')
+        with open(temp_path, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.rename(temp_path, os.path.join(self.folder, 'index.json'))
+
+    def close(self):
+        self._flush_chunk()
+        if self.fields is not None:
+            self._write_index()
+        self.chunk = None
+        self.headers_file.close()
+
+
+def collect_fields(arrays):
+    if len(arrays) not in (5, 6):
+        raise Exception('A rollout has 5 arrays, or 6 with the behaviour policies')
+    return {field: {'shape': list(np.shape(array)), 'dtype': np.asarray(array).dtype.str}
+            for field, array in zip(FIELDS, arrays)}
+
+
+class RolloutReader(object):
+    """
+    Reads a recording made by RolloutRecorder. The chunks are opened as read-only memory maps, so
+    rollouts are only paged in when used.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'index.json')) as f:
+            index = json.load(f)
+        if index.get('version') != INDEX_VERSION:
+            raise Exception('Recording index version {} not supported'.format(index.get('version')))
+        self.index = index
+        self.fields = list(index['fields'])
+        self.chunks = [(chunk, {field: np.load(os.path.join(folder, '{}.{}.npy'.format(chunk['name'], field)),
+                                               mmap_mode='r')
+                                for field in self.fields})
+                       for chunk in index['chunks'] if chunk['rollouts'] > 0]
+        self.headers = []
+        with open(os.path.join(folder, 'headers.jsonl')) as f:
+            for line in f:
+                self.headers.append(json.loads(line))
+
+    def __len__(self):
+        return sum(chunk['rollouts'] for chunk, _ in self.chunks)
+
+    def __iter__(self):
+        """ Yields (arrays, header) in recording order; the arrays are views of the memory maps. """
+        rollout = 0
+        for chunk, arrays in self.chunks:
+            for i in range(chunk['rollouts']):
+                header = self.headers[rollout] if rollout < len(self.headers) else {}
+                yield [arrays[field][i] for field in self.fields], header
+                rollout += 1
+
+
+def replay_rollouts(reader, send, rate=0.0, loops=1):
+    """
+    Streams the rollouts of a recording into send(arrays, header).
+    :param rate: rollouts per second, 0 for as fast as send allows
+    :param loops: passes over the recording, 0 for endless
+    :return: (rollouts sent, seconds elapsed)
+    """
+    sent = 0
+    start_time = time.time()
+    loop = 0
+    while loops <= 0 or loop < loops:
+        for arrays, header in reader:
+            if rate > 0:
+                delay = start_time + sent / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            send(arrays, header)
+            sent += 1
+        loop += 1
+    return sent, time.time() - start_time
+
+
+def zmq_sender(address, float_dtype='float16', identity=b'replayer'):
+    """
+    :return: send(arrays, header) encoding rollouts with rollout_schema to a learner (or broker)
+             like the actors' sender process
+    """
+    import zmq
+    from rollout_schema import encode_rollout, behaviour_action_probs
+    req = zmq.Context().socket(zmq.REQ)
+    req.setsockopt(zmq.IDENTITY, identity)
+    req.connect(address)
+
+    def send(arrays, header):
+        now = time.time()
+        # Fresh timestamps, so the learner's latency traces measure the replay and not the recording
+        header = dict(header, created=now, enqueued=now)
+        behaviour_probs = behaviour_action_probs(arrays[5], arrays[3]) if len(arrays) > 5 else None
+        req.send_multipart(encode_rollout(*arrays[:5], float_dtype=float_dtype, behaviour_probs=behaviour_probs,
+                                          sent=now, **header), copy=False)
+        req.recv_string()
+
+    return send
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', type=str, help="Recording folder (train.py --record_rollouts)")
+    parser.add_argument('--learner_address', default='tcp://127.0.0.1:6666', type=str, help="Address of the learner or broker the rollouts are sent to. Default is tcp://127.0.0.1:6666.", dest="learner_address")
+    parser.add_argument('--rate', default=0, type=float, help="Rollouts per second. Default is 0 (as fast as the learner takes them).", dest="rate")
+    parser.add_argument('--loops', default=1, type=int, help="Passes over the recording, 0 for endless. Default is 1.", dest="loops")
+    parser.add_argument('--rollout_float_dtype', default='float16', choices=['float16', 'float32'], type=str, help="Precision of the rewards and values sent. Default is float16.", dest="rollout_float_dtype")
+    args = parser.parse_args()
+
+    reader = RolloutReader(args.folder)
+    logging.info("Replaying {} rollouts from {}".format(len(reader), args.folder))
+    sent, elapsed = replay_rollouts(reader, zmq_sender(args.learner_address, args.rollout_float_dtype),
+                                    args.rate, args.loops)
+    logging.info("Sent {} rollouts in {:.1f}s ({:.1f} rollouts/s)".format(sent, elapsed, sent / elapsed))
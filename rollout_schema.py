@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+    File name    :    rollout_schema
+    Description  :    Wire format of the rollouts sent from the actors to the learner, shared by every
+                      transport (ZMQ multipart frames, gRPC, in-process).
+
+    A rollout is encoded as a list of frames:
+        0. header: JSON with the schema version, the shapes and the encoding of the other frames
+        1. states (T+1, N, 84, 84, 4) uint8, zlib compressed unless states_codec is 'raw'
+        2. rewards (T, N) in float_dtype
+        3. episode-not-over masks (T, N), bit-packed
+        4. action indices (T, N) uint8
+        5. values (T, N) in float_dtype
+        6. optional: behaviour probabilities of the taken actions (T, N) float32, if the header
+           has behaviour_probs set
+
+    Header fields set by the actors for tracing: actor_id, param_version (step of the learner
+    checkpoint the rollout was produced with, null before the first one) and the wall-clock times
+    created (start of the rollout), enqueued and sent. The learner adds received.
+"""
+
+import collections, json, struct, zlib
+import numpy as np
+
+SCHEMA_VERSION = 1
+
+Rollout = collections.namedtuple('Rollout', ['states', 'rewards', 'masks', 'actions', 'values', 'header',
+                                             'behaviour_probs'], defaults=[None])
+
+
+def behaviour_action_probs(policies, actions):
+    """ (T, N, num_actions) behaviour policies to the (T, N) probabilities of the taken actions. """
+    return np.take_along_axis(np.asarray(policies, dtype=np.float32),
+                              np.asarray(actions, dtype=np.int64)[..., None], axis=-1)[..., 0]
+
+
+def encode_rollout(states, rewards, masks, actions, values, float_dtype='float16', states_codec='zlib',
+                   behaviour_probs=None, **extra):
+    """
+    :param states: (T+1, N, 84, 84, 4) uint8 states, the last one being the bootstrap state
+    :param rewards: (T, N) clipped rewards
+    :param masks: (T, N) 1 where the episode went on after the step, 0 where it ended
+    :param actions: (T, N) action indices
+    :param values: (T, N) values of the behaviour policy
+    :param float_dtype: 'float16' or 'float32', used for rewards and values
+    :param states_codec: 'zlib' or 'raw'
+    :param behaviour_probs: (T, N) probabilities of the actions under the behaviour policy, or None
+    :param extra: additional JSON-serializable header fields
+    :return: list of bytes-like frames
+    """
+    steps, emulators = rewards.shape
+    if float_dtype not in ('float16', 'float32'):
+        raise Exception('Rollout float dtype not recognized')
+    if states_codec not in ('zlib', 'raw'):
+        raise Exception('States codec not recognized')
+    header = dict(extra, version=SCHEMA_VERSION, steps=steps, emulators=emulators,
+                  state_shape=list(states.shape[2:]), float_dtype=float_dtype, states_codec=states_codec,
+                  behaviour_probs=behaviour_probs is not None)
+
+    states_frame = np.ascontiguousarray(states, dtype=np.uint8).reshape(-1).data
+    if states_codec == 'zlib':
+        states_frame = zlib.compress(states_frame)
+    frames = [json.dumps(header).encode(),
+              states_frame,
+              np.ascontiguousarray(rewards, dtype=float_dtype).tobytes(),
+              np.packbits(np.asarray(masks) > 0).tobytes(),
+              np.ascontiguousarray(actions, dtype=np.uint8).tobytes(),
+              np.ascontiguousarray(values, dtype=float_dtype).tobytes()]
+    if behaviour_probs is not None:
+        frames.append(np.ascontiguousarray(behaviour_probs, dtype=np.float32).tobytes())
+    return frames
+
+
+def decode_rollout(frames):
+    """
+    Inverse of encode_rollout. Rewards, masks and values are returned as float32.
+    :param frames: list of bytes-like frames
+    :return: Rollout
+    """
+    header = json.loads(bytes(frames[0]).decode())
+    if header.get('version') != SCHEMA_VERSION:
+        raise Exception('Rollout schema version {} not supported'.format(header.get('version')))
+    steps, emulators = header['steps'], header['emulators']
+    float_dtype = np.dtype(header['float_dtype'])
+
+    states = frames[1]
+    if header['states_codec'] == 'zlib':
+        states = zlib.decompress(states)
+    states = np.frombuffer(states, dtype=np.uint8).reshape([steps + 1, emulators] + header['state_shape'])
+    rewards = np.frombuffer(frames[2], dtype=float_dtype).reshape(steps, emulators).astype(np.float32)
+    masks = np.unpackbits(np.frombuffer(frames[3], dtype=np.uint8))[:steps * emulators]
+    masks = masks.reshape(steps, emulators).astype(np.float32)
+    actions = np.frombuffer(frames[4], dtype=np.uint8).reshape(steps, emulators)
+    values = np.frombuffer(frames[5], dtype=float_dtype).reshape(steps, emulators).astype(np.float32)
+    behaviour_probs = None
+    if header.get('behaviour_probs'):
+        behaviour_probs = np.frombuffer(frames[6], dtype=np.float32).reshape(steps, emulators)
+    return Rollout(states, rewards, masks, actions, values, header, behaviour_probs)
+
+
+def pack_frames(frames):
+    """ Concatenates frames into one buffer, each prefixed by its length, for single-message transports. """
+    parts = [struct.pack('<I', len(frames))]
+    for frame in frames:
+        parts.append(struct.pack('<Q', len(frame)))
+        parts.append(bytes(frame))
+    return b''.join(parts)
+
+
+def unpack_frames(buffer):
+    """ Inverse of pack_frames; the frames are memoryviews into buffer. """
+    buffer = memoryview(buffer)
+    count, = struct.unpack_from('<I', buffer, 0)
+    offset, frames = 4, []
+    for _ in range(count):
+        length, = struct.unpack_from('<Q', buffer, offset)
+        offset += 8
+        frames.append(buffer[offset:offset + length])
+        offset += length
+    return frames
+
+
+def one_hot(actions, num_actions):
+    """ (T, N) action indices to the (T, N, num_actions) float32 one-hot used by the loss. """
+    return np.eye(num_actions, dtype=np.float32)[actions]
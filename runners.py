@@ -1,37 +1,118 @@
+import multiprocessing
 import numpy as np
-from multiprocessing import Queue
+from queue import Queue as ThreadQueue
+from multiprocessing.process import BaseProcess
 from multiprocessing.sharedctypes import RawArray
-from ctypes import c_uint, c_float, c_double
+from ctypes import c_uint8, c_float, c_double, c_int64
+from episode_statistics import create_episode_buffers, EpisodeStatistics
+
+
+class SharedArray(object):
+    """
+    Handle on a slice of a RawArray. Unlike a numpy view, it is still backed by the shared memory
+    after being pickled to a worker started with the spawn or forkserver start methods.
+    """
+
+    def __init__(self, raw, dtype, shape, start, stop):
+        self.raw = raw
+        self.dtype = dtype
+        self.shape = shape
+        self.start = start
+        self.stop = stop
+
+    def numpy(self):
+        return np.frombuffer(self.raw, self.dtype).reshape(self.shape)[self.start:self.stop]
+
+
+def use_start_method(process, context):
+    """
+    Makes a multiprocessing.Process subclass instance start with the start method of context, without
+    changing the start method of the other processes.
+    """
+    process._Popen = context.Process._Popen
 
 
 class Runners(object):
 
-    NUMPY_TO_C_DTYPE = {np.float32: c_float, np.float64: c_double, np.uint8: c_uint}
+    NUMPY_TO_C_DTYPE = {np.float32: c_float, np.float64: c_double, np.uint8: c_uint8, np.int64: c_int64}
 
-    def __init__(self, EmulatorRunner, emulators, workers, variables):
-        self.variables = [self._get_shared(var) for var in variables]
+    def __init__(self, EmulatorRunner, environment_creator, workers, variables, episode_capacity=100, worker_cpus=None,
+                 start_method=None):
+        """
+        :param EmulatorRunner: the runner class
+        :param environment_creator: creates the emulators, inside the runners
+        :param workers: number of runners; must divide the number of emulators
+        :param variables: initial values of the state, reward, episode_over and action arrays,
+                          one row per emulator
+        :param episode_capacity: number of finished episodes kept by each runner for the statistics
+        :param worker_cpus: CPUs each runner is pinned to (placement.Placement.worker_cpus), or None
+        :param start_method: multiprocessing start method of the runner processes (and of their queues
+                             and semaphores), or None for the default one
+        """
+        self.context = multiprocessing.get_context(start_method)
+        self.raw_variables = [self._get_raw(var) for var in variables]
+        self.variables = [self._as_numpy(raw, var) for raw, var in zip(self.raw_variables, variables)]
         self.workers = workers
-        self.queues = [Queue() for _ in range(workers)]
-        self.barrier = Queue()
+        self.queues = [self._create_queue() for _ in range(workers)]
+        self.barrier = self._create_queue()
+        # Duration of the last step of each worker, in seconds
+        step_times = np.zeros(workers, dtype=np.float32)
+        self.raw_step_times = self._get_raw(step_times)
+        self.step_times = self._as_numpy(self.raw_step_times, step_times)
+
+        episode_buffers = create_episode_buffers(workers, episode_capacity)
+        raw_episode_buffers = [self._get_raw(buffer) for buffer in episode_buffers]
+        self.episode_statistics = EpisodeStatistics(*[self._as_numpy(raw, buffer) for raw, buffer
+                                                      in zip(raw_episode_buffers, episode_buffers)])
+
+        emulator_counts = variables[0].shape[0]
+        per_worker = emulator_counts // workers
+        if per_worker * workers != emulator_counts:
+            raise Exception('The emulator workers must divide the amount of emulators')
 
-        self.runners = [EmulatorRunner(i, emulators, vars, self.queues[i], self.barrier) for i, (emulators, vars) in
-                        enumerate(zip(np.split(emulators, workers), zip(*[np.split(var, workers) for var in self.variables])))]
+        self.EmulatorRunner = EmulatorRunner
+        self.runners = []
+        for i in range(workers):
+            start, stop = i * per_worker, (i + 1) * per_worker
+            vars = [self._share(raw, var, start, stop) for raw, var in zip(self.raw_variables, variables)]
+            episode_vars = [self._share(raw, buffer, 0, workers) for raw, buffer
+                            in zip(raw_episode_buffers, episode_buffers)]
+            self.runners.append(self._create_runner(i, environment_creator, start, stop, vars,
+                                                    self._share(self.raw_step_times, step_times, 0, workers),
+                                                    episode_vars, worker_cpus[i] if worker_cpus else None))
 
-    def _get_shared(self, array):
+    def _create_runner(self, i, environment_creator, start, stop, vars, step_times, episode_vars, cpus):
+        """ Creates runner i, stepping the emulators [start, stop). """
+        return self.EmulatorRunner(i, environment_creator, range(start, stop), vars, self.queues[i], self.barrier,
+                                   step_times, episode_vars, cpus)
+
+    def _create_queue(self):
+        return self.context.Queue()
+
+    def _get_raw(self, array):
         """
-        Returns a RawArray backed numpy array that can be shared between processes.
+        Returns a RawArray, initialized with array, that can be shared between processes.
         :param array: the array to be shared
-        :return: the RawArray backed numpy array
+        :return: the RawArray
         """
-
         dtype = self.NUMPY_TO_C_DTYPE[array.dtype.type]
+        return RawArray(dtype, array.reshape(-1))
 
-        shape = array.shape
-        shared = RawArray(dtype, array.reshape(-1))
-        return np.frombuffer(shared, dtype).reshape(shape)
+    def _as_numpy(self, raw, array):
+        return np.frombuffer(raw, array.dtype).reshape(array.shape)
+
+    def _share(self, raw, array, start, stop):
+        return SharedArray(raw, array.dtype, array.shape, start, stop)
 
     def start(self):
+        """ Starts the runners and waits until they have built their emulators and initial states. """
+        self._start_runners()
+        self.wait_updated()
+
+    def _start_runners(self):
         for r in self.runners:
+            if isinstance(r, BaseProcess):
+                use_start_method(r, self.context)
             r.start()
 
     def stop(self):
@@ -41,6 +122,12 @@ class Runners(object):
     def get_shared_variables(self):
         return self.variables
 
+    def get_step_times(self):
+        return self.step_times
+
+    def get_episode_statistics(self):
+        return self.episode_statistics
+
     def update_environments(self):
         for queue in self.queues:
             queue.put(True)
@@ -48,3 +135,37 @@ class Runners(object):
     def wait_updated(self):
         for wd in range(self.workers):
             self.barrier.get()
+
+
+class ThreadRunners(Runners):
+    """
+    Runners backed by threads of the actor process. The variables are plain numpy arrays
+    shared by reference and the queues are in-process, so there is no IPC and no per-worker
+    copy of the emulators.
+    """
+
+    def _create_queue(self):
+        return ThreadQueue()
+
+    def _get_raw(self, array):
+        return np.ascontiguousarray(array).copy()
+
+    def _as_numpy(self, raw, array):
+        return raw
+
+    def _share(self, raw, array, start, stop):
+        return raw[start:stop]
+
+
+def get_runners_backend(name):
+    """
+    Returns the (Runners, EmulatorRunner) classes for the given backend name.
+    :param name: 'process' or 'thread'
+    """
+    from emulator_runner import EmulatorRunner, EmulatorThreadRunner
+    if name == 'thread':
+        return ThreadRunners, EmulatorThreadRunner
+    elif name == 'process':
+        return Runners, EmulatorRunner
+    else:
+        raise Exception('Runner backend not recognized')
@@ -0,0 +1,88 @@
+import time
+import numpy as np
+from environment import BaseEnvironment, ObservationPool
+
+IMG_SIZE_X = 84
+IMG_SIZE_Y = 84
+NR_IMAGES = 4
+
+DEFAULT_CONFIG = {
+    'actions': 6,             # number of legal actions
+    'step_latency': 0.0,      # seconds per step
+    'busy': 0,                # 1: spend step_latency spinning on the CPU, 0: sleeping
+    'episode_length': 1000,   # mean episode length, in steps
+    'episode_length_std': 0,  # std of the (normal) episode length distribution
+    'entropy': 0.1,           # fraction of the pixels that change in each new frame
+    'reset_cost': 0.0,        # seconds spent in get_initial_state
+    'reward_probability': 0.05,
+}
+
+
+def parse_synthetic_spec(game):
+    """
+    Parses a game name of the form synthetic:key=value,key=value,...
+    :param game: the -g argument of train.py
+    :return: the configuration, with defaults for the missing keys
+    """
+    config = dict(DEFAULT_CONFIG)
+    _, _, spec = game.partition(':')
+    for item in filter(None, spec.split(',')):
+        key, _, value = item.partition('=')
+        if key not in config:
+            raise Exception('Unknown synthetic environment option: {}'.format(key))
+        config[key] = type(config[key])(float(value))
+    return config
+
+
+def _wait(seconds, busy):
+    if seconds <= 0:
+        return
+    if busy:
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+    else:
+        time.sleep(seconds)
+
+
+class SyntheticEmulator(BaseEnvironment):
+    """
+    Environment without an emulator, with configurable step latency, episode lengths, observation
+    entropy and reset cost. Used to load test the runners, the transports and the learner.
+    """
+
+    def __init__(self, actor_id, args, config):
+        self.config = config
+        self.num_actions = config['actions']
+        self.rng = np.random.RandomState(args.random_seed * (actor_id + 1))
+        self.changed_pixels = int(config['entropy'] * IMG_SIZE_X * IMG_SIZE_Y)
+        self.frame = self.rng.randint(0, 256, size=IMG_SIZE_X * IMG_SIZE_Y).astype(np.uint8)
+        self.observation_pool = ObservationPool(np.zeros((IMG_SIZE_X, IMG_SIZE_Y, NR_IMAGES), dtype=np.uint8))
+        self.steps_left = 0
+
+    def get_legal_actions(self):
+        return np.arange(self.num_actions)
+
+    def get_noop(self):
+        return np.eye(self.num_actions)[0]
+
+    def __new_frame(self):
+        if self.changed_pixels > 0:
+            indices = self.rng.randint(0, self.frame.size, size=self.changed_pixels)
+            self.frame[indices] = self.rng.randint(0, 256, size=self.changed_pixels)
+        self.observation_pool.new_observation(self.frame.reshape(IMG_SIZE_X, IMG_SIZE_Y))
+
+    def get_initial_state(self):
+        _wait(self.config['reset_cost'], self.config['busy'])
+        length = self.rng.normal(self.config['episode_length'], self.config['episode_length_std'])
+        self.steps_left = max(1, int(length))
+        for _ in range(NR_IMAGES):
+            self.__new_frame()
+        return self.observation_pool.get_pooled_observations()
+
+    def next(self, action):
+        _wait(self.config['step_latency'], self.config['busy'])
+        self.__new_frame()
+        self.steps_left -= 1
+        reward = float(self.rng.rand() < self.config['reward_probability'])
+        return self.observation_pool.get_pooled_observations(), reward, self.steps_left <= 0
@@ -1,5 +1,6 @@
 import os
-from train import get_network_and_environment_creator, bool_arg
+import json
+from train import get_network_and_environment_creator, get_arg_parser
 import logger_utils
 import argparse
 import numpy as np
@@ -7,6 +8,8 @@ import time
 import tensorflow as tf
 import random
 from paac import PAACLearner
+from inference import SessionPolicy
+from evaluator import Evaluator, summarize
 
 
 def get_save_frame(name):
@@ -19,51 +22,49 @@ def get_save_frame(name):
 
     return get_frame
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-f', '--folder', type=str, help="Folder where to save the debugging information.", dest="folder", required=True)
-    parser.add_argument('-tc', '--test_count', default='1', type=int, help="The amount of tests to run on the given network", dest="test_count")
-    parser.add_argument('-np', '--noops', default=30, type=int, help="Maximum amount of no-ops to use", dest="noops")
-    parser.add_argument('-gn', '--gif_name', default=None, type=str, help="If provided, a gif will be produced and stored with this name", dest="gif_name")
-    parser.add_argument('-gf', '--gif_folder', default='', type=str, help="The folder where to save gifs.", dest="gif_folder")
-    parser.add_argument('-d', '--device', default='/gpu:0', type=str, help="Device to be used ('/cpu:0', '/gpu:0', '/gpu:1',...)", dest="device")
 
-    args = parser.parse_args()
-    arg_file = os.path.join(args.folder, 'args.json')
-    device = args.device
-    for k, v in logger_utils.load_args(arg_file).items():
-        setattr(args, k, v)
-    args.max_global_steps = 0
-    df = args.folder
-    args.debugging_folder = '/tmp/logs'
-    args.device = device
-
-    args.random_start = False
-    args.single_life_episodes = False
-    if args.gif_name:
-        args.visualize = 1
-
-    args.actor_id = 0
+def load_training_args(folder, args):
+    """
+    Returns the arguments the network in folder was trained with. Options added to train.py after
+    the network was trained take their default values.
+    """
+    training_args = get_arg_parser().parse_args([])
+    for k, v in logger_utils.load_args(os.path.join(folder, 'args.json')).items():
+        setattr(training_args, k, v)
+    training_args.max_global_steps = 0
+    training_args.debugging_folder = '/tmp/logs'
+    training_args.device = args.device
+    training_args.single_life_episodes = False
+    training_args.actor_id = 0
     rng = np.random.RandomState(int(time.time()))
-    args.random_seed = rng.randint(1000)
+    training_args.random_seed = rng.randint(1000)
+    return training_args
+
 
-    network_creator, env_creator = get_network_and_environment_creator(args)
+def create_session(device):
+    config = tf.ConfigProto()
+    if 'gpu' in device:
+        config.gpu_options.allow_growth = True
+    return tf.Session(config=config)
+
+
+def make_gifs(folder, args):
+    """ Plays test_count episodes serially, recording a gif of each. """
+    train_args = load_training_args(folder, args)
+    train_args.random_start = False
+    train_args.visualize = 1
+
+    tf.reset_default_graph()
+    network_creator, env_creator = get_network_and_environment_creator(train_args)
     network = network_creator()
     saver = tf.train.Saver()
 
-    rewards = []
     environments = [env_creator.create_environment(i) for i in range(args.test_count)]
-    if args.gif_name:
-        for i, environment in enumerate(environments):
-            environment.on_new_frame = get_save_frame(os.path.join(args.gif_folder, args.gif_name + str(i)))
-
-    config = tf.ConfigProto()
-    if 'gpu' in args.device:
-        config.gpu_options.allow_growth = True
+    for i, environment in enumerate(environments):
+        environment.on_new_frame = get_save_frame(os.path.join(args.gif_folder, args.gif_name + str(i)))
 
-    with tf.Session(config=config) as sess:
-        checkpoints_ = os.path.join(df, 'checkpoints')
-        network.init(checkpoints_, saver, sess)
+    with create_session(args.device) as sess:
+        network.init(os.path.join(folder, 'checkpoints'), saver, sess)
         states = np.asarray([environment.get_initial_state() for environment in environments])
         if args.noops != 0:
             for i, environment in enumerate(environments):
@@ -71,20 +72,81 @@ if __name__ == '__main__':
                     state, _, _ = environment.next(environment.get_noop())
                     states[i] = state
 
-        episodes_over = np.zeros(args.test_count, dtype=np.bool)
+        episodes_over = np.zeros(args.test_count, dtype=bool)
         rewards = np.zeros(args.test_count, dtype=np.float32)
         while not all(episodes_over):
             actions, _, _ = PAACLearner.choose_next_actions(network, env_creator.num_actions, states, sess)
             for j, environment in enumerate(environments):
+                if episodes_over[j]:
+                    continue
                 state, r, episode_over = environment.next(actions[j])
                 states[j] = state
                 rewards[j] += r
                 episodes_over[j] = episode_over
+    return {'rewards': rewards.tolist()}
 
-        print('Performed {} tests for {}.'.format(args.test_count, args.game))
-        print('Mean: {0:.2f}'.format(np.mean(rewards)))
-        print('Min: {0:.2f}'.format(np.min(rewards)))
-        print('Max: {0:.2f}'.format(np.max(rewards)))
-        print('Std: {0:.2f}'.format(np.std(rewards)))
 
+def evaluate(folder, args):
+    """ Evaluates the latest checkpoint in folder on test_count episodes, with the emulators stepped in parallel. """
+    train_args = load_training_args(folder, args)
+    train_args.random_start = args.noops != 0
+    train_args.max_start_wait = args.noops
+
+    tf.reset_default_graph()
+    network_creator, env_creator = get_network_and_environment_creator(train_args)
+    network = network_creator()
+    saver = tf.train.Saver()
+
+    with create_session(args.device) as sess:
+        checkpoints_ = os.path.join(folder, 'checkpoints')
+        step = network.init(checkpoints_, saver, sess)
+        evaluator = Evaluator(env_creator, SessionPolicy(network, sess, saver), args.environments,
+                              args.emulator_workers, args.runner_backend, args.max_episode_steps)
+        results = evaluator.evaluate(args.test_count)
+
+    summary = summarize(results)
+    summary.update({'folder': folder, 'game': train_args.game, 'checkpoint_step': step})
+    summary.update(results)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--folder', type=str, nargs='+', help="Folder(s) of the trained networks. Each one is evaluated in turn.", dest="folders", required=True)
+    parser.add_argument('-tc', '--test_count', default='1', type=int, help="The amount of tests to run on the given network", dest="test_count")
+    parser.add_argument('-np', '--noops', default=30, type=int, help="Maximum amount of no-ops to use", dest="noops")
+    parser.add_argument('-gn', '--gif_name', default=None, type=str, help="If provided, a gif will be produced and stored with this name", dest="gif_name")
+    parser.add_argument('-gf', '--gif_folder', default='', type=str, help="The folder where to save gifs.", dest="gif_folder")
+    parser.add_argument('-d', '--device', default='/gpu:0', type=str, help="Device to be used ('/cpu:0', '/gpu:0', '/gpu:1',...)", dest="device")
+    parser.add_argument('-ne', '--environments', default=32, type=int, help="The amount of emulators stepped in parallel. Default is 32.", dest="environments")
+    parser.add_argument('-ew', '--emulator_workers', default=8, type=int, help="The amount of emulator workers. Default is 8.", dest="emulator_workers")
+    parser.add_argument('-rb', '--runner_backend', default='process', choices=['process', 'thread'], type=str, help="Whether emulator workers are processes or threads. Default is process.", dest="runner_backend")
+    parser.add_argument('--max_episode_steps', default=0, type=int, help="Episodes are cut off after this many steps (0: no limit).", dest="max_episode_steps")
+    parser.add_argument('-o', '--output', default=None, type=str, help="If provided, the results are written to this JSON file", dest="output")
+
+    args = parser.parse_args()
 
+    all_results = []
+    for folder in args.folders:
+        if args.gif_name:
+            results = make_gifs(folder, args)
+            print('Performed {} tests for {}.'.format(args.test_count, folder))
+            rewards = np.asarray(results['rewards'])
+            print('Mean: {0:.2f}'.format(np.mean(rewards)))
+            continue
+
+        results = evaluate(folder, args)
+        all_results.append(results)
+        print('Performed {} tests for {} ({}).'.format(results['episodes'], results['game'], folder))
+        if results['episodes'] == 0:
+            print('No episode finished within --max_episode_steps.')
+            continue
+        print('Mean: {0:.2f}'.format(results['mean']))
+        print('95% CI: [{0:.2f}, {1:.2f}]'.format(*results['ci95']))
+        print('Min: {0:.2f}'.format(results['min']))
+        print('Max: {0:.2f}'.format(results['max']))
+        print('Std: {0:.2f}'.format(results['std']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2)
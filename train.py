@@ -5,9 +5,9 @@ import signal
 import os
 import copy
 
+
 import environment_creator
-from paac import PAACLearner
-from policy_v_network import NaturePolicyVNetwork, NIPSPolicyVNetwork
+from placement import create_placement
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
 
@@ -28,7 +28,18 @@ def main(args):
 
     network_creator, env_creator = get_network_and_environment_creator(args)
 
-    learner = PAACLearner(network_creator, env_creator, args)
+    placement = create_placement(args)
+    if placement is not None:
+        # Before TensorFlow starts its threads and the runners allocate their shared arrays
+        placement.pin_actor()
+        args.intra_op_threads = args.intra_op_threads or placement.intra_op_threads
+        args.inter_op_threads = args.inter_op_threads or placement.inter_op_threads
+        args.eval_cpus = args.eval_cpus or placement.service_cpus
+        placement.log()
+
+    # TensorFlow is only imported here, so that modules used by the emulator runners stay light
+    from paac import PAACLearner
+    learner = PAACLearner(network_creator, env_creator, args, placement)
 
     setup_kill_signal_handler(learner)
 
@@ -52,6 +63,7 @@ def setup_kill_signal_handler(learner):
 
 
 def get_network_and_environment_creator(args, random_seed=3):
+    from policy_v_network import NaturePolicyVNetwork, NIPSPolicyVNetwork
     env_creator = environment_creator.EnvironmentCreator(args)
     num_actions = env_creator.num_actions
     args.num_actions = num_actions
@@ -96,14 +108,52 @@ def get_arg_parser():
     parser.add_argument('--single_life_episodes', default=False, type=bool_arg, help="If True, training episodes will be terminated when a life is lost (for games)", dest="single_life_episodes")
     parser.add_argument('-ec', '--emulator_counts', default=32, type=int, help="The amount of emulators per agent. Default is 32.", dest="emulator_counts")
     parser.add_argument('-ew', '--emulator_workers', default=8, type=int, help="The amount of emulator workers per agent. Default is 8.", dest="emulator_workers")
+    parser.add_argument('--max_start_wait', default=30, type=int, help="Max. number of no-ops at the start of each episode when random_start is set. Default is 30.", dest="max_start_wait")
+    parser.add_argument('-rb', '--runner_backend', default='process', choices=['process', 'thread'], type=str, help="Whether emulator workers are processes or threads of the actor. Default is process.", dest="runner_backend")
+    parser.add_argument('--fast_ale', default=False, type=bool_arg, help="If True, step the Atari emulators through direct ctypes bindings of the ALE C API (fast_atari_emulator.py) instead of the Python wrapper. At startup it is checked to give the same observations, rewards and terminals as the wrapper.", dest="fast_ale")
+    parser.add_argument('--worker_start_method', default='forkserver', choices=['fork', 'forkserver', 'spawn'], type=str, help="How the emulator worker processes are started. With forkserver (default) they are forked from a clean process, without a copy of TensorFlow.", dest="worker_start_method")
     parser.add_argument('-df', '--debugging_folder', default='logs/', type=str, help="Folder where to save the debugging information.", dest="debugging_folder")
     parser.add_argument('-rs', '--random_start', default=True, type=bool_arg, help="Whether or not to start with 30 noops for each env. Default True", dest="random_start")
+    parser.add_argument('-ai', '--actor_id', default=0, type=int, help="Index of this actor in an actor fleet, used to offset the emulator seeds. Default is 0.", dest="actor_id")
+    parser.add_argument('-la', '--learner_address', default='tcp://127.0.0.1:6666', type=str, help="ZMQ address of the learner or rollout broker the batches are sent to; empty to only record them (--record_rollouts).", dest="learner_address")
+    parser.add_argument('--send_queue_size', default=8, type=int, help="Max. number of rollouts waiting to be sent to the learner before the actor blocks. Default is 8.", dest="send_queue_size")
+    parser.add_argument('--rollout_float_dtype', default='float16', choices=['float16', 'float32'], type=str, help="Precision of the rewards and values sent to the learner (see rollout_schema.py). Default is float16.", dest="rollout_float_dtype")
+    parser.add_argument('--record_rollouts', default=None, type=str, help="Folder the rollouts and behaviour policies are recorded to, for rollout_recorder.py. Default: no recording.", dest="record_rollouts")
+    parser.add_argument('--record_chunk_size', default=256, type=int, help="Rollouts per chunk file of the recording. Default is 256.", dest="record_chunk_size")
+    parser.add_argument('-im', '--inference_mode', default='session', choices=['session', 'frozen', 'frozen_int8', 'numpy', 'remote'], type=str, help="How actors compute their actions: in their own TF session, in a frozen constant-folded copy of the policy graph (frozen_int8 also stores the weights as 8 bit), with the numpy forward pass of numpy_network.py, or on a shared inference server (inference_server.py). Default is session.", dest="inference_mode")
+    parser.add_argument('--inference_address', default='tcp://127.0.0.1:6670', type=str, help="ZMQ address of the inference server, used with --inference_mode remote.", dest="inference_address")
+    parser.add_argument('--file_server_host', default='127.0.0.1', type=str, help="Interface the checkpoint upload server listens on.", dest="file_server_host")
+    parser.add_argument('--file_server_port', default=6668, type=int, help="Port of the checkpoint upload server. Default is 6668.", dest="file_server_port")
+    parser.add_argument('--episode_statistics_window', default=100, type=int, help="Number of finished episodes kept per emulator worker for the logged reward statistics. Default is 100.", dest="episode_statistics_window")
+    parser.add_argument('--profile', default=False, type=bool_arg, help="If True, time the stages of the actor loop and export p50/p99 to TensorBoard and <debugging_folder>/profile.json", dest="profile")
+    parser.add_argument('--eval_episodes', default=0, type=int, help="If > 0, a background process evaluates every new checkpoint on this many episodes. Default is 0 (disabled).", dest="eval_episodes")
+    parser.add_argument('--eval_environments', default=8, type=int, help="The amount of emulators of the background evaluator. Default is 8.", dest="eval_environments")
+    parser.add_argument('--eval_workers', default=2, type=int, help="The amount of emulator workers of the background evaluator. Default is 2.", dest="eval_workers")
+    parser.add_argument('--eval_device', default='/cpu:0', type=str, help="Device used by the background evaluator. Default is /cpu:0.", dest="eval_device")
+    parser.add_argument('--eval_poll_interval', default=30, type=int, help="Seconds between checks for new checkpoints. Default is 30.", dest="eval_poll_interval")
+    parser.add_argument('--eval_max_episode_steps', default=27000, type=int, help="Evaluation episodes are cut off after this many steps (0: no limit). Default is 27000.", dest="eval_max_episode_steps")
+    parser.add_argument('--config', default=None, type=str, help="args.json to take the defaults from, e.g. written by autotune.py. Options given on the command line override it.", dest="config")
+    parser.add_argument('--async_stepping', default=False, type=bool_arg, help="If True, step every emulator as soon as its action is ready instead of all of them in lockstep, running inference on whichever emulators are ready (see async_runners.py). Needs the process runner backend.", dest="async_stepping")
+    parser.add_argument('--async_max_batch', default=0, type=int, help="Max. number of ready emulators per inference with --async_stepping. Default: half of emulator_counts.", dest="async_max_batch")
+    parser.add_argument('--async_timeout_ms', default=1.0, type=float, help="How long inference waits for more ready emulators after the first one, with --async_stepping. Default is 1 ms.", dest="async_timeout_ms")
+    parser.add_argument('--pin_cpus', default=False, type=bool_arg, help="If True, pin the actor, every emulator worker and the service processes to their own cores (see placement.py) and log the layout", dest="pin_cpus")
+    parser.add_argument('--actor_cpus', default=[], type=int, nargs='*', help="CPUs placed with --pin_cpus, e.g. a disjoint set per actor of a host. Default: all CPUs of the process.", dest="actor_cpus")
+    parser.add_argument('--service_cpus', default=1, type=int, help="Cores reserved with --pin_cpus for the sender, the checkpoint file server and the evaluator. Default is 1.", dest="service_cpus")
+    parser.add_argument('--intra_op_threads', default=0, type=int, help="Intra-op thread pool size of the TF session. Default: TF's choice, or the actor's cores with --pin_cpus.", dest="intra_op_threads")
+    parser.add_argument('--inter_op_threads', default=0, type=int, help="Inter-op thread pool size of the TF session. Default: TF's choice, or up to 2 with --pin_cpus.", dest="inter_op_threads")
+    parser.add_argument('--eval_cpus', default=[], type=int, nargs='*', help="CPUs the background evaluator is restricted to. Default: all, at the lowest priority.", dest="eval_cpus")
     # parser.add_argument('-cd', '--ckpt_dir', default='logs/upload/', type=str, help="Directory where the checkpoints from GPU-Learner are stored. Default = logs/upload/", dest="ckpt_dir")
     return parser
 
 
 if __name__ == '__main__':
-    args = get_arg_parser().parse_args()
+    parser = get_arg_parser()
+    args = parser.parse_args()
+    if args.config:
+        # The file's values replace the defaults; options given on the command line still win
+        import logger_utils
+        parser.set_defaults(**logger_utils.load_args(args.config))
+        args = parser.parse_args()
 
     import logger_utils
     logger_utils.save_args(args, args.debugging_folder)
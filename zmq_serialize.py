@@ -10,6 +10,12 @@
 """A Socket subclass that adds some serialization methods."""
 
 import zlib, zmq, pickle
+import numpy as np
+
+
+def dumps_zipped_pickle(obj, protocol=-1):
+    """pack and compress an object with pickle and zlib."""
+    return zlib.compress(pickle.dumps(obj, protocol))
 
 
 class SerializingSocket(zmq.Socket):
@@ -24,8 +30,7 @@ class SerializingSocket(zmq.Socket):
 
     def send_zipped_pickle(self, obj, flags=0, protocol=-1):
         """pack and compress an object with pickle and zlib."""
-        pobj = pickle.dumps(obj, protocol)
-        zobj = zlib.compress(pobj)
+        zobj = dumps_zipped_pickle(obj, protocol)
         # print('zipped pickle is %i bytes' % len(zobj))
         return self.send(zobj, flags=flags)
 
@@ -35,21 +40,21 @@ class SerializingSocket(zmq.Socket):
         pobj = zlib.decompress(zobj)
         return pickle.loads(pobj)
 
-        # def send_array(self, A, flags=0, copy=True, track=False):
-        #     """send a numpy array with metadata"""
-        #     md = dict(
-        #             dtype=str(A.dtype),
-        #             shape=A.shape,
-        #     )
-        #     self.send_json(md, flags | zmq.SNDMORE)
-        #     return self.send(A, flags, copy=copy, track=track)
-
-        # def recv_array(self, flags=0, copy=True, track=False):
-        #     """recv a numpy array"""
-        #     md = self.recv_json(flags=flags)
-        #     msg = self.recv(flags=flags, copy=copy, track=track)
-        #     A = np.frombuffer(msg, dtype=np.float32)
-        #     return A.reshape((32, 6))
+    def send_array(self, A, flags=0, copy=True, track=False):
+        """send a numpy array with metadata"""
+        md = dict(
+                dtype=str(A.dtype),
+                shape=A.shape,
+        )
+        self.send_json(md, flags | zmq.SNDMORE)
+        return self.send(np.ascontiguousarray(A), flags, copy=copy, track=track)
+
+    def recv_array(self, flags=0, copy=True, track=False):
+        """recv a numpy array"""
+        md = self.recv_json(flags=flags)
+        msg = self.recv(flags=flags, copy=copy, track=track)
+        A = np.frombuffer(msg, dtype=md['dtype'])
+        return A.reshape(md['shape'])
 
 
 class SerializingContext(zmq.Context):